@@ -0,0 +1,85 @@
+"""Compares the per-request overhead of tracing FastAPI requests using a pure ASGI middleware against the previous
+`@app.middleware("http")` implementation, which is based on Starlette's `BaseHTTPMiddleware`.
+
+Run with `python -m benchmarks.fastapi_tracing`, requires FastAPI to be installed. Requests are sent directly to the
+ASGI application, without a server, so the numbers only reflect the application and middleware.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.responses import Response
+
+from pyctuator.impl.fastapi_pyctuator import FastApiTracingMiddleware
+from pyctuator.impl.pyctuator_impl import PyctuatorImpl, AppInfo, AppDetails
+from pyctuator.pyctuator import default_logfile_format
+
+REQUESTS = 5_000
+
+
+def create_app(pyctuator_impl: PyctuatorImpl, pure_asgi: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api")
+    def api() -> Dict[str, str]:
+        return {"hello": "world"}
+
+    if pure_asgi:
+        app.add_middleware(FastApiTracingMiddleware, pyctuator_impl=pyctuator_impl)
+    else:
+        tracing_middleware = FastApiTracingMiddleware(app, pyctuator_impl)
+
+        @app.middleware("http")
+        async def intercept_requests_and_responses(
+                request: Request,
+                call_next: Callable[[Request], Awaitable[Response]]
+        ) -> Response:
+            request_time = datetime.now()
+            start_ns = time.perf_counter_ns()
+            response: Response = await call_next(request)
+            duration_us = (time.perf_counter_ns() - start_ns) // 1000
+            response_start = {"status": response.status_code, "headers": response.raw_headers}
+            # pylint: disable=protected-access
+            record = tracing_middleware._create_record(request.scope, response_start, request_time, duration_us)
+            pyctuator_impl.http_tracer.add_record(record=record)
+            return response
+
+    return app
+
+
+async def send_requests(app: FastAPI) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api", "raw_path": b"/api", "query_string": b"", "root_path": "", "server": ("localhost", 8000),
+        "client": ("127.0.0.1", 50000), "headers": [(b"host", b"localhost:8000"), (b"accept", b"application/json")],
+    }
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    messages: List[Dict[str, Any]] = []
+
+    async def send(message: Dict[str, Any]) -> None:
+        messages.append(message)
+
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await app(scope, receive, send)
+    elapsed = time.perf_counter() - start
+    assert messages[0]["status"] == 200
+    return elapsed
+
+
+def main() -> None:
+    pyctuator_impl = PyctuatorImpl(AppInfo(app=AppDetails(name="benchmark")), "http://localhost:8000/pyctuator", 0,
+                                   default_logfile_format)
+    for name, pure_asgi in [("BaseHTTPMiddleware", False), ("pure ASGI middleware", True)]:
+        elapsed = asyncio.run(send_requests(create_app(pyctuator_impl, pure_asgi)))
+        print(f"{name:<24} {elapsed / REQUESTS * 1_000_000:8.1f} us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Measures the memory used by the HTTP traces kept by `HttpTracer`, per 1,000 recorded requests.
+
+Run with `python -m benchmarks.httptrace_memory`. Records are created the way the ASGI middleware creates them, each
+with its own request and response headers, and the memory they retain is measured using tracemalloc.
+"""
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
+from pyctuator.httptrace.http_tracer import HttpTracer
+
+CAPACITY = 10_000
+
+
+def parse_headers(raw: bytes) -> List[Tuple[bytes, bytes]]:
+    # Servers create new names and values for every request, parse them the same way instead of sharing constants
+    return [tuple(line.split(b": ", 1)) for line in raw.split(b"\r\n")]  # type: ignore
+
+
+def request_headers(i: int) -> List[Tuple[bytes, bytes]]:
+    return parse_headers(
+        b"host: localhost:8000\r\n"
+        b"user-agent: python-requests/2.31.0\r\n"
+        b"accept: application/json\r\n"
+        b"accept-encoding: gzip, deflate\r\n"
+        b"x-request-id: " + f"{i:032x}".encode()
+    )
+
+
+def response_headers(i: int) -> List[Tuple[bytes, bytes]]:
+    return parse_headers(b"content-type: application/json\r\ncontent-length: " + str(i % 4096).encode())
+
+
+def record_requests(http_tracer: HttpTracer, count: int) -> None:
+    for i in range(count):
+        duration_us = 1500 + i % 1000
+        uri = f"http://localhost:8000/api/items/{i}"
+        http_tracer.add_record(TraceRecord(
+            datetime.now(),
+            None,
+            None,
+            TraceRequest("GET", uri, http_tracer.capture_headers(request_headers(i))),
+            TraceResponse(200, http_tracer.capture_headers(response_headers(i))),
+            duration_us // 1000,
+            duration_us,
+        ))
+
+
+def measure(header_allowlist: Optional[List[str]] = None) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    http_tracer = HttpTracer(header_allowlist, capacity=CAPACITY)
+    record_requests(http_tracer, CAPACITY)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(http_tracer.traces_list) == CAPACITY
+    return used / CAPACITY * 1000
+
+
+def main() -> None:
+    start = time.perf_counter()
+    print(f"{'all headers':<24} {measure() / 1024:8.1f} KiB per 1k records")
+    print(f"{'allowlisted headers':<24} {measure(['content-type', 'user-agent']) / 1024:8.1f} KiB per 1k records")
+    print(f"Measured {CAPACITY:,} records in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compares the cost of serializing the httptrace and threaddump payloads using the shared JSON serializer against the
+`dataclasses.asdict` based serialization previously used by the aiohttp and tornado adapters.
+
+Run with `python -m benchmarks.json_serialization`, FastAPI's `jsonable_encoder` is measured as well if installed.
+"""
+import dataclasses
+import importlib.util
+import json
+import timeit
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse, Traces
+from pyctuator.impl import json_serializer
+from pyctuator.threads.thread_dump_provider import ThreadDumpProvider
+
+ITERATIONS = 200
+
+
+def asdict_dumps(value: Any) -> bytes:
+    def default(obj: Any) -> Any:
+        if dataclasses.is_dataclass(obj):
+            return dataclasses.asdict(obj)
+        if isinstance(obj, datetime):
+            return str(obj)
+        return None
+
+    return json.dumps(value, default=default).encode("utf-8")
+
+
+def serializer_dumps(orjson: Any, value: Any) -> bytes:
+    json_serializer.orjson = orjson
+    return json_serializer.dumps(value)
+
+
+def create_traces(count: int) -> Traces:
+    return Traces([
+        TraceRecord(
+            datetime.now(),
+            None,
+            None,
+            TraceRequest("GET", f"http://localhost:8000/api/items/{i}", {
+                "host": ["localhost:8000"], "accept": ["application/json"], "user-agent": ["benchmark"],
+            }),
+            TraceResponse(200, {"content-type": ["application/json"], "content-length": ["1024"]}),
+            3,
+        )
+        for i in range(count)
+    ])
+
+
+def main() -> None:
+    serializers: Dict[str, Callable[[Any], bytes]] = {"dataclasses.asdict + json": asdict_dumps}
+
+    orjson = json_serializer.orjson
+    serializers["compiled encoders + json"] = partial(serializer_dumps, None)
+    if orjson:
+        serializers["compiled encoders + orjson"] = partial(serializer_dumps, orjson)
+
+    if importlib.util.find_spec("fastapi"):
+        from fastapi.encoders import jsonable_encoder  # pylint: disable=import-outside-toplevel
+        serializers["fastapi jsonable_encoder + json"] = lambda value: json.dumps(jsonable_encoder(value)).encode()
+
+    payloads = {"httptrace (100 records)": create_traces(100), "threaddump": ThreadDumpProvider().get_thread_dump()}
+    for payload_name, payload in payloads.items():
+        for serializer_name, serializer in serializers.items():
+            # pylint: disable=cell-var-from-loop
+            elapsed = timeit.timeit(lambda: serializer(payload), number=ITERATIONS)
+            print(f"{payload_name:<24} {serializer_name:<32} {elapsed / ITERATIONS * 1_000_000:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
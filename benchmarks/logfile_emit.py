@@ -0,0 +1,27 @@
+"""Measures the cost of appending a record to the logfile buffer for different buffer sizes.
+
+Run with `python -m benchmarks.logfile_emit`, the per-record cost should not grow with the buffer's size.
+"""
+import logging
+import timeit
+
+from pyctuator.logfile.logfile import PyctuatorLogfile  # type: ignore
+from pyctuator.pyctuator import default_logfile_format
+
+BUFFER_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+RECORDS = 20_000
+
+
+def main() -> None:
+    record = logging.LogRecord("benchmark", logging.INFO, __file__, 0, "Handled request %s in %d ms", ("/api", 3), None)
+    for lazy_formatting in [False, True]:
+        for buffer_size in BUFFER_SIZES:
+            logfile = PyctuatorLogfile(buffer_size, default_logfile_format, lazy_formatting=lazy_formatting)
+            handle = logfile.log_messages.handle
+            elapsed = timeit.timeit(lambda: handle(record), number=RECORDS)  # pylint: disable=cell-var-from-loop
+            print(f"{'lazy' if lazy_formatting else 'eager'} formatting, buffer size {buffer_size:>10} bytes: "
+                  f"{elapsed / RECORDS * 1_000_000:.2f} us per record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import importlib.util
+import time
+from typing import TYPE_CHECKING
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from pyctuator.health.db_health_provider import DbHealthStatus, DbHealthDetails
+from pyctuator.health.health_provider import AsyncHealthProvider, Status
+
+if TYPE_CHECKING:
+    # sqlalchemy.ext.asyncio is only available in SQLAlchemy 1.4 or later, without it the provider isn't supported
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class AsyncDbHealthProvider(AsyncHealthProvider):
+    """Checks the health of a database using an asyncio SQLAlchemy engine, supported with SQLAlchemy 1.4 or later."""
+
+    def __init__(self, engine: "AsyncEngine") -> None:
+        super().__init__()
+        self.engine = engine
+
+    def is_supported(self) -> bool:
+        return importlib.util.find_spec("sqlalchemy") is not None and \
+            importlib.util.find_spec("sqlalchemy.ext.asyncio") is not None
+
+    def get_name(self) -> str:
+        return "db"
+
+    async def get_health(self) -> DbHealthStatus:
+        name = self.engine.dialect.name
+        expected = int(time.time() * 1000)
+        try:
+            async with self.engine.connect() as connection:
+                actual = (await connection.execute(text(f"SELECT {expected}"))).scalar()
+            if expected == actual:
+                return DbHealthStatus(status=Status.UP, details=DbHealthDetails(name))
+
+            return DbHealthStatus(
+                status=Status.UNKNOWN,
+                details=DbHealthDetails(name, f"Selected {expected}, got {actual}"))
+
+        except OperationalError as e:
+            return DbHealthStatus(status=Status.DOWN, details=DbHealthDetails(name, str(e)))
@@ -0,0 +1,40 @@
+import importlib.util
+from typing import TYPE_CHECKING
+
+from pyctuator.health.health_provider import AsyncHealthProvider, Status
+from pyctuator.health.redis_health_provider import RedisHealthStatus, RedisHealthDetails
+
+if TYPE_CHECKING:
+    # redis.asyncio is only available in redis-py 4.2 or later, without it the provider isn't supported
+    from redis.asyncio import Redis
+
+
+class AsyncRedisHealthProvider(AsyncHealthProvider):
+    """Checks the health of Redis using an asyncio client, supported with redis-py 4.2 or later."""
+
+    def __init__(self, redis: "Redis") -> None:
+        super().__init__()
+        self.redis = redis
+
+    def is_supported(self) -> bool:
+        return importlib.util.find_spec("redis") is not None and importlib.util.find_spec("redis.asyncio") is not None
+
+    def get_name(self) -> str:
+        return "redis"
+
+    async def get_health(self) -> RedisHealthStatus:
+        try:
+            info = await self.redis.info()
+
+            return RedisHealthStatus(
+                status=Status.UP,
+                details=RedisHealthDetails(
+                    version=info["redis_version"],
+                    mode=info["redis_mode"],
+                ))
+        except Exception as e:  # pylint: disable=broad-except
+            return RedisHealthStatus(
+                status=Status.DOWN,
+                details=RedisHealthDetails(
+                    failure=str(e)
+                ))
@@ -0,0 +1,188 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from pyctuator.health.health_provider import AnyHealthProvider, AsyncHealthProvider, HealthStatus, HealthDetails, Status
+
+F = TypeVar("F", concurrent.futures.Future, asyncio.Future)
+
+
+@dataclass
+class HealthTimeoutDetails(HealthDetails):
+    timeoutSec: float
+    failure: str = "timeout"
+
+
+@dataclass
+class CachedHealthDetails(HealthDetails):
+    """The details of a cached health result, reported as the provider's details along with the result's age."""
+    details: HealthDetails
+    cacheAgeSec: float
+
+
+class HealthChecker:
+    """Runs the health checks of the providers concurrently, on a pool of at most `max_workers` background threads.
+
+    The health endpoint therefore waits for the slowest check rather than for all of them in turn, and for no longer
+    than the longest timeout: checks that don't complete within their provider's timeout, `timeout_sec` unless one was
+    set in `provider_timeouts`, are reported as DOWN. Such checks keep running in the background, and later requests
+    wait on them instead of starting new checks of the same provider, so hung checks can't exhaust the pool.
+
+    If a cache TTL is set, `cache_ttl_sec` or one in `provider_cache_ttls`, the provider's last result is reported
+    until it's older than the TTL, so frequent health requests don't each check the provider. An expired result is
+    still reported while the provider is checked again in the background, unless that check takes longer than the
+    provider's timeout.
+
+    `check_async` is used by asyncio web-frameworks: the checks of `AsyncHealthProvider`s are awaited on the running
+    event loop, while the other providers are still checked in the pool, so blocking checks don't stall the loop.
+    """
+
+    def __init__(self, timeout_sec: float = 5, cache_ttl_sec: Optional[float] = None, max_workers: int = 4) -> None:
+        self.timeout_sec = timeout_sec
+        self.cache_ttl_sec = cache_ttl_sec
+        self.max_workers = max_workers
+        self.provider_timeouts: Dict[str, float] = {}
+        self.provider_cache_ttls: Dict[str, float] = {}
+        # The running check of each provider along with the time it started, and its last result and when it completed,
+        # by the provider's name like its options, since a provider's id may be reused once it's garbage collected
+        self._running: Dict[str, Tuple[Future, float]] = {}
+        self._running_tasks: Dict[str, Tuple[asyncio.Future, float]] = {}
+        self._results: Dict[str, Tuple[HealthStatus, float]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.SimpleQueue[Tuple[Future, AnyHealthProvider]]" = queue.SimpleQueue()
+        # Worker threads are daemons, so that hung checks don't prevent the application from exiting
+        self._workers: List[threading.Thread] = []
+
+    def set_timeout(self, provider: AnyHealthProvider, timeout_sec: Optional[float]) -> None:
+        _set_option(self.provider_timeouts, provider, timeout_sec)
+
+    def set_cache_ttl(self, provider: AnyHealthProvider, cache_ttl_sec: Optional[float]) -> None:
+        _set_option(self.provider_cache_ttls, provider, cache_ttl_sec)
+
+    def check(self, providers: Iterable[AnyHealthProvider]) -> Dict[str, HealthStatus]:
+        """Returns the health of each of the supported providers, by their name."""
+        start = time.monotonic()
+        names, health_statuses, checks = self._start_checks(providers, start, self._start_check)
+        for name, future, timeout_sec in checks:
+            try:
+                health_statuses[name] = future.result(max(start + timeout_sec - time.monotonic(), 0))
+            except concurrent.futures.TimeoutError:
+                health_statuses[name] = HealthStatus(Status.DOWN, HealthTimeoutDetails(timeout_sec))
+        return {name: health_statuses[name] for name in names}
+
+    async def check_async(self, providers: Iterable[AnyHealthProvider]) -> Dict[str, HealthStatus]:
+        """Returns the health of each of the supported providers, by their name, without blocking the event loop."""
+        start = time.monotonic()
+        names, health_statuses, checks = self._start_checks(providers, start, self._start_async_check)
+
+        async def wait(name: str, future: asyncio.Future, timeout_sec: float) -> None:
+            try:
+                # Shielded, so that a check that timed out keeps running like checks run in the pool do
+                remaining_sec = max(start + timeout_sec - time.monotonic(), 0)
+                health_statuses[name] = await asyncio.wait_for(asyncio.shield(future), remaining_sec)
+            except asyncio.TimeoutError:
+                health_statuses[name] = HealthStatus(Status.DOWN, HealthTimeoutDetails(timeout_sec))
+
+        await asyncio.gather(*(wait(name, future, timeout_sec) for name, future, timeout_sec in checks))
+        return {name: health_statuses[name] for name in names}
+
+    def _start_checks(
+            self,
+            providers: Iterable[AnyHealthProvider],
+            start: float,
+            start_check: Callable[[AnyHealthProvider], Tuple[F, float]],
+    ) -> Tuple[List[str], Dict[str, HealthStatus], List[Tuple[str, F, float]]]:
+        """Returns the names of the supported providers, their cached results, and the checks to wait for."""
+        names: List[str] = []
+        checks: List[Tuple[str, F, float]] = []
+        health_statuses: Dict[str, HealthStatus] = {}
+        for provider in providers:
+            if not provider.is_supported():
+                continue
+            name = provider.get_name()
+            names.append(name)
+            timeout_sec = self.provider_timeouts.get(name, self.timeout_sec)
+            cache_ttl_sec = self.provider_cache_ttls.get(name, self.cache_ttl_sec)
+            result = None
+            if cache_ttl_sec is not None:
+                result = self._results.get(name)
+                if result is not None and start - result[1] < cache_ttl_sec:
+                    health_statuses[name] = _cached(result, start)
+                    continue
+
+            future, started = start_check(provider)
+            if result is not None and start - started < timeout_sec:
+                health_statuses[name] = _cached(result, start)  # Stale, while it is being refreshed
+            else:
+                checks.append((name, future, timeout_sec))
+        return names, health_statuses, checks
+
+    def _start_check(self, provider: AnyHealthProvider) -> Tuple[Future, float]:
+        name = provider.get_name()
+        with self._lock:
+            running = self._running.get(name)
+            if running is None or running[0].done():
+                running = self._running[name] = (Future(), time.monotonic())
+                self._queue.put((running[0], provider))
+                if len(self._workers) < self.max_workers:
+                    worker = threading.Thread(target=self._run_checks, name="pyctuator-health", daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+            return running
+
+    def _start_async_check(self, provider: AnyHealthProvider) -> Tuple[asyncio.Future, float]:
+        if not isinstance(provider, AsyncHealthProvider):
+            future, started = self._start_check(provider)
+            return asyncio.wrap_future(future), started
+
+        # Checks are only awaited on the loop that started them
+        name = provider.get_name()
+        running = self._running_tasks.get(name)
+        if running is None or running[0].done() or running[0].get_loop() is not asyncio.get_running_loop():
+            running = self._running_tasks[name] = (
+                asyncio.ensure_future(self._check_async(provider)), time.monotonic()
+            )
+        return running
+
+    async def _check_async(self, provider: AsyncHealthProvider) -> HealthStatus:
+        try:
+            health_status = await provider.get_health()
+        except BaseException:
+            self._results.pop(provider.get_name(), None)
+            raise
+        self._results[provider.get_name()] = (health_status, time.monotonic())
+        return health_status
+
+    def _run_checks(self) -> None:
+        while True:
+            future, provider = self._queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    if isinstance(provider, AsyncHealthProvider):
+                        health_status = asyncio.run(provider.get_health())
+                    else:
+                        health_status = provider.get_health()
+                except BaseException as e:  # pylint: disable=broad-except
+                    self._results.pop(provider.get_name(), None)
+                    future.set_exception(e)
+                else:
+                    # Cache the result before completing the check, so it's cached once the check is waited on
+                    self._results[provider.get_name()] = (health_status, time.monotonic())
+                    future.set_result(health_status)
+
+
+def _set_option(options: Dict[str, float], provider: AnyHealthProvider, value: Optional[float]) -> None:
+    if value is None:
+        options.pop(provider.get_name(), None)
+    else:
+        options[provider.get_name()] = value
+
+
+def _cached(result: Tuple[HealthStatus, float], now: float) -> HealthStatus:
+    health_status, completed = result
+    return HealthStatus(health_status.status, CachedHealthDetails(health_status.details, round(now - completed, 3)))
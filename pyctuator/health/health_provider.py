@@ -1,8 +1,8 @@
-from abc import ABC
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
 
-from typing import Mapping
+from typing import Mapping, Union
 
 
 class Status(str, Enum):
@@ -37,3 +37,27 @@ class HealthProvider(ABC):
 
     def get_health(self) -> HealthStatus:
         pass
+
+
+class AsyncHealthProvider(ABC):
+    """A health provider whose check is a coroutine, such as one using an asyncio database or Redis client.
+
+    With asyncio web-frameworks the check is awaited on the application's event loop, concurrently with the other
+    checks. Otherwise, it's run on a new event loop in a background thread, so the provider's client must not be
+    bound to the application's event loop.
+    """
+
+    @abstractmethod
+    def is_supported(self) -> bool:
+        pass
+
+    @abstractmethod
+    def get_name(self) -> str:
+        pass
+
+    @abstractmethod
+    async def get_health(self) -> HealthStatus:
+        pass
+
+
+AnyHealthProvider = Union[HealthProvider, AsyncHealthProvider]
@@ -1,14 +1,85 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from datetime import datetime
-from typing import List, Mapping, Optional
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Type, TypeVar, Union, cast
 
+HeaderPair = Tuple[Union[str, bytes], Union[str, bytes]]
 
+T = TypeVar("T")
+
+
+class TraceHeaders(Mapping[str, List[str]]):
+    """Headers of a traced request or response, packed into a single string of "name:value" lines.
+
+    Traces are kept for many requests but rarely read, so instead of a tuple and two strings per header, each record's
+    headers are kept as a single str or bytes, depending on how they were captured, and are grouped by name only when
+    they are read. Names and values captured as bytes, as in ASGI, are decoded as latin-1. Header names can't contain
+    a colon and values can't contain a new-line, so the packed headers are split back to the captured pairs.
+    """
+    __slots__ = ("_packed",)
+
+    def __init__(self, pairs: Sequence[HeaderPair]) -> None:
+        self._packed: Union[str, bytes] = ""
+        if pairs and isinstance(pairs[0][0], bytes):
+            self._packed = b"\n".join([name + b":" + value for name, value in pairs])  # type: ignore
+        elif pairs:
+            self._packed = "\n".join([_decode(name) + ":" + _decode(value) for name, value in pairs])
+
+    @classmethod
+    def from_packed(cls, packed: Union[str, bytes]) -> "TraceHeaders":
+        headers = cls(())
+        headers._packed = packed
+        return headers
+
+    @property
+    def packed(self) -> Union[str, bytes]:
+        return self._packed
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """Groups the headers by name, creating a new dictionary on each call so that it isn't kept with the trace."""
+        headers: Dict[str, List[str]] = {}
+        packed = self._packed
+        if packed:
+            lines = packed.decode("latin-1") if isinstance(packed, bytes) else packed
+            for line in lines.split("\n"):
+                name, value = line.split(":", 1)
+                headers.setdefault(name, []).append(value)
+        return headers
+
+    def __getitem__(self, name: str) -> List[str]:
+        return self.to_dict()[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.to_dict())
+
+    def __len__(self) -> int:
+        return len(self.to_dict())
+
+
+def _decode(value: Union[str, bytes]) -> str:
+    return value.decode("latin-1") if isinstance(value, bytes) else value
+
+
+def _slotted(cls: Type[T]) -> Type[T]:
+    """Recreates a dataclass with `__slots__` for its fields, like `@dataclass(slots=True)` which requires Python 3.10.
+
+    Trace records are kept for many requests, so they are slotted to avoid having a dictionary per instance.
+    """
+    field_names = tuple(f.name for f in fields(cast(Any, cls)))
+    excluded = field_names + ("__dict__", "__weakref__")
+    namespace = {key: value for key, value in cls.__dict__.items() if key not in excluded}
+    namespace["__slots__"] = field_names
+    metaclass: Any = type(cls)
+    return cast(Type[T], metaclass(cls.__name__, cls.__bases__, namespace))
+
+
+@_slotted
 @dataclass
 class TraceResponse:
     status: int
     headers: Mapping[str, List[str]]
 
 
+@_slotted
 @dataclass
 class TraceRequest:
     method: str
@@ -16,16 +87,19 @@ class TraceRequest:
     headers: Mapping[str, List[str]]
 
 
+@_slotted
 @dataclass
 class Session:
     id: str
 
 
+@_slotted
 @dataclass
 class Principal:
     name: str
 
 
+@_slotted
 @dataclass
 class TraceRecord:
     timestamp: datetime
@@ -33,7 +107,10 @@ class TraceRecord:
     session: Optional[Session]
     request: TraceRequest
     response: TraceResponse
-    timeTaken: int
+    timeTaken: int  # In milliseconds, as expected by Spring Boot Admin
+    timeTakenMicros: int = field(default=0, metadata={"serialize": False})
+    # Assigned by the tracer in the order the records are added, and used as the cursor of the httptrace endpoint
+    sequence: int = field(default=0, metadata={"serialize": False})
 
 
 @dataclass
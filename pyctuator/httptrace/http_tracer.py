@@ -1,14 +1,339 @@
 import collections
+import heapq
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Mapping, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
 
-from pyctuator.httptrace import Traces, TraceRecord
+from pyctuator.httptrace import Traces, TraceRecord, TraceHeaders, HeaderPair
+from pyctuator.httptrace.trace_record_queue import TraceRecordQueue
+from pyctuator.httptrace.trace_ring_file import TraceRingFile
+from pyctuator.httptrace.trace_sampler import TraceSampler
+
+
+# A record in the slowest traces heap, ordered by duration then by the order in which the records were added
+SlowestEntry = Tuple[int, int, float, TraceRecord]
+
+
+class TraceQueryError(ValueError):
+    """Raised when the parameters of an httptrace query are invalid."""
+
+
+@dataclass
+class TraceQuery:
+    """Criteria of the traces to return, all of which are optional.
+
+    `since` is a cursor returned by a previous query, in which case only the traces recorded after that query are
+    returned, so pollers can fetch new traces without downloading all of them again.
+    """
+    min_status: Optional[int] = None
+    max_status: Optional[int] = None
+    method: Optional[str] = None
+    path_prefix: Optional[str] = None
+    min_duration_ms: Optional[float] = None
+    since: Optional[int] = None
+
+    @classmethod
+    def from_params(cls, params: Mapping[str, str]) -> "TraceQuery":
+        """Parses the httptrace endpoint's query parameters, raising a TraceQueryError for invalid ones."""
+
+        def get_number(name: str, number_type: type) -> Optional[Any]:
+            value = params.get(name)
+            if not value:
+                return None
+            try:
+                number = number_type(value)
+            except ValueError as e:
+                raise TraceQueryError(f"Invalid {name} {value}") from e
+            if not math.isfinite(number):
+                raise TraceQueryError(f"Invalid {name} {value}")
+            return number
+
+        return cls(
+            get_number("minStatus", int),
+            get_number("maxStatus", int),
+            params.get("method") or None,
+            params.get("pathPrefix") or None,
+            get_number("minDuration", float),
+            get_number("since", int),
+        )
+
+    def matches(self, record: TraceRecord) -> bool:
+        status = record.response.status
+        if self.min_status is not None and status < self.min_status:
+            return False
+        if self.max_status is not None and status > self.max_status:
+            return False
+        if self.method is not None and record.request.method.upper() != self.method.upper():
+            return False
+        if self.min_duration_ms is not None and record.timeTakenMicros < self.min_duration_ms * 1000:
+            return False
+        if self.since is not None and record.sequence <= self.since:
+            return False
+        if self.path_prefix is not None and not urlsplit(record.request.uri).path.startswith(self.path_prefix):
+            return False
+        return True
 
 
 class HttpTracer:
-    def __init__(self) -> None:
-        self.traces_list: collections.deque = collections.deque(maxlen=100)
+    """Keeps the traces of recent requests, along with pools of the slowest requests and of failed requests.
+
+    The recent traces are quickly replaced by healthy traffic, so the slowest requests of the last
+    `slowest_window_sec` seconds and the most recent server errors are retained separately, and are available as the
+    "slowest" and "errors" views of the traces. Requests that would enter these pools are recorded even if the sampler
+    wouldn't have sampled them.
+
+    If a `trace_file` is given, recorded traces are also persisted to it, and the traces it holds are loaded as the
+    recent traces, so they survive restarts.
+
+    The recent traces are indexed by their status and by their method, so queries filtering by these only inspect the
+    traces having them, and traces preceding a query's `since` cursor are skipped without inspecting them.
+
+    When the application runs in several worker processes, `peer_records` returns the traces persisted by the other
+    workers, which are merged with this worker's traces when they are queried. Records are then numbered by the time
+    they were added, in microseconds, so that the records of all the workers are ordered by their sequence.
+
+    If a `queue_size` is given, the records of requests passed to `submit` are built by a background thread, see
+    `TraceRecordQueue`.
+    """
+
+    def __init__(
+            self,
+            header_allowlist: Optional[Iterable[str]] = None,
+            sampler: Optional[TraceSampler] = None,
+            capacity: int = 100,
+            slowest_capacity: int = 10,
+            slowest_window_sec: float = 3600,
+            errors_capacity: int = 100,
+            trace_file: Optional[TraceRingFile] = None,
+            peer_records: Optional[Callable[[], List[TraceRecord]]] = None,
+            queue_size: Optional[int] = None,
+    ) -> None:
+        self.traces_list: collections.deque = collections.deque(maxlen=capacity)
+        self.errors_list: collections.deque = collections.deque(maxlen=errors_capacity)
+        # The recent traces by their status and by their upper-case method, each ordered by the traces' sequence
+        self._status_index: Dict[int, Deque[TraceRecord]] = {}
+        self._method_index: Dict[str, Deque[TraceRecord]] = {}
+        self.sampler = sampler
+
+        # The sequence of the last record, records are numbered while holding the lock so they are added in order
+        self.sequence = 0
+        self._lock = threading.Lock()
+
+        # Min-heap of the slowest records, so the fastest of them is the one replaced by a slower record
+        self.slowest_capacity = slowest_capacity
+        self.slowest_window_sec = slowest_window_sec
+        self.slowest_heap: List[SlowestEntry] = []
+        self._slowest_expired_at = time.monotonic()
+
+        self.peer_records = peer_records
+        self.trace_file = trace_file
+        if trace_file is not None:
+            for record in trace_file.load():
+                self._append_recent(record)
+                if record.response.status >= 500:
+                    self.errors_list.append(record)
+                self.sequence = record.sequence
+
+        self.record_queue = TraceRecordQueue(self.add_record, queue_size) if queue_size else None
+
+        # Header names are compared in lower-case, as str or as bytes depending on how the headers were captured
+        self.header_allowlist: Optional[frozenset] = None
+        if header_allowlist is not None:
+            names = [name.lower() for name in header_allowlist]
+            self.header_allowlist = frozenset(names + [name.encode("latin-1") for name in names])
 
     def get_httptrace(self) -> Traces:
         return Traces(list(self.traces_list))
 
+    def iter_traces(self, view: Optional[str] = None) -> Iterator[TraceRecord]:
+        """Iterates over the recent traces, or over the traces of the "slowest" or "errors" views.
+
+        The slowest traces are ordered from the slowest, the others from the oldest.
+        """
+        return self.query_traces(view, TraceQuery())[1]
+
+    def query_traces(self, view: Optional[str], query: TraceQuery) -> Tuple[int, Iterator[TraceRecord]]:
+        """Returns a cursor for querying traces recorded later, and the traces of the given view matching the query.
+
+        Raises a TraceQueryError if the view is unknown.
+        """
+        # Iterate over a copy since the traces may be modified while they are streamed
+        with self._lock:
+            cursor = self.sequence
+            if view is None or view == "recent":
+                # The peers' traces are merged with all of this worker's traces, which are then filtered
+                records = self._recent_candidates(query) if self.peer_records is None else list(self.traces_list)
+            elif view == "errors":
+                records = list(self.errors_list)
+            elif view == "slowest":
+                self._expire_slowest(time.monotonic())
+                records = [entry[3] for entry in sorted(self.slowest_heap, reverse=True)]
+            else:
+                raise TraceQueryError(f"Unknown httptrace view {view}")
+
+        if self.peer_records is not None:
+            records = self._merge_peer_records(view, records)
+            cursor = max([cursor] + [record.sequence for record in records])
+
+        if query.since is not None and view != "slowest":
+            # These records are ordered by their sequence, so those preceding the cursor are skipped without inspecting
+            # them, leaving only the new records to be matched
+            records = records[_first_after(records, query.since):]
+        if query == TraceQuery():
+            return cursor, iter(records)
+        return cursor, (record for record in records if query.matches(record))
+
+    def should_record(self, status: int, duration_us: int) -> bool:
+        """Returns whether a request should be recorded, called before its headers are captured."""
+        if status >= 500 and self.errors_list.maxlen:
+            return True
+        if self._is_slowest(duration_us):
+            return True
+        return self.sampler is None or self.sampler.should_sample(status, duration_us)
+
+    def capture_headers(self, pairs: Iterable[HeaderPair]) -> Mapping[str, List[str]]:
+        """Captures the headers of a request or response, given as (name, value) pairs, for a trace record.
+
+        If an allowlist of headers is configured, only the allowed headers are kept.
+        """
+        allowlist = self.header_allowlist
+        if allowlist is not None:
+            return TraceHeaders([(name, value) for name, value in pairs if name.lower() in allowlist])
+        return TraceHeaders(pairs if isinstance(pairs, (list, tuple)) else list(pairs))
+
+    def submit(self, create_record: Callable[..., TraceRecord], *args: Any) -> None:
+        """Adds the record built by calling `create_record` with the given arguments, in the background if queued."""
+        if self.record_queue is not None:
+            self.record_queue.put(create_record, *args)
+        else:
+            self.add_record(create_record(*args))
+
+    def submit_soon(self, create_record: Callable[..., TraceRecord], *args: Any) -> None:
+        """Like `submit`, but if queued, the record is built by a callback of the running event loop."""
+        if self.record_queue is not None:
+            self.record_queue.put_soon(create_record, *args)
+        else:
+            self.add_record(create_record(*args))
+
     def add_record(self, record: TraceRecord) -> None:
+        with self._lock:
+            if self.peer_records is not None:
+                self.sequence = max(self.sequence + 1, time.time_ns() // 1000)
+            else:
+                self.sequence += 1
+            record.sequence = self.sequence
+            self._append_recent(record)
+            if record.response.status >= 500:
+                self.errors_list.append(record)
+            if self.slowest_capacity:
+                self._add_slowest(record)
+        if self.trace_file is not None:
+            self.trace_file.append(record)
+
+    def close(self) -> None:
+        if self.record_queue is not None:
+            self.record_queue.stop()
+        if self.trace_file is not None:
+            self.trace_file.close()
+
+    def _append_recent(self, record: TraceRecord) -> None:
+        # Called while holding the lock, or while initializing
+        if self.traces_list.maxlen == 0:
+            return
+        if len(self.traces_list) == self.traces_list.maxlen:
+            # The evicted trace is the oldest, so it's also the first of its status and of its method
+            evicted = self.traces_list[0]
+            _remove_first(self._status_index, evicted.response.status)
+            _remove_first(self._method_index, evicted.request.method.upper())
         self.traces_list.append(record)
+        self._status_index.setdefault(record.response.status, collections.deque()).append(record)
+        self._method_index.setdefault(record.request.method.upper(), collections.deque()).append(record)
+
+    def _recent_candidates(self, query: TraceQuery) -> List[TraceRecord]:
+        """Returns the recent traces that may match the query, using the fewest of the traces that the indexes allow.
+
+        Called while holding the lock. The traces are ordered by their sequence, and those preceding the query's `since`
+        cursor are skipped.
+        """
+        candidates: Sequence[TraceRecord] = self.traces_list
+        if query.method is not None:
+            candidates = self._method_index.get(query.method.upper(), ())
+        if query.min_status is not None or query.max_status is not None:
+            min_status = query.min_status if query.min_status is not None else 0
+            max_status = query.max_status if query.max_status is not None else math.inf
+            by_status = [
+                records for status, records in self._status_index.items() if min_status <= status <= max_status
+            ]
+            if sum(len(records) for records in by_status) < len(candidates):
+                candidates = list(heapq.merge(*by_status, key=attrgetter("sequence")))
+        start = _first_after(candidates, query.since) if query.since is not None else 0
+        return list(itertools.islice(candidates, start, None))
+
+    def _merge_peer_records(self, view: Optional[str], records: List[TraceRecord]) -> List[TraceRecord]:
+        peer_records = self.peer_records() if self.peer_records is not None else []
+        if view == "slowest":
+            oldest = datetime.now() - timedelta(seconds=self.slowest_window_sec)
+            records = records + [record for record in peer_records if record.timestamp >= oldest]
+            return sorted(records, key=attrgetter("timeTakenMicros"), reverse=True)[:self.slowest_capacity]
+
+        # Only the peers' recent traces are persisted, so their errors are those among their recent traces
+        capacity = self.traces_list.maxlen or 0
+        if view == "errors":
+            peer_records = [record for record in peer_records if record.response.status >= 500]
+            capacity = self.errors_list.maxlen or 0
+        records = sorted(records + peer_records, key=attrgetter("sequence"))
+        return records[max(len(records) - capacity, 0):]
+
+    def _is_slowest(self, duration_us: int) -> bool:
+        if not self.slowest_capacity:
+            return False
+        with self._lock:
+            heap = self.slowest_heap
+            if len(heap) < self.slowest_capacity:
+                return True
+            # Expire old records at most once a second, so requests slower than recent ones can replace them
+            now = time.monotonic()
+            if now - self._slowest_expired_at >= 1:
+                self._expire_slowest(now)
+            return len(heap) < self.slowest_capacity or duration_us > heap[0][0]
+
+    def _add_slowest(self, record: TraceRecord) -> None:
+        # Called while holding the lock
+        entry = (record.timeTakenMicros, record.sequence, time.monotonic(), record)
+        if len(self.slowest_heap) < self.slowest_capacity:
+            heapq.heappush(self.slowest_heap, entry)
+        elif entry[0] > self.slowest_heap[0][0]:
+            heapq.heapreplace(self.slowest_heap, entry)
+
+    def _expire_slowest(self, now: float) -> None:
+        # Called while holding the lock
+        self._slowest_expired_at = now
+        oldest = now - self.slowest_window_sec
+        if any(entry[2] < oldest for entry in self.slowest_heap):
+            self.slowest_heap[:] = [entry for entry in self.slowest_heap if entry[2] >= oldest]
+            heapq.heapify(self.slowest_heap)
+
+
+def _remove_first(index: Dict[Any, Deque[TraceRecord]], key: Any) -> None:
+    records = index[key]
+    records.popleft()
+    if not records:
+        del index[key]
+
+
+def _first_after(records: Sequence[TraceRecord], sequence: int) -> int:
+    """Returns the index of the first record following the given sequence, in records ordered by their sequence."""
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle].sequence <= sequence:
+            low = middle + 1
+        else:
+            high = middle
+    return low
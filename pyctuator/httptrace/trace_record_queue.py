@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+from pyctuator.httptrace import TraceRecord
+
+# A function building a trace record, along with the arguments it's called with
+PendingRecord = Tuple[Callable[..., TraceRecord], Tuple[Any, ...]]
+
+
+class TraceRecordQueue:
+    """Hands the requests to be traced to a bounded queue, from which a background thread builds their trace records.
+
+    Only the function building a record and its arguments, such as the request and a copy of the response's headers,
+    are queued while handling a request, so copying headers and formatting URLs doesn't delay responses. When the queue
+    is full the record is dropped and counted in `dropped_records` rather than blocking the request.
+
+    Requests handled by an event loop are passed to `put_soon` instead, which builds their records in a callback of the
+    loop once the request's handling yields, keeping the loop's objects on the loop's thread. The callbacks pending at
+    once are bounded by the same size.
+    """
+
+    def __init__(self, add_record: Callable[[TraceRecord], None], queue_size: int) -> None:
+        self.add_record = add_record
+        self.queue_size = queue_size
+        self.dropped_records: int = 0
+        self._queue: "queue.Queue[Optional[PendingRecord]]" = queue.Queue(queue_size)
+        self._pending_callbacks = 0
+        self._pending_callbacks_lock = threading.Lock()
+        self._builder = threading.Thread(target=self._build_records, name="pyctuator-trace-builder", daemon=True)
+        self._builder.start()
+
+    def put(self, create_record: Callable[..., TraceRecord], *args: Any) -> None:
+        try:
+            self._queue.put_nowait((create_record, args))
+        except queue.Full:
+            self.dropped_records += 1
+
+    def put_soon(self, create_record: Callable[..., TraceRecord], *args: Any) -> None:
+        """Builds the record in a callback of the running event loop, must be called from the loop."""
+        with self._pending_callbacks_lock:
+            if self._pending_callbacks >= self.queue_size:
+                self.dropped_records += 1
+                return
+            self._pending_callbacks += 1
+        asyncio.get_running_loop().call_soon(self._build_record_soon, create_record, args)
+
+    def stop(self) -> None:
+        """Builds the queued records and stops the background thread."""
+        # Wait for the background thread to make room in a full queue instead of failing to stop it
+        self._queue.put(None)
+        self._builder.join()
+
+    def _build_records(self) -> None:
+        while True:
+            pending = self._queue.get()
+            if pending is None:
+                return
+            self._build_record(*pending)
+
+    def _build_record_soon(self, create_record: Callable[..., TraceRecord], args: Tuple[Any, ...]) -> None:
+        with self._pending_callbacks_lock:
+            self._pending_callbacks -= 1
+        self._build_record(create_record, args)
+
+    def _build_record(self, create_record: Callable[..., TraceRecord], args: Tuple[Any, ...]) -> None:
+        try:
+            self.add_record(create_record(*args))
+        except Exception:  # pylint: disable=broad-except
+            logging.getLogger(__name__).exception("Failed building HTTP trace")
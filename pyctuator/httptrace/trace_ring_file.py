@@ -0,0 +1,180 @@
+"""Persists HTTP traces to a memory-mapped ring file, so the traces recorded before a restart or a crash are kept."""
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import zlib
+from datetime import datetime
+from typing import List, Mapping, Optional, Tuple
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse, TraceHeaders
+
+# The file starts with a header identifying its format and its layout, followed by `capacity` fixed-size slots
+FILE_HEADER = struct.Struct("<8sIII")
+MAGIC = b"PYCTRACE"
+VERSION = 1
+
+# Each slot starts with a CRC32 of the rest of the slot, the length of the payload, the sequence, timestamp, duration
+# and status of the trace, and the lengths of the method, URI and headers that make up the payload
+SLOT_HEADER = struct.Struct("<IIQdQHHIII")
+
+# Records are written by a background thread, requests are only delayed by queueing them. Records queued while the
+# writer is this far behind are not persisted
+MAX_PENDING_RECORDS = 10_000
+
+
+class TraceRingFile:
+    """Writes trace records to the fixed-size slots of a memory-mapped file, overwriting the oldest record when full.
+
+    Records are serialized and copied to the mapped memory by a background thread, so persisting traces doesn't add
+    system calls or locking to the handling of requests. Each slot is written in a single copy and is checksummed, so
+    slots that were partially written when the application crashed are ignored when the file is loaded. Headers that
+    don't fit in a slot aren't persisted.
+    """
+
+    def __init__(self, path: str, capacity: int, slot_size: int = 2048) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.dropped_records = 0
+        self._queue: "queue.SimpleQueue[Optional[TraceRecord]]" = queue.SimpleQueue()
+
+        size = FILE_HEADER.size + capacity * slot_size
+        header = FILE_HEADER.pack(MAGIC, VERSION, capacity, slot_size)
+        with open(path, "ab+") as file:
+            file.seek(0)
+            if file.read(FILE_HEADER.size) != header or os.path.getsize(path) != size:
+                # A new file, or one written with a different layout whose traces can't be read
+                file.truncate(0)
+                file.write(header)
+                file.truncate(size)
+        self._file = open(path, "r+b")  # pylint: disable=consider-using-with
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+
+        # Records are written to the slot following the one holding the latest record
+        records = _read_slots(self._mmap, capacity, slot_size)
+        self._next_slot = (max(records)[1] + 1) % capacity if records else 0
+
+        self._writer = threading.Thread(target=self._write_records, name="pyctuator-trace-writer", daemon=True)
+        self._writer.start()
+
+    def load(self) -> List[TraceRecord]:
+        """Reads the valid records from the file, ordered by their sequence."""
+        return [record for _, _, record in sorted(_read_slots(self._mmap, self.capacity, self.slot_size))]
+
+    def append(self, record: TraceRecord) -> None:
+        """Queues a record to be written by the background thread."""
+        if self._queue.qsize() >= MAX_PENDING_RECORDS:
+            self.dropped_records += 1
+            return
+        self._queue.put(record)
+
+    def close(self) -> None:
+        """Writes the queued records and closes the file."""
+        self._queue.put(None)
+        self._writer.join()
+        self._mmap.close()
+        self._file.close()
+
+    def _write_records(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                self._write_slot(record)
+            except Exception:  # pylint: disable=broad-except
+                logging.getLogger(__name__).exception("Failed persisting HTTP trace")
+
+    def _write_slot(self, record: TraceRecord) -> None:
+        method = record.request.method.encode("utf-8")
+        uri = record.request.uri.encode("utf-8", "surrogateescape")
+        request_headers = _packed_headers(record.request.headers)
+        response_headers = _packed_headers(record.response.headers)
+
+        max_payload = self.slot_size - SLOT_HEADER.size
+        if len(method) + len(uri) + len(request_headers) + len(response_headers) > max_payload:
+            request_headers = response_headers = b""
+            uri = uri[:max_payload - len(method)]
+
+        payload = method + uri + request_headers + response_headers
+        header = SLOT_HEADER.pack(
+            0, len(payload), record.sequence, record.timestamp.timestamp(), record.timeTakenMicros,
+            record.response.status, len(method), len(uri), len(request_headers), len(response_headers),
+        )
+        slot = header[4:] + payload
+        slot = struct.pack("<I", zlib.crc32(slot)) + slot
+
+        offset = FILE_HEADER.size + self._next_slot * self.slot_size
+        self._mmap[offset:offset + len(slot)] = slot
+        self._next_slot = (self._next_slot + 1) % self.capacity
+
+
+def read_trace_file(path: str) -> List[TraceRecord]:
+    """Reads the valid records of a trace file written by another process, ordered by their sequence.
+
+    Slots that are being written while they are read fail their checksum and are skipped.
+    """
+    with open(path, "rb") as file:
+        header = file.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return []
+        magic, version, capacity, slot_size = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or os.path.getsize(path) != FILE_HEADER.size + capacity * slot_size:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as memory:
+            return [record for _, _, record in sorted(_read_slots(memory, capacity, slot_size))]
+
+
+def _read_slots(memory: mmap.mmap, capacity: int, slot_size: int) -> List[Tuple[int, int, TraceRecord]]:
+    """Returns the sequence, slot and record of each valid slot."""
+    slots = []
+    for slot in range(capacity):
+        record = _read_slot(memory, FILE_HEADER.size + slot * slot_size, slot_size)
+        if record is not None:
+            slots.append((record.sequence, slot, record))
+    return slots
+
+
+def _read_slot(memory: mmap.mmap, offset: int, slot_size: int) -> Optional[TraceRecord]:
+    header = SLOT_HEADER.unpack_from(memory, offset)
+    crc, payload_length, sequence, timestamp, duration_us, status = header[:6]
+    method_length, uri_length, request_headers_length, response_headers_length = header[6:]
+    if sequence == 0 or payload_length > slot_size - SLOT_HEADER.size:
+        return None  # An empty slot
+    end = offset + SLOT_HEADER.size + payload_length
+    if zlib.crc32(memory[offset + 4:end]) != crc:
+        return None  # A slot that wasn't completely written
+
+    payload = memory[offset + SLOT_HEADER.size:end]
+    method = payload[:method_length].decode("utf-8")
+    position = method_length
+    uri = payload[position:position + uri_length].decode("utf-8", "surrogateescape")
+    position += uri_length
+    request_headers = payload[position:position + request_headers_length]
+    position += request_headers_length
+    response_headers = payload[position:position + response_headers_length]
+
+    return TraceRecord(
+        datetime.fromtimestamp(timestamp),
+        None,
+        None,
+        TraceRequest(method, uri, TraceHeaders.from_packed(request_headers.decode("utf-8", "surrogateescape"))),
+        TraceResponse(status, TraceHeaders.from_packed(response_headers.decode("utf-8", "surrogateescape"))),
+        duration_us // 1000,
+        duration_us,
+        sequence,
+    )
+
+
+def _packed_headers(headers: Mapping[str, List[str]]) -> bytes:
+    # Headers are persisted packed, as they are kept by TraceHeaders, always encoded as UTF-8
+    if isinstance(headers, TraceHeaders):
+        packed = headers.packed
+        if isinstance(packed, bytes):
+            packed = packed.decode("latin-1")
+    else:
+        packed = "\n".join(f"{name}:{value}" for name, values in headers.items() for value in values)
+    return packed.encode("utf-8", "surrogateescape")
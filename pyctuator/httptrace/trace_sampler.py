@@ -0,0 +1,64 @@
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class TraceSampler(ABC):
+    """Decides which requests are recorded in the HTTP traces.
+
+    Samplers are called for every request, given only its status and duration, before any of the request's headers
+    are captured or a trace record is created, so requests that are not sampled cost close to nothing.
+    """
+
+    @abstractmethod
+    def should_sample(self, status: int, duration_us: int) -> bool:
+        pass
+
+
+class RateSampler(TraceSampler):
+    """Records a fixed fraction of the requests, `rate` being between 0 (none) and 1 (all)."""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+
+    def should_sample(self, status: int, duration_us: int) -> bool:
+        return random.random() < self.rate
+
+
+class RateLimitingSampler(TraceSampler):
+    """Records up to `max_per_second` requests in each second, dropping the rest."""
+
+    def __init__(self, max_per_second: int) -> None:
+        self.max_per_second = max_per_second
+        self._lock = threading.Lock()
+        self._second = 0
+        self._sampled = 0
+
+    def should_sample(self, status: int, duration_us: int) -> bool:
+        second = int(time.monotonic())
+        with self._lock:
+            if second != self._second:
+                self._second = second
+                self._sampled = 0
+            if self._sampled >= self.max_per_second:
+                return False
+            self._sampled += 1
+            return True
+
+
+class ErrorsAndSlowRequestsSampler(TraceSampler):
+    """Always records server errors and requests slower than `slow_threshold_ms`.
+
+    Other requests are recorded according to the `delegate` sampler, or aren't recorded at all if there is none.
+    """
+
+    def __init__(self, slow_threshold_ms: float, delegate: Optional[TraceSampler] = None) -> None:
+        self.slow_threshold_us = int(slow_threshold_ms * 1000)
+        self.delegate = delegate
+
+    def should_sample(self, status: int, duration_us: int) -> bool:
+        if status >= 500 or duration_us >= self.slow_threshold_us:
+            return True
+        return self.delegate.should_sample(status, duration_us) if self.delegate else False
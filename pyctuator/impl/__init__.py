@@ -1 +1,4 @@
 SBA_V2_CONTENT_TYPE = "application/vnd.spring-boot.actuator.v2+json;charset=UTF-8"
+EVENT_STREAM_CONTENT_TYPE = "text/event-stream"
+# Response header of the httptrace endpoint, holding the cursor to pass as `since` to get only later traces
+TRACE_CURSOR_HEADER = "X-Pyctuator-Trace-Cursor"
@@ -1,18 +1,20 @@
-import dataclasses
-import json
-from collections import defaultdict
+import asyncio
+import time
 from datetime import datetime
-from functools import partial
 from http import HTTPStatus
-from typing import Any, Callable, List, Mapping
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Sequence, Tuple
 
 from aiohttp import web
-from multidict import CIMultiDictProxy
 
 from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
-from pyctuator.impl import SBA_V2_CONTENT_TYPE
+from pyctuator.httptrace.http_tracer import TraceQuery, TraceQueryError
+from pyctuator.impl import SBA_V2_CONTENT_TYPE, EVENT_STREAM_CONTENT_TYPE, TRACE_CURSOR_HEADER
+from pyctuator.impl.json_serializer import dumps, dumps_stream
 from pyctuator.impl.pyctuator_impl import PyctuatorImpl
 from pyctuator.impl.pyctuator_router import PyctuatorRouter
+from pyctuator.impl.response_compression import is_partial_response
+from pyctuator.logfile.logfile import LogfileSearchError, logfile_stream_poll_interval_sec  # type: ignore
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
 
 
 # pylint: disable=too-many-locals,unused-argument
@@ -20,30 +22,54 @@ class AioHttpPyctuator(PyctuatorRouter):
     def __init__(self, app: web.Application, pyctuator_impl: PyctuatorImpl) -> None:
         super().__init__(app, pyctuator_impl)
 
-        custom_dumps = partial(
-            json.dumps, default=self._custom_json_serializer
-        )
+        def json_response(value: Any) -> web.Response:
+            return web.Response(body=dumps(value), content_type="application/json")
+
+        async def json_stream_response(
+                request: web.Request,
+                name: str,
+                items: Iterable[Any],
+                headers: Optional[Dict[str, str]] = None,
+        ) -> web.StreamResponse:
+            # The response is prepared here, so its content type can't be set by the middleware
+            chunks: Iterable[bytes] = dumps_stream(name, items)
+            response = web.StreamResponse(headers={**(headers or {}), "Content-Type": SBA_V2_CONTENT_TYPE})
+            compressor = pyctuator_impl.response_compressor
+            accept_encoding = request.headers.get("Accept-Encoding")
+            compressed = compressor.compress_chunks(chunks, accept_encoding) if compressor else None
+            if compressed:
+                response.headers["Content-Encoding"] = compressed[0]
+                response.headers["Vary"] = "Accept-Encoding"
+                chunks = compressed[1]
+
+            await response.prepare(request)
+            try:
+                for chunk in chunks:
+                    await response.write(chunk)
+            except ConnectionResetError:
+                pass  # The client has disconnected
+            return response
 
         async def empty_handler(request: web.Request) -> web.Response:
             return web.Response(text='')
 
         async def get_endpoints(request: web.Request) -> web.Response:
-            return web.json_response(self.get_endpoints_data(), dumps=custom_dumps)
+            return json_response(self.get_endpoints_data())
 
         async def get_environment(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.get_environment(), dumps=custom_dumps)
+            return json_response(pyctuator_impl.get_environment())
 
         async def get_info(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.app_info, dumps=custom_dumps)
+            return json_response(pyctuator_impl.app_info)
 
         async def get_health(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.get_health(), dumps=custom_dumps)
+            return json_response(await pyctuator_impl.get_health_async())
 
         async def get_metric_names(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.get_metric_names(), dumps=custom_dumps)
+            return json_response(pyctuator_impl.get_metric_names())
 
         async def get_loggers(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.logging.get_loggers(), dumps=custom_dumps)
+            return json_response(pyctuator_impl.logging.get_loggers())
 
         async def set_logger_level(request: web.Request) -> web.Response:
             request_dict = await request.json()
@@ -55,54 +81,85 @@ class AioHttpPyctuator(PyctuatorRouter):
 
         async def get_logger(request: web.Request) -> web.Response:
             logger_name = request.match_info["logger_name"]
-            return web.json_response(pyctuator_impl.logging.get_logger(logger_name), dumps=custom_dumps)
+            return json_response(pyctuator_impl.logging.get_logger(logger_name))
 
-        async def get_thread_dump(request: web.Request) -> web.Response:
-            return web.json_response(pyctuator_impl.get_thread_dump(), dumps=custom_dumps)
+        async def get_thread_dump(request: web.Request) -> web.StreamResponse:
+            thread_infos = pyctuator_impl.thread_dump_provider.iter_thread_infos()
+            return await json_stream_response(request, "threads", thread_infos)
 
-        async def get_httptrace(request: web.Request) -> web.Response:
-            raw_data = pyctuator_impl.http_tracer.get_httptrace()
-            return web.json_response(raw_data, dumps=custom_dumps)
+        async def get_httptrace(request: web.Request) -> web.StreamResponse:
+            try:
+                query = TraceQuery.from_params(request.query)
+                cursor, traces = pyctuator_impl.http_tracer.query_traces(request.query.get("view"), query)
+            except TraceQueryError as e:
+                return web.Response(status=HTTPStatus.BAD_REQUEST.value, text=str(e))
+            return await json_stream_response(request, "traces", traces, {TRACE_CURSOR_HEADER: str(cursor)})
 
         async def get_metric_measurement(request: web.Request) -> web.Response:
-            return web.json_response(
-                pyctuator_impl.get_metric_measurement(request.match_info["metric_name"]),
-                dumps=custom_dumps)
-
-        async def get_logfile(request: web.Request) -> web.Response:
-            range_header = request.headers.get("range")
-            if not range_header:
-                return web.Response(
-                    body=f"{pyctuator_impl.logfile.log_messages.get_range()}"
-                )
-
-            str_res, start, end = pyctuator_impl.logfile.get_logfile(range_header)
-            response = web.Response(
-                status=HTTPStatus.PARTIAL_CONTENT.value,
-                body=str_res,
-                headers={
-                    "Content-Type": "text/html; charset=UTF-8",
-                    "Accept-Ranges": "bytes",
-                    "Content-Range": f"bytes {start}-{end}/{end}",
-                },
+            metric_name = request.match_info["metric_name"]
+            tags = request.query.getall("tag", [])
+            try:
+                return json_response(pyctuator_impl.get_metric_measurement(metric_name, tags))
+            except MetricNotFoundError:
+                return web.Response(status=HTTPStatus.NOT_FOUND.value)
+            except InvalidMetricTagError as e:
+                return web.Response(status=HTTPStatus.BAD_REQUEST.value, text=str(e))
+
+        async def get_logfile(request: web.Request) -> web.StreamResponse:
+            logfile_response = pyctuator_impl.logfile.get_logfile_response(request.headers.get("range"))
+            if logfile_response.file_path:
+                # aiohttp sends files using sendfile when possible
+                return web.FileResponse(logfile_response.file_path)
+            return web.Response(
+                status=logfile_response.status.value,
+                body=logfile_response.body,
+                headers=logfile_response.headers,
+            )
+
+        async def search_logfile(request: web.Request) -> web.Response:
+            try:
+                return json_response(pyctuator_impl.logfile.search_logfile(request.query))
+            except LogfileSearchError as e:
+                return web.Response(status=HTTPStatus.BAD_REQUEST.value, text=str(e))
+
+        async def get_logfile_stream(request: web.Request) -> web.StreamResponse:
+            response = web.StreamResponse(
+                headers={"Content-Type": EVENT_STREAM_CONTENT_TYPE, "Cache-Control": "no-cache"}
             )
+            await response.prepare(request)
+            try:
+                for event in pyctuator_impl.logfile.get_logfile_events(request.headers.get("Last-Event-ID")):
+                    if event:
+                        await response.write(event)
+                    else:
+                        await asyncio.sleep(logfile_stream_poll_interval_sec)
+            except ConnectionResetError:
+                pass  # The client has disconnected
             return response
 
         @web.middleware
         async def intercept_requests_and_responses(request: web.Request, handler: Callable) -> Any:
             request_time = datetime.now()
-            response = await handler(request)
-            response_time = datetime.now()
-
-            # Set the SBA-V2 content type for responses from Pyctuator
-            if request.url.path.startswith(self.pyctuator_impl.pyctuator_endpoint_path_prefix):
+            start_ns = time.perf_counter_ns()
+            try:
+                response = await handler(request)
+            except web.HTTPException as http_exception:
+                # Responses raised as exceptions, such as 404s, are sent by aiohttp as is
+                self._record_request(request, http_exception.status, http_exception.headers, request_time, start_ns)
+                raise
+            except Exception:
+                # aiohttp responds with a 500 to requests failing with any other exception
+                self._record_request(request, HTTPStatus.INTERNAL_SERVER_ERROR.value, {}, request_time, start_ns)
+                raise
+
+            # Set the SBA-V2 content type for responses from Pyctuator, unless they were already streamed to the client
+            if request.url.path.startswith(self.pyctuator_impl.pyctuator_endpoint_path_prefix) and \
+                    not response.prepared:
                 response.headers["Content-Type"] = SBA_V2_CONTENT_TYPE
+                self._compress_response(request, response)
 
             # Record the request and response
-            new_record = self._create_record(
-                request, response, request_time, response_time
-            )
-            self.pyctuator_impl.http_tracer.add_record(record=new_record)
+            self._record_request(request, response.status, response.headers, request_time, start_ns)
             return response
 
         app.add_routes(
@@ -129,32 +186,54 @@ class AioHttpPyctuator(PyctuatorRouter):
                 web.get("/pyctuator/dump", get_thread_dump),
                 web.get("/pyctuator/threaddump", get_thread_dump),
                 web.get("/pyctuator/logfile", get_logfile),
+                web.get("/pyctuator/logfile/search", search_logfile),
+                web.get("/pyctuator/logfile/stream", get_logfile_stream),
                 web.get("/pyctuator/trace", get_httptrace),
                 web.get("/pyctuator/httptrace", get_httptrace),
             ]
         )
         app.middlewares.append(intercept_requests_and_responses)
 
-    def _custom_json_serializer(self, value: Any) -> Any:
-        if dataclasses.is_dataclass(value):
-            return dataclasses.asdict(value)
+    def _record_request(
+            self,
+            request: web.Request,
+            status: int,
+            headers: Mapping[str, str],
+            request_time: datetime,
+            start_ns: int,
+    ) -> None:
+        duration_us = (time.perf_counter_ns() - start_ns) // 1000
+        # The route's resource is None if the request didn't match a route
+        resource = request.match_info.route.resource
+        self.pyctuator_impl.http_requests_metrics.record(
+            request.method, resource.canonical if resource else None, status, duration_us
+        )
+        if self.pyctuator_impl.http_tracer.should_record(status, duration_us):
+            # Copy the response's headers, since aiohttp adds headers such as Date when the response is sent
+            self.pyctuator_impl.http_tracer.submit_soon(
+                self._create_record, request, status, tuple(headers.items()), request_time, duration_us
+            )
 
-        if isinstance(value, datetime):
-            return str(value)
-        return None
+    def _compress_response(self, request: web.Request, response: web.StreamResponse) -> None:
+        compressor = self.pyctuator_impl.response_compressor
+        if not compressor or not isinstance(response, web.Response) or not isinstance(response.body, bytes) or \
+                "Content-Encoding" in response.headers or \
+                is_partial_response(response.status, response.headers.get("Content-Range")):
+            return
 
-    def _create_headers_dictionary(self, headers: CIMultiDictProxy[str]) -> Mapping[str, List[str]]:
-        headers_dict: Mapping[str, List[str]] = defaultdict(list)
-        for (key, value) in headers.items():
-            headers_dict[key].append(value)
-        return dict(headers_dict)
+        compressed = compressor.compress(response.body, request.headers.get("Accept-Encoding"))
+        if compressed:
+            response.headers["Content-Encoding"] = compressed[0]
+            response.headers.add("Vary", "Accept-Encoding")
+            response.body = compressed[1]
 
     def _create_record(
             self,
             request: web.Request,
-            response: web.Response,
+            status: int,
+            headers: Sequence[Tuple[str, str]],
             request_time: datetime,
-            response_time: datetime
+            duration_us: int,
     ) -> TraceRecord:
         new_record: TraceRecord = TraceRecord(
             request_time,
@@ -163,12 +242,13 @@ class AioHttpPyctuator(PyctuatorRouter):
             TraceRequest(
                 request.method,
                 str(request.url),
-                self._create_headers_dictionary(request.headers),
+                self.pyctuator_impl.http_tracer.capture_headers(request.headers.items()),
             ),
             TraceResponse(
-                response.status,
-                self._create_headers_dictionary(CIMultiDictProxy(response.headers))
+                status,
+                self.pyctuator_impl.http_tracer.capture_headers(headers),
             ),
-            int((response_time.timestamp() - request_time.timestamp()) * 1000),
+            duration_us // 1000,
+            duration_us,
         )
         return new_record
@@ -1,25 +1,26 @@
-from collections import defaultdict
+import asyncio
+import time
 from datetime import datetime
 from http import HTTPStatus
-from typing import Mapping, List, Callable
-from typing import Optional, Dict, Awaitable
+from typing import Any, Tuple
+from typing import Optional, Dict, AsyncIterator, Iterable, Sequence
 
 from fastapi import APIRouter, FastAPI, Header
 from pydantic import BaseModel
-from starlette.datastructures import Headers
+from starlette.datastructures import Headers, URL
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import Response, FileResponse, StreamingResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from pyctuator.environment.environment_provider import EnvironmentData
-from pyctuator.health.health_provider import HealthSummary
 from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
-from pyctuator.httptrace.http_tracer import Traces
-from pyctuator.impl import SBA_V2_CONTENT_TYPE
-from pyctuator.impl.pyctuator_impl import PyctuatorImpl, AppInfo
-from pyctuator.impl.pyctuator_router import PyctuatorRouter, EndpointsData
-from pyctuator.logging.pyctuator_logging import LoggersData, LoggerLevels
-from pyctuator.metrics.metrics_provider import Metric, MetricNames
-from pyctuator.threads.thread_dump_provider import ThreadDump
+from pyctuator.httptrace.http_tracer import TraceQuery, TraceQueryError
+from pyctuator.impl import SBA_V2_CONTENT_TYPE, EVENT_STREAM_CONTENT_TYPE, TRACE_CURSOR_HEADER
+from pyctuator.impl.json_serializer import dumps, dumps_stream
+from pyctuator.impl.pyctuator_impl import PyctuatorImpl
+from pyctuator.impl.pyctuator_router import PyctuatorRouter
+from pyctuator.impl.response_compression import ResponseCompressor, is_partial_response
+from pyctuator.logfile.logfile import LogfileSearchError, logfile_stream_poll_interval_sec  # type: ignore
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
 
 
 class FastApiLoggerItem(BaseModel):
@@ -39,9 +40,28 @@ class FastApiPyctuator(PyctuatorRouter):
         super().__init__(app, pyctuator_impl)
         router = APIRouter()
 
+        def json_response(value: Any) -> Response:
+            return Response(content=dumps(value), media_type="application/json")
+
+        def json_stream_response(
+                request: Request,
+                name: str,
+                items: Iterable[Any],
+                headers: Optional[Dict[str, str]] = None,
+        ) -> Response:
+            chunks: Iterable[bytes] = dumps_stream(name, items)
+            headers = dict(headers or {})
+            compressor = pyctuator_impl.response_compressor
+            accept_encoding = request.headers.get("Accept-Encoding")
+            compressed = compressor.compress_chunks(chunks, accept_encoding) if compressor else None
+            if compressed:
+                headers.update({"Content-Encoding": compressed[0], "Vary": "Accept-Encoding"})
+                chunks = compressed[1]
+            return StreamingResponse(chunks, media_type="application/json", headers=headers)
+
         @router.get("/", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_endpoints() -> EndpointsData:
-            return self.get_endpoints_data()
+        def get_endpoints() -> Response:
+            return json_response(self.get_endpoints_data())
 
         @router.options("/env", include_in_schema=include_in_openapi_schema)
         @router.options("/info", include_in_schema=include_in_openapi_schema)
@@ -63,29 +83,35 @@ class FastApiPyctuator(PyctuatorRouter):
             """
 
         @router.get("/env", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_environment() -> EnvironmentData:
-            return pyctuator_impl.get_environment()
+        def get_environment() -> Response:
+            return json_response(pyctuator_impl.get_environment())
 
         @router.get("/info", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_info() -> AppInfo:
-            return pyctuator_impl.app_info
+        def get_info() -> Response:
+            return json_response(pyctuator_impl.app_info)
 
         @router.get("/health", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_health() -> HealthSummary:
-            return pyctuator_impl.get_health()
+        async def get_health() -> Response:
+            return json_response(await pyctuator_impl.get_health_async())
 
         @router.get("/metrics", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_metric_names() -> MetricNames:
-            return pyctuator_impl.get_metric_names()
+        def get_metric_names() -> Response:
+            return json_response(pyctuator_impl.get_metric_names())
 
         @router.get("/metrics/{metric_name}", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_metric_measurement(metric_name: str) -> Metric:
-            return pyctuator_impl.get_metric_measurement(metric_name)
+        def get_metric_measurement(request: Request, metric_name: str) -> Response:
+            tags = request.query_params.getlist("tag")
+            try:
+                return json_response(pyctuator_impl.get_metric_measurement(metric_name, tags))
+            except MetricNotFoundError:
+                return Response(status_code=HTTPStatus.NOT_FOUND.value)
+            except InvalidMetricTagError as e:
+                return Response(status_code=HTTPStatus.BAD_REQUEST.value, content=str(e))
 
         # Retrieving All Loggers
         @router.get("/loggers", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_loggers() -> LoggersData:
-            return pyctuator_impl.logging.get_loggers()
+        def get_loggers() -> Response:
+            return json_response(pyctuator_impl.logging.get_loggers())
 
         @router.post("/loggers/{logger_name}", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
         def set_logger_level(item: FastApiLoggerItem, logger_name: str) -> Dict:
@@ -93,78 +119,189 @@ class FastApiPyctuator(PyctuatorRouter):
             return {}
 
         @router.get("/loggers/{logger_name}", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_logger(logger_name: str) -> LoggerLevels:
-            return pyctuator_impl.logging.get_logger(logger_name)
+        def get_logger(logger_name: str) -> Response:
+            return json_response(pyctuator_impl.logging.get_logger(logger_name))
 
         @router.get("/dump", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
         @router.get("/threaddump", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_thread_dump() -> ThreadDump:
-            return pyctuator_impl.get_thread_dump()
+        def get_thread_dump(request: Request) -> Response:
+            return json_stream_response(request, "threads", pyctuator_impl.thread_dump_provider.iter_thread_infos())
 
         @router.get("/logfile", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
         def get_logfile(range_header: str = Header(default=None,
                                                    alias="range")) -> Response:  # pylint: disable=redefined-builtin
-            if not range_header:
-                return Response(content=pyctuator_impl.logfile.log_messages.get_range())
+            logfile_response = pyctuator_impl.logfile.get_logfile_response(range_header)
+            if logfile_response.file_path:
+                return FileResponse(logfile_response.file_path, media_type="text/plain")
+            return Response(
+                status_code=logfile_response.status.value,
+                content=logfile_response.body,
+                headers=logfile_response.headers,
+            )
+
+        @router.get("/logfile/search", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
+        def search_logfile(request: Request) -> Response:
+            try:
+                return json_response(pyctuator_impl.logfile.search_logfile(request.query_params))
+            except LogfileSearchError as e:
+                return Response(status_code=HTTPStatus.BAD_REQUEST.value, content=str(e))
 
-            str_res, start, end = pyctuator_impl.logfile.get_logfile(range_header)
+        @router.get("/logfile/stream", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
+        def get_logfile_stream(last_event_id: str = Header(default=None, alias="last-event-id")) -> StreamingResponse:
+            events = pyctuator_impl.logfile.get_logfile_events(last_event_id)
 
-            my_res = Response(
-                status_code=HTTPStatus.PARTIAL_CONTENT.value,
-                content=str_res,
-                headers={
-                    "Content-Type": "text/html; charset=UTF-8",
-                    "Accept-Ranges": "bytes",
-                    "Content-Range": f"bytes {start}-{end}/{end}",
-                })
+            async def generate_events() -> AsyncIterator[bytes]:
+                for event in events:
+                    if event:
+                        yield event
+                    else:
+                        await asyncio.sleep(logfile_stream_poll_interval_sec)
 
-            return my_res
+            return StreamingResponse(
+                generate_events(),
+                media_type=EVENT_STREAM_CONTENT_TYPE,
+                headers={"Cache-Control": "no-cache"},
+            )
 
         @router.get("/trace", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
         @router.get("/httptrace", include_in_schema=include_in_openapi_schema, tags=["pyctuator"])
-        def get_httptrace() -> Traces:
-            return pyctuator_impl.http_tracer.get_httptrace()
+        def get_httptrace(request: Request) -> Response:
+            try:
+                query = TraceQuery.from_params(request.query_params)
+                cursor, traces = pyctuator_impl.http_tracer.query_traces(request.query_params.get("view"), query)
+            except TraceQueryError as e:
+                return Response(status_code=HTTPStatus.BAD_REQUEST.value, content=str(e))
+            return json_stream_response(request, "traces", traces, {TRACE_CURSOR_HEADER: str(cursor)})
 
-        @app.middleware("http")
-        async def intercept_requests_and_responses(
-                request: Request,
-                call_next: Callable[[Request], Awaitable[Response]]
-        ) -> Response:
-            request_time = datetime.now()
-            response: Response = await call_next(request)
-            response_time = datetime.now()
+        app.add_middleware(FastApiTracingMiddleware, pyctuator_impl=pyctuator_impl)
 
-            # Set the SBA-V2 content type for responses from Pyctuator
-            if request.url.path.startswith(self.pyctuator_impl.pyctuator_endpoint_path_prefix):
-                response.headers["Content-Type"] = SBA_V2_CONTENT_TYPE
+        app.include_router(router, prefix=pyctuator_impl.pyctuator_endpoint_path_prefix)
 
-            # Record the request and response
-            new_record = self._create_record(request, response, request_time, response_time)
-            self.pyctuator_impl.http_tracer.add_record(record=new_record)
 
-            return response
+class FastApiTracingMiddleware:
+    """Pure ASGI middleware recording every request and response in the HTTP traces.
 
-        app.include_router(router, prefix=pyctuator_impl.pyctuator_endpoint_path_prefix)
+    The request and response are captured from the ASGI scope and the messages passed to `send`, so responses are
+    forwarded as is instead of being re-wrapped, and streaming responses keep streaming.
+    Responses from Pyctuator get the SBA-V2 content type, and are compressed if they are sent in a single message.
+    """
+
+    def __init__(self, app: ASGIApp, pyctuator_impl: PyctuatorImpl) -> None:
+        self.app = app
+        self.pyctuator_impl = pyctuator_impl
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        is_pyctuator_request = scope["path"].startswith(self.pyctuator_impl.pyctuator_endpoint_path_prefix)
+        compressor = self.pyctuator_impl.response_compressor if is_pyctuator_request else None
+        request_time = datetime.now()
+        start_ns = time.perf_counter_ns()
+        response_start: Optional[Message] = None
+        holding_response_start = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_start, holding_response_start
+            if message["type"] == "http.response.start":
+                if is_pyctuator_request:
+                    message = self._with_sba_content_type(message)
+                response_start = message
+                if compressor:
+                    # Hold the response's start until the first body message shows whether the response is streamed
+                    holding_response_start = True
+                    return
+            elif holding_response_start and response_start is not None:
+                holding_response_start = False
+                if compressor and not message.get("more_body", False):
+                    response_start, message = self._compress(scope, response_start, message, compressor)
+                await send(response_start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            # The server responds with a 500 to requests failing before their response started
+            if response_start is None:
+                failure_response_start = {
+                    "type": "http.response.start", "status": HTTPStatus.INTERNAL_SERVER_ERROR.value, "headers": [],
+                }
+                self._record_request(scope, failure_response_start, request_time, start_ns)
+            raise
+
+        if response_start is not None:
+            self._record_request(scope, response_start, request_time, start_ns)
+
+    def _record_request(self, scope: Scope, response_start: Message, request_time: datetime, start_ns: int) -> None:
+        duration_us = (time.perf_counter_ns() - start_ns) // 1000
+        status = response_start["status"]
+        self.pyctuator_impl.http_requests_metrics.record(
+            scope["method"], self._route_template(scope), status, duration_us
+        )
+        if self.pyctuator_impl.http_tracer.should_record(status, duration_us):
+            self.pyctuator_impl.http_tracer.submit_soon(
+                self._create_record, scope, status, tuple(response_start["headers"]), request_time, duration_us
+            )
+
+    def _route_template(self, scope: Scope) -> Optional[str]:
+        # Starlette sets the route that matched the request in the scope, older versions only set the route's endpoint
+        route = scope.get("route")
+        if route is None and scope.get("endpoint") is not None:
+            routes = getattr(scope.get("app"), "routes", [])
+            route = next((route for route in routes if getattr(route, "endpoint", None) is scope["endpoint"]), None)
+        return getattr(route, "path_format", None) or getattr(route, "path", None)
+
+    def _with_sba_content_type(self, message: Message) -> Message:
+        # Set the SBA-V2 content type for responses from Pyctuator, except for the logfile's event stream.
+        # Header names are always lower-case in ASGI messages
+        headers = message["headers"]
+        if any(name == b"content-type" and value.startswith(EVENT_STREAM_CONTENT_TYPE.encode())
+               for name, value in headers):
+            return message
+        headers = [(name, value) for name, value in headers if name != b"content-type"]
+        headers.append((b"content-type", SBA_V2_CONTENT_TYPE.encode()))
+        return {**message, "headers": headers}
+
+    def _compress(
+            self,
+            scope: Scope,
+            response_start: Message,
+            response_body: Message,
+            compressor: ResponseCompressor,
+    ) -> Tuple[Message, Message]:
+        response_headers = Headers(raw=response_start["headers"])
+        if "content-encoding" in response_headers or \
+                is_partial_response(response_start["status"], response_headers.get("content-range")):
+            return response_start, response_body
+
+        compressed = compressor.compress(response_body.get("body", b""), Headers(scope=scope).get("accept-encoding"))
+        if not compressed:
+            return response_start, response_body
 
-    def _create_headers_dictionary(self, headers: Headers) -> Mapping[str, List[str]]:
-        headers_dict: Mapping[str, List[str]] = defaultdict(list)
-        for (key, value) in headers.items():
-            headers_dict[key].append(value)
-        return headers_dict
+        encoding, body = compressed
+        compressed_headers = [(name, value) for name, value in response_start["headers"] if name != b"content-length"]
+        compressed_headers.append((b"content-encoding", encoding.encode()))
+        compressed_headers.append((b"content-length", str(len(body)).encode()))
+        compressed_headers.append((b"vary", b"Accept-Encoding"))
+        return {**response_start, "headers": compressed_headers}, {**response_body, "body": body}
 
     def _create_record(
             self,
-            request: Request,
-            response: Response,
+            scope: Scope,
+            status: int,
+            headers: Sequence[Tuple[bytes, bytes]],
             request_time: datetime,
-            response_time: datetime,
+            duration_us: int,
     ) -> TraceRecord:
+        http_tracer = self.pyctuator_impl.http_tracer
         new_record: TraceRecord = TraceRecord(
             request_time,
             None,
             None,
-            TraceRequest(request.method, str(request.url), self._create_headers_dictionary(request.headers)),
-            TraceResponse(response.status_code, self._create_headers_dictionary(response.headers)),
-            int((response_time.timestamp() - request_time.timestamp()) * 1000),
+            TraceRequest(scope["method"], str(URL(scope=scope)), http_tracer.capture_headers(scope["headers"])),
+            TraceResponse(status, http_tracer.capture_headers(headers)),
+            duration_us // 1000,
+            duration_us,
         )
         return new_record
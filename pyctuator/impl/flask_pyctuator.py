@@ -1,45 +1,30 @@
 import json
-from collections import defaultdict
-from datetime import datetime, date
+import threading
+import time
+from datetime import datetime
 from http import HTTPStatus
-from typing import Dict, Tuple, Any, Mapping, List
+from typing import Callable, Dict, Any, Iterable, List, Iterator, Optional, Sequence, Tuple
 
-from flask import Flask, Blueprint, request, jsonify, after_this_request
-from flask import Response, make_response
-from flask.json import JSONEncoder
-from werkzeug.datastructures import Headers
+from flask import Flask, Blueprint, request, after_this_request
+from flask import Request, Response, make_response, send_file
+from werkzeug.datastructures import EnvironHeaders
+from werkzeug.wsgi import get_current_url
 
 from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
-from pyctuator.impl import SBA_V2_CONTENT_TYPE
+from pyctuator.httptrace.http_tracer import TraceQuery, TraceQueryError
+from pyctuator.impl import SBA_V2_CONTENT_TYPE, EVENT_STREAM_CONTENT_TYPE, TRACE_CURSOR_HEADER
+from pyctuator.impl.json_serializer import dumps, dumps_stream
 from pyctuator.impl.pyctuator_impl import PyctuatorImpl
 from pyctuator.impl.pyctuator_router import PyctuatorRouter
+from pyctuator.impl.response_compression import is_partial_response
+from pyctuator.logfile.logfile import LogfileSearchError, logfile_stream_poll_interval_sec  # type: ignore
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
 
+WSGIEnvironment = Dict[str, Any]
+StartResponse = Callable[..., Any]
+WSGIApplication = Callable[[WSGIEnvironment, StartResponse], Iterable[bytes]]
 
 
-class CustomJSONEncoder(JSONEncoder):
-    """ Override Flask's JSON encoding of datetime to assure ISO format is used.
-
-    By default, when Flask is rendering a response to JSON, it is formatting datetime, date and time according to
-    RFC-822 which is different from the ISO format used by SBA.
-
-    This encoder overrides the default datetime encoding and is only used by the Pyctuator blueprint so it shouldn't
-    interfere with whatever encoding users are using.
-
-    See https://stackoverflow.com/questions/43663552/keep-a-datetime-date-in-yyyy-mm-dd-format-when-using-flasks-jsonify
-    """
-
-    # pylint: disable=method-hidden
-    def default(self, o: Any) -> Any:
-        try:
-            if isinstance(o, (datetime, date)):
-                return o.isoformat()
-            iterable = iter(o)
-        except TypeError:
-            pass
-        else:
-            return list(iterable)
-        return JSONEncoder.default(self, o)
-
 
 class FlaskPyctuator(PyctuatorRouter):
 
@@ -49,15 +34,32 @@ class FlaskPyctuator(PyctuatorRouter):
             app: Flask,
             pyctuator_impl: PyctuatorImpl,
             flask_auth_decorator,
+            wsgi_tracing: bool = False,
     ) -> None:
         super().__init__(app, pyctuator_impl )
         
         path_prefix: str = pyctuator_impl.pyctuator_endpoint_path_prefix
         flask_blueprint: Blueprint = Blueprint("flask_blueprint", "pyctuator", )
-        flask_blueprint.json_encoder = CustomJSONEncoder
-        pyctuator_endpoints = ["/", "/env", "/info", "/health", "/metrics", "/loggers", "/threaddump", "/dump", "/logfile", "/mappings" ]
+        pyctuator_endpoints = [
+            "/", "/env", "/info", "/health", "/metrics", "/loggers", "/threaddump", "/dump", "/logfile",
+            "/logfile/search", "/mappings",
+        ]
         pyctuator_routes = [ path_prefix  +  endpoint for endpoint in pyctuator_endpoints ]
 
+        def json_response(value: Any) -> Response:
+            return Response(dumps(value), mimetype="application/json")
+
+        def json_stream_response(name: str, items: Iterable[Any], headers: Optional[Dict[str, str]] = None) -> Response:
+            chunks: Iterable[bytes] = dumps_stream(name, items)
+            headers = dict(headers or {})
+            compressor = pyctuator_impl.response_compressor
+            accept_encoding = request.headers.get("Accept-Encoding")
+            compressed = compressor.compress_chunks(chunks, accept_encoding) if compressor else None
+            if compressed:
+                headers.update({"Content-Encoding": compressed[0], "Vary": "Accept-Encoding"})
+                chunks = compressed[1]
+            return Response(chunks, mimetype="application/json", headers=headers)
+
         def conditionally(dec):
             def resdec(f):
                 if not dec:
@@ -65,59 +67,94 @@ class FlaskPyctuator(PyctuatorRouter):
                 return dec(f)
             return resdec
 
-        @app.before_request
-        def intercept_requests_and_responses() -> None:
-            request_time = datetime.now()
-            @after_this_request
-            def after_response(response: Response) -> Response:
-                if request.path in pyctuator_routes:
-                    response_time = datetime.now()
-                    response.headers["Content-Type"] = SBA_V2_CONTENT_TYPE # Set the SBA-V2 content type for responses from Pyctuator
+        if wsgi_tracing:
+            app.wsgi_app = FlaskTracingMiddleware(app.wsgi_app, self, pyctuator_routes)  # type: ignore
+        else:
+            @app.before_request
+            def intercept_requests_and_responses() -> None:
+                request_time = datetime.now()
+                start_ns = time.perf_counter_ns()
+                @after_this_request
+                def after_response(response: Response) -> Response:
+                    duration_us = (time.perf_counter_ns() - start_ns) // 1000
+                    pyctuator_impl.http_requests_metrics.record(
+                        request.method, _route_template(request), response.status_code, duration_us
+                    )
+                    if request.path in pyctuator_routes:
+                        # Set the SBA-V2 content type for responses from Pyctuator
+                        response.headers["Content-Type"] = SBA_V2_CONTENT_TYPE
 
-                # Record the request and response
-                    self.record_request_and_response(response, request_time, response_time)
-                return response
+                        # Record the request and response
+                        # Copy the response's headers, since they're modified by later after-request functions
+                        if self.pyctuator_impl.http_tracer.should_record(response.status_code, duration_us):
+                            self.pyctuator_impl.http_tracer.submit(
+                                self.create_record,
+                                request._get_current_object(),  # type: ignore  # pylint: disable=protected-access
+                                response.status_code,
+                                tuple(response.headers.items()),
+                                request_time,
+                                duration_us,
+                            )
+                    return response
 
         
+        @flask_blueprint.after_request
+        def compress_response(response: Response) -> Response:
+            compressor = pyctuator_impl.response_compressor
+            if compressor and not response.direct_passthrough and not response.is_streamed and \
+                    "Content-Encoding" not in response.headers and \
+                    not is_partial_response(response.status_code, response.headers.get("Content-Range")):
+                compressed = compressor.compress(response.get_data(), request.headers.get("Accept-Encoding"))
+                if compressed:
+                    response.headers["Content-Encoding"] = compressed[0]
+                    response.headers.add("Vary", "Accept-Encoding")
+                    response.set_data(compressed[1])
+            return response
+
         @flask_blueprint.route("/")
         @conditionally(flask_auth_decorator)
         def get_endpoints() -> Any:
-            return jsonify(self.get_endpoints_data())
+            return json_response(self.get_endpoints_data())
         
         @flask_blueprint.route("/env")
         @conditionally(flask_auth_decorator)
         def get_environment() -> Any:
-            return jsonify(pyctuator_impl.get_environment())
+            return json_response(pyctuator_impl.get_environment())
 
       
         @flask_blueprint.route("/info")
         @conditionally(flask_auth_decorator)
         def get_info() -> Any:
-            return jsonify(pyctuator_impl.app_info)
+            return json_response(pyctuator_impl.app_info)
 
         
         @flask_blueprint.route("/health")
         @conditionally(flask_auth_decorator)
         def get_health() -> Any:
-            return jsonify(pyctuator_impl.get_health())
+            return json_response(pyctuator_impl.get_health())
         
         @flask_blueprint.route("/metrics")
         @conditionally(flask_auth_decorator)
         def get_metric_names() -> Any:
-            return jsonify(pyctuator_impl.get_metric_names())
+            return json_response(pyctuator_impl.get_metric_names())
 
         
         @flask_blueprint.route("/metrics/<metric_name>")
         @conditionally(flask_auth_decorator)
         def get_metric_measurement(metric_name: str) -> Any:
-            return jsonify(pyctuator_impl.get_metric_measurement(metric_name))
+            try:
+                return json_response(pyctuator_impl.get_metric_measurement(metric_name, request.args.getlist("tag")))
+            except MetricNotFoundError:
+                return make_response("", HTTPStatus.NOT_FOUND.value)
+            except InvalidMetricTagError as e:
+                return make_response(str(e), HTTPStatus.BAD_REQUEST.value)
 
         # Retrieving All Loggers
         
         @flask_blueprint.route("/loggers")
         @conditionally(flask_auth_decorator)
         def get_loggers() -> Any:
-            return jsonify(pyctuator_impl.logging.get_loggers())
+            return json_response(pyctuator_impl.logging.get_loggers())
 
         @flask_blueprint.route("/loggers/<logger_name>", methods=['POST'])
         @conditionally(flask_auth_decorator)
@@ -130,65 +167,207 @@ class FlaskPyctuator(PyctuatorRouter):
         @flask_blueprint.route("/loggers/<logger_name>")
         @conditionally(flask_auth_decorator)
         def get_logger(logger_name: str) -> Any:
-            return jsonify(pyctuator_impl.logging.get_logger(logger_name))
+            return json_response(pyctuator_impl.logging.get_logger(logger_name))
 
        
         @flask_blueprint.route("/threaddump")
         @flask_blueprint.route("/dump")
         @conditionally(flask_auth_decorator)
         def get_thread_dump() -> Any:
-            return jsonify(pyctuator_impl.get_thread_dump())
+            return json_stream_response("threads", pyctuator_impl.thread_dump_provider.iter_thread_infos())
         
         @flask_blueprint.route("/logfile")
         @conditionally(flask_auth_decorator)
-        def get_logfile() -> Tuple[Response, int]:
-            range_header: str = request.headers.environ.get('HTTP_RANGE')
-            if not range_header:
-                response: Response = make_response(pyctuator_impl.logfile.log_messages.get_range())
-                return response, HTTPStatus.OK
+        def get_logfile() -> Response:
+            logfile_response = pyctuator_impl.logfile.get_logfile_response(request.headers.get("Range"))
+            if logfile_response.file_path:
+                # Servers supporting wsgi.file_wrapper send the file using sendfile
+                return send_file(logfile_response.file_path, mimetype="text/plain")
+            return make_response(logfile_response.body, logfile_response.status, logfile_response.headers)
 
-            str_res, start, end = pyctuator_impl.logfile.get_logfile(range_header)
+        @flask_blueprint.route("/logfile/search")
+        @conditionally(flask_auth_decorator)
+        def search_logfile() -> Any:
+            try:
+                return json_response(pyctuator_impl.logfile.search_logfile(request.args))
+            except LogfileSearchError as e:
+                return make_response(str(e), HTTPStatus.BAD_REQUEST.value)
+
+        @flask_blueprint.route("/logfile/stream")
+        @conditionally(flask_auth_decorator)
+        def get_logfile_stream() -> Response:
+            events = pyctuator_impl.logfile.get_logfile_events(request.headers.get("Last-Event-ID"))
 
-            resp: Response = make_response(str_res)
-            resp.headers["Content-Type"] = "text/html; charset=UTF-8"
-            resp.headers["Accept-Ranges"] = "bytes"
-            resp.headers["Content-Range"] = f"bytes {start}-{end}/{end}"
+            def generate_events() -> Iterator[bytes]:
+                for event in events:
+                    if event:
+                        yield event
+                    else:
+                        time.sleep(logfile_stream_poll_interval_sec)
 
-            return resp, HTTPStatus.PARTIAL_CONTENT
+            return Response(
+                generate_events(),
+                mimetype=EVENT_STREAM_CONTENT_TYPE,
+                headers={"Cache-Control": "no-cache"},
+            )
 
         
         @flask_blueprint.route("/trace")
         @flask_blueprint.route("/httptrace")
         @conditionally(flask_auth_decorator)
         def get_httptrace() -> Any:
-            return jsonify(pyctuator_impl.http_tracer.get_httptrace())
+            try:
+                query = TraceQuery.from_params(request.args)
+                cursor, traces = pyctuator_impl.http_tracer.query_traces(request.args.get("view"), query)
+            except TraceQueryError as e:
+                return make_response(str(e), HTTPStatus.BAD_REQUEST.value)
+            return json_stream_response("traces", traces, {TRACE_CURSOR_HEADER: str(cursor)})
 
         
         @flask_blueprint.route("/mappings")
         @conditionally(flask_auth_decorator)
         def get_mappings() -> Any:
-            return jsonify(pyctuator_impl.get_mappings())
+            return json_response(pyctuator_impl.get_mappings())
 
         app.register_blueprint(flask_blueprint, url_prefix=path_prefix)
 
-    def _create_headers_dictionary_flask(self, headers: Headers) -> Mapping[str, List[str]]:
-        headers_dict: Mapping[str, List[str]] = defaultdict(list)
-        for (key, value) in headers.items():
-            headers_dict[key].append(value)
-        return dict(headers_dict)
+    def create_record(
+            self,
+            flask_request: Request,
+            status: int,
+            response_headers: Sequence[Tuple[str, str]],
+            request_time: datetime,
+            duration_us: int,
+    ) -> TraceRecord:
+        http_tracer = self.pyctuator_impl.http_tracer
+        return TraceRecord(
+            request_time,
+            None,
+            None,
+            TraceRequest(
+                flask_request.method,
+                str(flask_request.url),
+                http_tracer.capture_headers(flask_request.headers.items()),
+            ),
+            TraceResponse(status, http_tracer.capture_headers(response_headers)),
+            duration_us // 1000,
+            duration_us,
+        )
 
-    def record_request_and_response(
+    def create_wsgi_record(
             self,
-            response: Response,
+            environ: WSGIEnvironment,
+            status: int,
+            response_headers: Sequence[Tuple[str, str]],
             request_time: datetime,
-            response_time: datetime,
-    ) -> None:
-        new_record = TraceRecord(
+            duration_us: int,
+    ) -> TraceRecord:
+        http_tracer = self.pyctuator_impl.http_tracer
+        return TraceRecord(
             request_time,
             None,
             None,
-            TraceRequest(request.method, str(request.url), self._create_headers_dictionary_flask(request.headers)),
-            TraceResponse(response.status_code, self._create_headers_dictionary_flask(response.headers)),
-            int((response_time.timestamp() - request_time.timestamp()) * 1000),
+            TraceRequest(
+                environ["REQUEST_METHOD"],
+                get_current_url(environ),
+                http_tracer.capture_headers(EnvironHeaders(environ).items()),
+            ),
+            TraceResponse(status, http_tracer.capture_headers(response_headers)),
+            duration_us // 1000,
+            duration_us,
         )
-        self.pyctuator_impl.http_tracer.add_record(record=new_record)
+
+
+def _route_template(flask_request: Request) -> Optional[str]:
+    return flask_request.url_rule.rule if flask_request.url_rule else None
+
+
+class _RequestTrace:
+    """Per-thread state of the request being handled, allocated once and reused for all the requests of a thread."""
+    __slots__ = (
+        "middleware", "environ", "start_response_delegate", "request_time", "start_ns", "recorded", "start_response",
+    )
+
+    def __init__(self, middleware: "FlaskTracingMiddleware") -> None:
+        self.middleware = middleware
+        self.environ: WSGIEnvironment = {}
+        self.start_response_delegate: Optional[StartResponse] = None
+        self.request_time = datetime.now()
+        self.start_ns = 0
+        self.recorded = False
+        # Bind the method once, rather than creating a new bound method for every request
+        self.start_response: StartResponse = self._start_response
+
+    def begin(self, environ: WSGIEnvironment, start_response: StartResponse) -> None:
+        self.environ = environ
+        self.start_response_delegate = start_response
+        self.request_time = datetime.now()
+        self.start_ns = time.perf_counter_ns()
+        self.recorded = False
+
+    def record(self, status: str, response_headers: List[Tuple[str, str]]) -> None:
+        if not self.recorded:
+            self.recorded = True
+            duration_us = (time.perf_counter_ns() - self.start_ns) // 1000
+            status_code = int(status.split(" ", 1)[0])
+            pyctuator_impl = self.middleware.flask_pyctuator.pyctuator_impl
+            # The request created by Flask, if it got to create one, is kept in the environment by Werkzeug
+            flask_request = self.environ.get("werkzeug.request")
+            pyctuator_impl.http_requests_metrics.record(
+                self.environ["REQUEST_METHOD"],
+                _route_template(flask_request) if flask_request is not None else None,
+                status_code,
+                duration_us,
+            )
+            if pyctuator_impl.http_tracer.should_record(status_code, duration_us):
+                pyctuator_impl.http_tracer.submit(
+                    self.middleware.flask_pyctuator.create_wsgi_record,
+                    self.environ,
+                    status_code,
+                    # The server may add headers such as Date to the list it's given
+                    tuple(response_headers),
+                    self.request_time,
+                    duration_us,
+                )
+
+    def _start_response(self, status: str, response_headers: List[Tuple[str, str]], *exc_info: Any) -> Any:
+        if self.environ.get("PATH_INFO") in self.middleware.pyctuator_routes:
+            response_headers = self.middleware.with_sba_content_type(response_headers)
+        self.record(status, response_headers)
+        assert self.start_response_delegate is not None
+        return self.start_response_delegate(status, response_headers, *exc_info)
+
+
+class FlaskTracingMiddleware:
+    """WSGI middleware recording every request handled by a Flask application in the HTTP traces.
+
+    The response's status and headers are captured from `start_response`, so requests are recorded even if they fail
+    before reaching a view, such as 404s, and requests that fail with an unhandled exception are recorded with a 500.
+    """
+
+    def __init__(self, wsgi_app: WSGIApplication, flask_pyctuator: FlaskPyctuator, pyctuator_routes: List[str]) -> None:
+        self.wsgi_app = wsgi_app
+        self.flask_pyctuator = flask_pyctuator
+        self.pyctuator_routes = frozenset(pyctuator_routes)
+        self._thread_local = threading.local()
+
+    def __call__(self, environ: WSGIEnvironment, start_response: StartResponse) -> Iterable[bytes]:
+        request_trace = getattr(self._thread_local, "request_trace", None)
+        if request_trace is None:
+            request_trace = self._thread_local.request_trace = _RequestTrace(self)
+
+        request_trace.begin(environ, start_response)
+        try:
+            return self.wsgi_app(environ, request_trace.start_response)
+        except Exception:
+            request_trace.record("500 INTERNAL SERVER ERROR", [])
+            raise
+
+    def with_sba_content_type(self, response_headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        # Set the SBA-V2 content type for responses from Pyctuator, except for the logfile's event stream
+        if any(name.lower() == "content-type" and value.startswith(EVENT_STREAM_CONTENT_TYPE)
+               for name, value in response_headers):
+            return response_headers
+        headers = [(name, value) for name, value in response_headers if name.lower() != "content-type"]
+        headers.append(("Content-Type", SBA_V2_CONTENT_TYPE))
+        return headers
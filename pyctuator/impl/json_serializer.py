@@ -0,0 +1,140 @@
+"""Serializes Pyctuator's dataclasses to JSON encoded bytes, using the same encoding for all web frameworks.
+
+Each dataclass is encoded by a function generated once per class, which builds the class's dictionary directly from
+its fields rather than deep-copying it like `dataclasses.asdict` does. When orjson is installed, it is used to encode
+the resulting dictionaries, lists and primitives straight to bytes.
+"""
+import dataclasses
+import importlib
+import importlib.util
+import json
+from datetime import date, datetime
+from enum import Enum
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, get_type_hints
+
+from pyctuator.environment.environment_provider import EnvironmentData
+from pyctuator.health.health_checker import CachedHealthDetails
+from pyctuator.health.health_provider import HealthSummary, HealthStatus
+from pyctuator.httptrace import Traces, TraceRecord, TraceRequest, TraceResponse, TraceHeaders
+from pyctuator.impl.pyctuator_impl import AppInfo
+from pyctuator.impl.pyctuator_router import EndpointsData
+from pyctuator.logfile.logfile import LogSearchResult, LogRecordMatch  # type: ignore
+from pyctuator.logging.pyctuator_logging import LoggersData, LoggerLevels
+from pyctuator.metrics.metrics_provider import Metric, MetricNames, Measurement, MetricTag
+from pyctuator.threads.thread_dump_provider import ThreadDump, ThreadInfo, StackFrame
+
+# orjson is optional and must only be imported if it is installed
+orjson: Optional[ModuleType] = importlib.import_module("orjson") if importlib.util.find_spec("orjson") else None
+
+# Fields annotated with these types are copied as is, without inspecting their values - the JSON encoder handles them
+# directly, falling back to to_primitive for any unexpected value
+_primitive_types = {
+    str, int, float, bool, Optional[str], Optional[int], Optional[float], Optional[bool],
+    List[str], Mapping[str, str], Mapping[str, List[str]], Dict[str, str], Dict[str, List[str]],
+}
+
+_encoders: Dict[type, Callable[[Any], Dict[str, Any]]] = {}
+
+stream_chunk_size = 16 * 1024
+
+
+def to_primitive(value: Any) -> Any:
+    """Converts a value to a structure of dictionaries, lists and primitives that can be encoded to JSON."""
+    encoder = _encoders.get(type(value))
+    if encoder:
+        return encoder(value)
+
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+
+    if isinstance(value, Enum):
+        return value.value
+
+    if isinstance(value, str):
+        return value
+
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return compile_encoder(type(value))(value)
+
+    if isinstance(value, Mapping):
+        return {str(key): to_primitive(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [to_primitive(item) for item in value]
+
+    return None
+
+
+def compile_encoder(cls: type) -> Callable[[Any], Dict[str, Any]]:
+    """Generates and registers a function converting instances of the given dataclass to a dictionary."""
+    encoder = _encoders.get(cls)
+    if encoder:
+        return encoder
+
+    try:
+        type_hints = get_type_hints(cls)
+    except (NameError, TypeError):
+        type_hints = {}  # Unresolvable annotations, all the fields are converted using to_primitive
+
+    items = []
+    for field in dataclasses.fields(cls):
+        if not field.metadata.get("serialize", True):
+            continue  # Internal fields, such as durations kept in a higher resolution than reported
+        if type_hints.get(field.name) in _primitive_types:
+            items.append(f"{field.name!r}: obj.{field.name}")
+        else:
+            items.append(f"{field.name!r}: to_primitive(obj.{field.name})")
+
+    namespace: Dict[str, Any] = {"to_primitive": to_primitive}
+    exec(f"def encode(obj):\n    return {{{', '.join(items)}}}\n", namespace)  # pylint: disable=exec-used
+    _encoders[cls] = namespace["encode"]
+    return _encoders[cls]
+
+
+def dumps(value: Any) -> bytes:
+    """Encodes a value, usually one of Pyctuator's dataclasses, to UTF-8 encoded JSON."""
+    if orjson:
+        # orjson's native encoding of dataclasses skips fields starting with an underscore, such as `_links`
+        return orjson.dumps(  # type: ignore
+            value,
+            default=to_primitive,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS,
+        )
+    return json.dumps(to_primitive(value), default=to_primitive, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_stream(name: str, items: Iterable[Any]) -> Iterator[bytes]:
+    """Encodes an object holding a single list, such as `{"traces": [...]}`, encoding one item of the list at a time.
+
+    Encoded items are yielded in chunks of about `stream_chunk_size` bytes, so the memory used for encoding is bounded
+    regardless of the number of items.
+    """
+    chunk = bytearray(b"{" + dumps(name) + b":[")
+    separator = b""
+    for item in items:
+        chunk += separator
+        chunk += dumps(item)
+        separator = b","
+        if len(chunk) >= stream_chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b"]}"
+    yield bytes(chunk)
+
+
+for model in [
+        EndpointsData, EnvironmentData, AppInfo, HealthSummary, HealthStatus, MetricNames, Metric, Measurement,
+        MetricTag, LoggersData, LoggerLevels, ThreadDump, ThreadInfo, StackFrame, Traces, TraceRecord, TraceRequest,
+        TraceResponse, LogSearchResult, LogRecordMatch,
+]:
+    compile_encoder(model)
+
+# Trace headers are grouped by name only when they are serialized
+_encoders[TraceHeaders] = TraceHeaders.to_dict
+
+# The details of cached health results are the provider's details, along with the age of the result
+_encoders[CachedHealthDetails] = lambda cached: {**to_primitive(cached.details), "cacheAgeSec": cached.cacheAgeSec}
@@ -0,0 +1,123 @@
+"""Shares the HTTP traces and request metrics of the worker processes of an application, such as gunicorn's workers.
+
+Each worker only writes its own files in a shared directory - its traces to a memory-mapped ring file, and a snapshot
+of its request metrics to a JSON file that is atomically replaced every second - so workers never wait for each other
+while handling requests. The worker answering a request reads the other workers' files and aggregates them with its
+own traces and metrics.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pyctuator.httptrace import TraceRecord
+from pyctuator.httptrace.trace_ring_file import read_trace_file
+
+TRACE_FILE_PREFIX = "httptrace-"
+TRACE_FILE_SUFFIX = ".ring"
+METRICS_FILE_PREFIX = "metrics-"
+METRICS_FILE_SUFFIX = ".json"
+
+# Files of workers that are no longer running are removed once they weren't modified for this long, until then their
+# traces and cumulative metrics are still reported
+DEAD_WORKER_FILES_RETENTION_SEC = 24 * 60 * 60
+
+
+class MultiprocessDirectory:
+    def __init__(self, path: str, publish_interval_sec: float = 1) -> None:
+        self.path = path
+        self.pid = os.getpid()
+        self.publish_interval_sec = publish_interval_sec
+        self._stop_event = threading.Event()
+        self._publisher: Optional[threading.Thread] = None
+
+        os.makedirs(path, exist_ok=True)
+        self._remove_dead_worker_files()
+
+    @property
+    def trace_file_path(self) -> str:
+        return os.path.join(self.path, f"{TRACE_FILE_PREFIX}{self.pid}{TRACE_FILE_SUFFIX}")
+
+    @property
+    def metrics_file_path(self) -> str:
+        return os.path.join(self.path, f"{METRICS_FILE_PREFIX}{self.pid}{METRICS_FILE_SUFFIX}")
+
+    def peer_trace_records(self) -> List[TraceRecord]:
+        """Reads the traces persisted by the other workers."""
+        records: List[TraceRecord] = []
+        for path in self._peer_files(TRACE_FILE_PREFIX, TRACE_FILE_SUFFIX):
+            try:
+                records.extend(read_trace_file(path))
+            except OSError:
+                pass  # The file was removed while reading it
+        return records
+
+    def peer_metrics(self) -> List[Dict[str, Any]]:
+        """Reads the request metrics last published by the other workers."""
+        snapshots = []
+        for path in self._peer_files(METRICS_FILE_PREFIX, METRICS_FILE_SUFFIX):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                pass  # The file was removed while reading it
+        return snapshots
+
+    def publish_metrics(self, snapshot: Dict[str, Any]) -> None:
+        # Write to a temporary file which replaces the previous snapshot, so readers never see a partial snapshot
+        temporary_path = self.metrics_file_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file, separators=(",", ":"))
+        os.replace(temporary_path, self.metrics_file_path)
+
+    def start_publishing(self, get_snapshot: Callable[[], Dict[str, Any]]) -> None:
+        """Publishes the worker's metrics every `publish_interval_sec` seconds, until `stop` is called."""
+
+        def publish() -> None:
+            while not self._stop_event.wait(self.publish_interval_sec):
+                try:
+                    self.publish_metrics(get_snapshot())
+                except Exception:  # pylint: disable=broad-except
+                    logging.getLogger(__name__).exception("Failed publishing metrics to %s", self.path)
+
+        self._publisher = threading.Thread(target=publish, name="pyctuator-metrics-publisher", daemon=True)
+        self._publisher.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._publisher:
+            self._publisher.join()
+
+    def _peer_files(self, prefix: str, suffix: str) -> List[str]:
+        return [
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.startswith(prefix) and name.endswith(suffix) and name != f"{prefix}{self.pid}{suffix}"
+        ]
+
+    def _remove_dead_worker_files(self) -> None:
+        if os.name != "posix":
+            return  # Checking whether a process is running is only possible on POSIX, os.kill terminates it on Windows
+
+        now = time.time()
+        for name in os.listdir(self.path):
+            for prefix, suffix in [(TRACE_FILE_PREFIX, TRACE_FILE_SUFFIX), (METRICS_FILE_PREFIX, METRICS_FILE_SUFFIX)]:
+                if name.startswith(prefix) and name.endswith(suffix) and name[len(prefix):-len(suffix)].isdigit():
+                    path = os.path.join(self.path, name)
+                    pid = int(name[len(prefix):-len(suffix)])
+                    try:
+                        if not _is_running(pid) and now - os.path.getmtime(path) > DEAD_WORKER_FILES_RETENTION_SEC:
+                            os.remove(path)
+                    except OSError:
+                        pass  # Removed by another worker
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running, as another user
+    return True
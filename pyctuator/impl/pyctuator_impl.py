@@ -1,16 +1,24 @@
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Dict
 from typing import List
 from typing import Mapping
 from typing import Optional
 from urllib.parse import urlparse
 
 from pyctuator.environment.environment_provider import EnvironmentData, EnvironmentProvider
-from pyctuator.health.health_provider import HealthStatus, HealthSummary, Status, HealthProvider
+from pyctuator.health.health_checker import HealthChecker
+from pyctuator.health.health_provider import HealthStatus, HealthSummary, Status, AnyHealthProvider
 from pyctuator.httptrace.http_tracer import HttpTracer
+from pyctuator.httptrace.trace_ring_file import TraceRingFile
+from pyctuator.httptrace.trace_sampler import TraceSampler
+from pyctuator.impl.multiprocess import MultiprocessDirectory
+from pyctuator.impl.response_compression import ResponseCompressor
 from pyctuator.logfile.logfile import PyctuatorLogfile  # type: ignore
 from pyctuator.logging.pyctuator_logging import PyctuatorLogging
+from pyctuator.metrics.http_requests_metrics_impl import HttpRequestsMetricsProvider
 from pyctuator.metrics.metrics_provider import Metric, MetricNames, MetricsProvider
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
 from pyctuator.threads.thread_dump_provider import ThreadDump, ThreadDumpProvider
 from pyctuator.mappings.mapping_provider import MappingsProvider, MappingProvider
 
@@ -56,18 +64,61 @@ class PyctuatorImpl:
             pyctuator_endpoint_url: str,
             logfile_max_size: int,
             logfile_formatter: str,
+            logfile_queue_size: Optional[int] = None,
+            logfile_lazy_formatting: bool = False,
+            logfile_path: Optional[str] = None,
+            httptrace_header_allowlist: Optional[List[str]] = None,
+            httptrace_sampler: Optional[TraceSampler] = None,
+            httptrace_capacity: int = 100,
+            httptrace_slowest_capacity: int = 10,
+            httptrace_slowest_window_sec: float = 3600,
+            httptrace_errors_capacity: int = 100,
+            httptrace_file: Optional[str] = None,
+            multiprocess_dir: Optional[str] = None,
+            httptrace_queue_size: Optional[int] = None,
+            health_timeout_sec: float = 5,
+            health_cache_ttl_sec: Optional[float] = None,
     ):
         self.app_info = app_info
         self.pyctuator_endpoint_url = pyctuator_endpoint_url
 
         self.metrics_providers: List[MetricsProvider] = []
-        self.health_providers: List[HealthProvider] = []
+        self.health_providers: List[AnyHealthProvider] = []
+        self.health_checker = HealthChecker(health_timeout_sec, health_cache_ttl_sec)
         self.environment_providers: List[EnvironmentProvider] = []
         self.logging = PyctuatorLogging()
         self.thread_dump_provider = ThreadDumpProvider()
-        self.logfile = PyctuatorLogfile(max_size=logfile_max_size, formatter=logfile_formatter)
-        self.http_tracer = HttpTracer()
+        self.logfile = PyctuatorLogfile(
+            max_size=logfile_max_size,
+            formatter=logfile_formatter,
+            queue_size=logfile_queue_size,
+            lazy_formatting=logfile_lazy_formatting,
+            path=logfile_path,
+        )
+        # In multiprocess mode, each worker persists its traces to its own file in the shared directory
+        self.multiprocess_directory: Optional[MultiprocessDirectory] = None
+        if multiprocess_dir:
+            self.multiprocess_directory = MultiprocessDirectory(multiprocess_dir)
+            httptrace_file = self.multiprocess_directory.trace_file_path
+
+        self.http_tracer = HttpTracer(
+            httptrace_header_allowlist,
+            httptrace_sampler,
+            httptrace_capacity,
+            httptrace_slowest_capacity,
+            httptrace_slowest_window_sec,
+            httptrace_errors_capacity,
+            TraceRingFile(httptrace_file, httptrace_capacity) if httptrace_file else None,
+            self.multiprocess_directory.peer_trace_records if self.multiprocess_directory else None,
+            httptrace_queue_size,
+        )
         self.mappings_provider = MappingsProvider()
+        self.response_compressor: Optional[ResponseCompressor] = None
+        self.http_requests_metrics = HttpRequestsMetricsProvider(
+            peer_snapshots=self.multiprocess_directory.peer_metrics if self.multiprocess_directory else None,
+        )
+        if self.multiprocess_directory:
+            self.multiprocess_directory.start_publishing(self.http_requests_metrics.export)
 
         # Determine the endpoint's URL path prefix and make sure it doesn't end with a "/"
         self.pyctuator_endpoint_path_prefix = urlparse(pyctuator_endpoint_url).path
@@ -77,8 +128,15 @@ class PyctuatorImpl:
     def register_metrics_provider(self, provider: MetricsProvider) -> None:
         self.metrics_providers.append(provider)
 
-    def register_health_providers(self, provider: HealthProvider) -> None:
+    def register_health_providers(
+            self,
+            provider: AnyHealthProvider,
+            timeout_sec: Optional[float] = None,
+            cache_ttl_sec: Optional[float] = None,
+    ) -> None:
         self.health_providers.append(provider)
+        self.health_checker.set_timeout(provider, timeout_sec)
+        self.health_checker.set_cache_ttl(provider, cache_ttl_sec)
 
     def register_environment_provider(self, provider: EnvironmentProvider) -> None:
         self.environment_providers.append(provider)
@@ -98,28 +156,11 @@ class PyctuatorImpl:
         self.app_info.build = build_info
 
     def get_health(self) -> HealthSummary:
-        health_statuses: Mapping[str, HealthStatus] = {
-            provider.get_name(): provider.get_health()
-            for provider in self.health_providers
-            if provider.is_supported()
-        }
-
-        # Health is UP if no provider is registered
-        if not health_statuses:
-            return HealthSummary(Status.UP, health_statuses)
-
-        # If there's at least one provider and any of the providers is DOWN, the service is DOWN
-        service_is_down = any(health_status.status == Status.DOWN for health_status in health_statuses.values())
-        if service_is_down:
-            return HealthSummary(Status.DOWN, health_statuses)
-
-        # IF there's at least one provider and none of the providers is DOWN and at least one is UP, the service is UP
-        service_is_up = any(health_status.status == Status.UP for health_status in health_statuses.values())
-        if service_is_up:
-            return HealthSummary(Status.UP, health_statuses)
+        return _health_summary(self.health_checker.check(self.health_providers))
 
-        # else, all providers are unknown so the service is UNKNOWN
-        return HealthSummary(Status.UNKNOWN, health_statuses)
+    async def get_health_async(self) -> HealthSummary:
+        """Returns the health of the application without blocking the running event loop."""
+        return _health_summary(await self.health_checker.check_async(self.health_providers))
 
     def get_metric_names(self) -> MetricNames:
         metric_names = []
@@ -128,11 +169,17 @@ class PyctuatorImpl:
                 metric_names.append(metric_name)
         return MetricNames(metric_names)
 
-    def get_metric_measurement(self, metric_name: str) -> Metric:
+    def get_metric_measurement(self, metric_name: str, tags: Optional[List[str]] = None) -> Metric:
+        """Returns a metric's measurements, drilled-down to the given tags formatted as "name:value" like in Spring.
+
+        Raises `MetricNotFoundError` for unknown metrics or tags, and `InvalidMetricTagError` for malformed tags.
+        """
         for provider in self.metrics_providers:
-            if metric_name.startswith(provider.get_prefix()):
+            if metric_name.startswith(provider.get_prefix()) and metric_name in provider.get_supported_metric_names():
+                if tags:
+                    return provider.get_tagged_metric(metric_name, _parse_metric_tags(tags))
                 return provider.get_metric(metric_name)
-        raise KeyError(f"Unknown metric {metric_name}")
+        raise MetricNotFoundError(f"Unknown metric {metric_name}")
 
     def get_thread_dump(self) -> ThreadDump:
         return self.thread_dump_provider.get_thread_dump()
@@ -140,3 +187,31 @@ class PyctuatorImpl:
     def get_mappings(self) -> MappingProvider:
         return self.mappings_provider.get_mappings()
 
+
+def _parse_metric_tags(tags: List[str]) -> Dict[str, str]:
+    tag_values = {}
+    for tag in tags:
+        name, separator, value = tag.partition(":")
+        if not name or not separator:
+            raise InvalidMetricTagError(f"Each tag must be in the form 'name:value' but was {tag}")
+        tag_values[name] = value
+    return tag_values
+
+
+def _health_summary(health_statuses: Mapping[str, HealthStatus]) -> HealthSummary:
+    # Health is UP if no provider is registered
+    if not health_statuses:
+        return HealthSummary(Status.UP, health_statuses)
+
+    # If there's at least one provider and any of the providers is DOWN, the service is DOWN
+    service_is_down = any(health_status.status == Status.DOWN for health_status in health_statuses.values())
+    if service_is_down:
+        return HealthSummary(Status.DOWN, health_statuses)
+
+    # IF there's at least one provider and none of the providers is DOWN and at least one is UP, the service is UP
+    service_is_up = any(health_status.status == Status.UP for health_status in health_statuses.values())
+    if service_is_up:
+        return HealthSummary(Status.UP, health_statuses)
+
+    # else, all providers are unknown so the service is UNKNOWN
+    return HealthSummary(Status.UNKNOWN, health_statuses)
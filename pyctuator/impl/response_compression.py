@@ -0,0 +1,129 @@
+# pylint: disable=import-outside-toplevel
+import gzip
+import importlib.util
+import threading
+import zlib
+from http import HTTPStatus
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Set
+
+
+class ResponseCompressor:
+    """Compresses the bodies of Pyctuator's responses according to the request's "Accept-Encoding" header.
+
+    Responses are compressed using brotli, if it is installed and accepted by the client, or gzip. Bodies smaller than
+    `min_size` bytes are sent as is, since compressing them saves little while costing CPU on every poll.
+    """
+
+    def __init__(self, min_size: int, level: int) -> None:
+        self.min_size = min_size
+        self.level = level
+
+        if importlib.util.find_spec("brotli"):
+            # brotli is optional and must only be imported if it is installed
+            import brotli
+            self.brotli = brotli
+        else:
+            self.brotli = None
+
+        self._lock = threading.Lock()
+        self.compressed_responses: int = 0
+        self.original_bytes: int = 0
+        self.compressed_bytes: int = 0
+
+    def compress(self, body: bytes, accept_encoding: Optional[str]) -> Optional[Tuple[str, bytes]]:
+        """Returns the content-encoding and compressed body, or None if the body should be sent uncompressed."""
+        if len(body) < self.min_size:
+            return None
+
+        encoding = self._select_encoding(accept_encoding)
+        if encoding == "br":
+            # Brotli's quality ranges between 0 and 11, while gzip's compression level ranges between 0 and 9
+            compressed = self.brotli.compress(body, quality=min(self.level, 11))
+        elif encoding == "gzip":
+            compressed = gzip.compress(body, compresslevel=self.level)
+        else:
+            return None
+
+        self._count(1, len(body), len(compressed))
+        return encoding, compressed
+
+    def compress_chunks(
+            self,
+            chunks: Iterable[bytes],
+            accept_encoding: Optional[str],
+    ) -> Optional[Tuple[str, Iterator[bytes]]]:
+        """Returns the content-encoding and an iterator compressing the given chunks as they are consumed.
+
+        Streamed responses are compressed regardless of their size, which is unknown until they are fully sent.
+        """
+        encoding = self._select_encoding(accept_encoding)
+        if encoding == "br":
+            compressor = self.brotli.Compressor(quality=min(self.level, 11))
+            return encoding, self._compress_chunks(chunks, compressor.process, compressor.finish)
+        if encoding == "gzip":
+            # A wbits value of 16 + 15 produces a gzip header and trailer around the deflate stream
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return encoding, self._compress_chunks(chunks, compressor.compress, compressor.flush)
+        return None
+
+    def _compress_chunks(
+            self,
+            chunks: Iterable[bytes],
+            compress: Callable[[bytes], bytes],
+            finish: Callable[[], bytes],
+    ) -> Iterator[bytes]:
+        original_size = compressed_size = 0
+        for chunk in chunks:
+            original_size += len(chunk)
+            compressed = compress(chunk)
+            if compressed:
+                compressed_size += len(compressed)
+                yield compressed
+        compressed = finish()
+        compressed_size += len(compressed)
+        yield compressed
+        self._count(1, original_size, compressed_size)
+
+    def _select_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        if not accept_encoding:
+            return None
+        accepted_encodings = _parse_accept_encoding(accept_encoding)
+        if self.brotli and "br" in accepted_encodings:
+            return "br"
+        if accepted_encodings & {"gzip", "*"}:
+            return "gzip"
+        return None
+
+    def _count(self, responses: int, original_bytes: int, compressed_bytes: int) -> None:
+        with self._lock:
+            self.compressed_responses += responses
+            self.original_bytes += original_bytes
+            self.compressed_bytes += compressed_bytes
+
+
+def is_partial_response(status: int, content_range: Optional[str]) -> bool:
+    """Returns True for responses holding a range of their resource, given their Content-Range header if any, which
+    must be sent as is.
+
+    The content range refers to the unencoded body, so compressing a partial response would corrupt the content seen by
+    clients assembling it from multiple ranges.
+    """
+    return status == HTTPStatus.PARTIAL_CONTENT or content_range is not None
+
+
+def _parse_accept_encoding(accept_encoding: str) -> Set[str]:
+    accepted_encodings = set()
+    for accepted_encoding in accept_encoding.split(","):
+        name, _, params = accepted_encoding.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and _is_zero_quality(params[2:]):
+            continue
+        accepted_encodings.add(name.strip().lower())
+    return accepted_encodings
+
+
+def _is_zero_quality(quality: str) -> bool:
+    try:
+        return float(quality) == 0
+    except ValueError:
+        return False
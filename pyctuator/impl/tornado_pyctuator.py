@@ -1,22 +1,31 @@
-import dataclasses
+import asyncio
 import json
-from datetime import datetime, timedelta
-from functools import partial
+import time
+from datetime import datetime
 from http import HTTPStatus
-from typing import Any, Optional, Callable
+from typing import Any, Optional, Callable, Dict, Iterable, Iterator, List, Pattern, Sequence, Tuple, Union
 
-from tornado.web import Application, RequestHandler
+from tornado.concurrent import Future
+from tornado.httputil import HTTPServerRequest
+from tornado.iostream import StreamClosedError
+from tornado.routing import PathMatches, RuleRouter
+from tornado.web import Application, OutputTransform, RequestHandler
 
 from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
-from pyctuator.impl import SBA_V2_CONTENT_TYPE
+from pyctuator.httptrace.http_tracer import TraceQuery, TraceQueryError
+from pyctuator.impl import SBA_V2_CONTENT_TYPE, EVENT_STREAM_CONTENT_TYPE, TRACE_CURSOR_HEADER
+from pyctuator.impl.json_serializer import dumps, dumps_stream
 from pyctuator.impl.pyctuator_impl import PyctuatorImpl
 from pyctuator.impl.pyctuator_router import PyctuatorRouter
+from pyctuator.impl.response_compression import is_partial_response
+from pyctuator.logfile.logfile import LogfileSearchError, logfile_stream_poll_interval_sec  # type: ignore
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
 
 
 # pylint: disable=abstract-method
 class AbstractPyctuatorHandler(RequestHandler):
     pyctuator_router: Optional[PyctuatorRouter] = None
-    dumps: Optional[Callable[[Any], str]] = None
+    dumps: Optional[Callable[[Any], bytes]] = None
 
     def initialize(self) -> None:
         self.pyctuator_router = self.application.settings.get("pyctuator_router")
@@ -28,6 +37,41 @@ class AbstractPyctuatorHandler(RequestHandler):
         assert self.dumps is not None
         self.write("")
 
+    # pylint: disable=protected-access
+    def finish(self, chunk: Optional[Union[str, bytes, dict]] = None) -> "Future[None]":
+        if chunk is not None:
+            self.write(chunk)
+
+        # Compress the response's body, unless it was already (partially) streamed to the client
+        compressor = self.pyctuator_router.pyctuator_impl.response_compressor if self.pyctuator_router else None
+        if compressor and not self._headers_written and "Content-Encoding" not in self._headers and \
+                not is_partial_response(self.get_status(), self._headers.get("Content-Range")):
+            compressed = compressor.compress(b"".join(self._write_buffer), self.request.headers.get("Accept-Encoding"))
+            if compressed:
+                self.set_header("Content-Encoding", compressed[0])
+                self.add_header("Vary", "Accept-Encoding")
+                self._write_buffer = [compressed[1]]
+
+        return super().finish()
+
+    async def write_json_stream(self, name: str, items: Iterable[Any]) -> None:
+        assert self.pyctuator_router is not None
+        chunks: Iterable[bytes] = dumps_stream(name, items)
+        compressor = self.pyctuator_router.pyctuator_impl.response_compressor
+        accept_encoding = self.request.headers.get("Accept-Encoding")
+        compressed = compressor.compress_chunks(chunks, accept_encoding) if compressor else None
+        if compressed:
+            self.set_header("Content-Encoding", compressed[0])
+            self.add_header("Vary", "Accept-Encoding")
+            chunks = compressed[1]
+
+        try:
+            for chunk in chunks:
+                self.write(chunk)
+                await self.flush()
+        except StreamClosedError:
+            pass  # The client has disconnected
+
 
 class PyctuatorHandler(AbstractPyctuatorHandler):
     def get(self) -> None:
@@ -54,10 +98,10 @@ class InfoHandler(AbstractPyctuatorHandler):
 
 # GET /health
 class HealthHandler(AbstractPyctuatorHandler):
-    def get(self) -> None:
+    async def get(self) -> None:
         assert self.pyctuator_router is not None
         assert self.dumps is not None
-        self.write(self.dumps(self.pyctuator_router.pyctuator_impl.get_health()))
+        self.write(self.dumps(await self.pyctuator_router.pyctuator_impl.get_health_async()))
 
 
 # GET /metrics
@@ -73,7 +117,14 @@ class MetricsNameHandler(AbstractPyctuatorHandler):
     def get(self, metric_name: str) -> None:
         assert self.pyctuator_router is not None
         assert self.dumps is not None
-        self.write(self.dumps(self.pyctuator_router.pyctuator_impl.get_metric_measurement(metric_name)))
+        pyctuator_impl = self.pyctuator_router.pyctuator_impl
+        try:
+            self.write(self.dumps(pyctuator_impl.get_metric_measurement(metric_name, self.get_query_arguments("tag"))))
+        except MetricNotFoundError:
+            self.set_status(HTTPStatus.NOT_FOUND.value)
+        except InvalidMetricTagError as e:
+            self.set_status(HTTPStatus.BAD_REQUEST.value)
+            self.write(str(e))
 
 
 # GET /loggers
@@ -103,37 +154,88 @@ class LoggersNameHandler(AbstractPyctuatorHandler):
 
 # GET /threaddump
 class ThreadDumpHandler(AbstractPyctuatorHandler):
-    def get(self) -> None:
+    async def get(self) -> None:
         assert self.pyctuator_router is not None
-        assert self.dumps is not None
-        self.write(self.dumps(self.pyctuator_router.pyctuator_impl.get_thread_dump()))
+        thread_dump_provider = self.pyctuator_router.pyctuator_impl.thread_dump_provider
+        await self.write_json_stream("threads", thread_dump_provider.iter_thread_infos())
 
 
 # GET /logfile
 class LogFileHandler(AbstractPyctuatorHandler):
+    file_chunk_size = 1024 * 1024
+
+    async def get(self) -> None:
+        assert self.pyctuator_router is not None
+        assert self.dumps is not None
+
+        logfile = self.pyctuator_router.pyctuator_impl.logfile
+        logfile_response = logfile.get_logfile_response(self.request.headers.get("range"))
+        self.set_status(logfile_response.status.value)
+        for name, value in logfile_response.headers.items():
+            self.set_header(name, value)
+
+        if not logfile_response.file_path:
+            self.write(logfile_response.body)
+            return
+
+        # Stream the log file, up to its current size, in chunks so it is never held in memory as a whole
+        size = logfile.log_source.get_size()
+        chunk, _, end = logfile.log_source.read(0, min(self.file_chunk_size, size))
+        while chunk:
+            self.write(chunk)
+            await self.flush()
+            chunk, _, end = logfile.log_source.read(end, min(end + self.file_chunk_size, size))
+
+
+# GET /logfile/search
+class LogFileSearchHandler(AbstractPyctuatorHandler):
     def get(self) -> None:
         assert self.pyctuator_router is not None
         assert self.dumps is not None
+        params = {name: self.get_query_argument(name) for name in self.request.query_arguments}
+        try:
+            self.write(self.dumps(self.pyctuator_router.pyctuator_impl.logfile.search_logfile(params)))
+        except LogfileSearchError as e:
+            self.set_status(HTTPStatus.BAD_REQUEST.value)
+            self.write(str(e))
+
+
+# GET /logfile/stream
+class LogFileStreamHandler(AbstractPyctuatorHandler):
+    async def get(self) -> None:
+        assert self.pyctuator_router is not None
+        assert self.dumps is not None
 
-        range_header = self.request.headers.get("range")
-        if not range_header:
-            self.write(f"{self.pyctuator_router.pyctuator_impl.logfile.log_messages.get_range()}")
+        self.set_header("Content-Type", EVENT_STREAM_CONTENT_TYPE)
+        self.set_header("Cache-Control", "no-cache")
 
-        else:
-            str_res, start, end = self.pyctuator_router.pyctuator_impl.logfile.get_logfile(range_header)
-            self.set_status(HTTPStatus.PARTIAL_CONTENT.value)
-            self.add_header("Content-Type", "text/html; charset=UTF-8")
-            self.add_header("Accept-Ranges", "bytes")
-            self.add_header("Content-Range", f"bytes {start}-{end}/{end}")
-            self.write(str_res)
+        logfile = self.pyctuator_router.pyctuator_impl.logfile
+        try:
+            for event in logfile.get_logfile_events(self.request.headers.get("Last-Event-ID")):
+                if event:
+                    self.write(event)
+                    await self.flush()
+                else:
+                    await asyncio.sleep(logfile_stream_poll_interval_sec)
+        except StreamClosedError:
+            pass  # The client has disconnected
 
 
 # GET /httptrace
 class HttpTraceHandler(AbstractPyctuatorHandler):
-    def get(self) -> None:
+    async def get(self) -> None:
         assert self.pyctuator_router is not None
-        assert self.dumps is not None
-        self.write(self.dumps(self.pyctuator_router.pyctuator_impl.http_tracer.get_httptrace()))
+        http_tracer = self.pyctuator_router.pyctuator_impl.http_tracer
+        params = {name: self.get_query_argument(name) for name in self.request.query_arguments}
+        try:
+            query = TraceQuery.from_params(params)
+            cursor, traces = http_tracer.query_traces(params.get("view"), query)
+        except TraceQueryError as e:
+            self.set_status(HTTPStatus.BAD_REQUEST.value)
+            self.write(str(e))
+            return
+        self.set_header(TRACE_CURSOR_HEADER, str(cursor))
+        await self.write_json_stream("traces", traces)
 
 
 # pylint: disable=too-many-locals,unused-argument
@@ -141,16 +243,14 @@ class TornadoHttpPyctuator(PyctuatorRouter):
     def __init__(self, app: Application, pyctuator_impl: PyctuatorImpl) -> None:
         super().__init__(app, pyctuator_impl)
 
-        custom_dumps = partial(
-            json.dumps, default=self._custom_json_serializer
-        )
-
         app.settings.setdefault("pyctuator_router", self)
-        app.settings.setdefault("custom_dumps", custom_dumps)
+        app.settings.setdefault("custom_dumps", dumps)
 
         # Register a log-function that records request and response in traces and than delegates to the original func
         self.delegate_log_function = app.settings.get("log_function")
+        self.handler_path_matchers: Dict[type, List[Tuple[PathMatches, str]]] = {}
         app.settings.setdefault("log_function", self._intercept_request_and_response)
+        app.add_transform(_RequestTimer)
 
         app.add_handlers(
             ".*$",
@@ -166,6 +266,8 @@ class TornadoHttpPyctuator(PyctuatorRouter):
                 (r"/pyctuator/dump", ThreadDumpHandler),
                 (r"/pyctuator/threaddump", ThreadDumpHandler),
                 (r"/pyctuator/logfile", LogFileHandler),
+                (r"/pyctuator/logfile/search", LogFileSearchHandler),
+                (r"/pyctuator/logfile/stream", LogFileStreamHandler),
                 (r"/pyctuator/trace", HttpTraceHandler),
                 (r"/pyctuator/httptrace", HttpTraceHandler),
             ]
@@ -173,30 +275,112 @@ class TornadoHttpPyctuator(PyctuatorRouter):
 
     def _intercept_request_and_response(self, handler: RequestHandler) -> None:
         # Record the request and response
-        record = TraceRecord(
-            timestamp=datetime.now() - timedelta(seconds=handler.request.request_time()),
+        http_tracer = self.pyctuator_impl.http_tracer
+        duration_us = _request_duration_us(handler)
+        self.pyctuator_impl.http_requests_metrics.record(
+            handler.request.method or "", self._route_template(handler), handler.get_status(), duration_us
+        )
+        if http_tracer.should_record(handler.get_status(), duration_us):
+            # pylint: disable=protected-access
+            http_tracer.submit_soon(self._create_record, handler, tuple(handler._headers.get_all()), duration_us)
+
+        if self.delegate_log_function:
+            self.delegate_log_function(handler)
+
+    def _route_template(self, handler: RequestHandler) -> Optional[str]:
+        # Tornado doesn't keep the rule that matched a request, so find it among the rules targeting the handler's class
+        path_matchers = self.handler_path_matchers.get(type(handler))
+        if path_matchers is None:
+            path_matchers = [
+                (path_matcher, _path_template(path_matcher.regex))
+                for path_matcher in _find_path_matchers(self.app.default_router, type(handler))
+            ]
+            self.handler_path_matchers[type(handler)] = path_matchers
+        for path_matcher, path_template in path_matchers:
+            if path_matcher.match(handler.request) is not None:
+                return path_template
+        return None
+
+    def _create_record(
+            self,
+            handler: RequestHandler,
+            response_headers: Sequence[Tuple[str, str]],
+            duration_us: int,
+    ) -> TraceRecord:
+        http_tracer = self.pyctuator_impl.http_tracer
+        return TraceRecord(
+            timestamp=datetime.fromtimestamp(handler.request._start_time),  # pylint: disable=protected-access
             principal=None,
             session=None,
             request=TraceRequest(
                 method=handler.request.method or "",
                 uri=handler.request.full_url(),
-                headers={k.lower(): v for k, v in handler.request.headers.items()}
+                headers=http_tracer.capture_headers((k.lower(), v) for k, v in handler.request.headers.get_all())
             ),
             response=TraceResponse(
                 status=handler.get_status(),
-                headers={k.lower(): [v] for k, v in handler._headers.items()}  # pylint: disable=protected-access
+                headers=http_tracer.capture_headers((k.lower(), v) for k, v in response_headers)
             ),
-            timeTaken=int(handler.request.request_time() * 1000),
+            timeTaken=duration_us // 1000,
+            timeTakenMicros=duration_us,
         )
-        self.pyctuator_impl.http_tracer.add_record(record)
 
-        if self.delegate_log_function:
-            self.delegate_log_function(handler)
 
-    def _custom_json_serializer(self, value: Any) -> Any:
-        if dataclasses.is_dataclass(value):
-            return dataclasses.asdict(value)
-
-        if isinstance(value, datetime):
-            return str(value)
-        return None
+class _RequestTimer(OutputTransform):
+    """Notes when a request's handler is executed, using a monotonic high-resolution clock.
+
+    Tornado creates the application's transforms for every request, before executing the request's handler, so this
+    times the requests of all the handlers rather than only Pyctuator's.
+    """
+
+    def __init__(self, request: HTTPServerRequest) -> None:
+        super().__init__(request)
+        self.start_ns = time.perf_counter_ns()
+
+
+def _request_duration_us(handler: RequestHandler) -> int:
+    # pylint: disable=protected-access
+    timer = next((transform for transform in handler._transforms or [] if isinstance(transform, _RequestTimer)), None)
+    if timer is None:
+        # The handler failed before it was executed, so fall back to Tornado's wall-clock timing of the request
+        return int(handler.request.request_time() * 1_000_000)
+    return (time.perf_counter_ns() - timer.start_ns) // 1000
+
+
+def _path_template(regex: Pattern) -> str:
+    """Converts a route's regex to a template like "/loggers/{logger_name}".
+
+    Unnamed groups are named by their number, and non-capturing groups are replaced by "*".
+    """
+    group_names = {index: name for name, index in regex.groupindex.items()}
+    pattern = regex.pattern.lstrip("^")
+    pattern = pattern[:-1] if pattern.endswith("$") and not pattern.endswith("\\$") else pattern
+    template = ""
+    depth = group = 0
+    escaped = False
+    for index, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+            if depth == 0:
+                template += char
+        elif char == "\\":
+            escaped = True
+        elif char == "(":
+            capturing = not pattern.startswith("?", index + 1) or pattern.startswith("?P<", index + 1)
+            group += 1 if capturing else 0
+            if depth == 0:
+                template += "{" + group_names.get(group, str(group)) + "}" if capturing else "*"
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            template += char
+    return template
+
+
+def _find_path_matchers(router: RuleRouter, handler_class: type) -> Iterator[PathMatches]:
+    for rule in router.rules:
+        if isinstance(rule.target, RuleRouter):
+            yield from _find_path_matchers(rule.target, handler_class)
+        elif rule.target is handler_class and isinstance(rule.matcher, PathMatches):
+            yield rule.matcher
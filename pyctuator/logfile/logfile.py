@@ -1,58 +1,505 @@
+import collections
+import itertools
 import logging
+import mmap
+import operator
+import os
+import queue
 import re
-from typing import Optional, Tuple
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from http import HTTPStatus
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Tuple, Dict, Iterator, List, Mapping, Pattern
 
 logfile_request_range_pattern = re.compile("bytes=(\\d*)-(\\d*)")
+logfile_format_attribute_pattern = re.compile("%\\((\\w+)\\)")
 
+# Average size of a formatted log line, used for limiting the number of records kept before they are formatted
+_estimated_record_size = 32
+
+# Settings of the logfile's Server-Sent Events stream
+logfile_stream_poll_interval_sec = 0.5
+logfile_stream_keep_alive_sec = 15
+logfile_stream_max_duration_sec = 60  # Clients reconnect once the stream ends, resuming from the last event's ID
+logfile_stream_max_event_size = 64 * 1024
+
+logfile_search_default_limit = 100
+logfile_search_max_pattern_length = 1000
+logfile_search_max_scanned_records = 10000
+
+
+class LogfileSearchError(ValueError):
+    """Raised when the parameters of a logfile search are invalid."""
+
+
+@dataclass
+class LogRecordMatch:
+    offset: int
+    timestamp: datetime
+    level: str
+    logger: str
+    message: str
+
+
+@dataclass
+class LogSearchResult:
+    records: List[LogRecordMatch]
+
+
+def _clip_range(start: Optional[int], end: Optional[int], offset: int, size: int) -> Tuple[int, int]:
+    """Clips a range of absolute offsets to the available data, a negative start is relative to the end of the data."""
+    if start is None:
+        start = offset
+    elif start < 0:
+        start = size + start
+    start = min(max(start, offset), size)
+    end = size if end is None else min(max(end, start), size)
+    return start, end
+
+
+def _parse_search_time(params: Mapping[str, str], name: str) -> Optional[float]:
+    if not params.get(name):
+        return None
+    try:
+        return datetime.fromisoformat(params[name]).timestamp()
+    except ValueError as e:
+        raise LogfileSearchError(f"Invalid {name} timestamp {params[name]}") from e
+
+
+def _parse_search_limit(params: Mapping[str, str]) -> int:
+    if not params.get("limit"):
+        return logfile_search_default_limit
+    try:
+        limit = int(params["limit"])
+    except ValueError as e:
+        raise LogfileSearchError(f"Invalid limit {params['limit']}") from e
+    if limit <= 0:
+        raise LogfileSearchError(f"Invalid limit {params['limit']}")
+    return limit
+
+
+def _event_data_end(data: bytes) -> int:
+    """Returns the length of the data to send in a logfile event - its complete lines, or if the data is a part of a
+    line that is too long for a single event, its complete UTF-8 characters."""
+    lines_end = data.rfind(b"\n") + 1
+    if lines_end or len(data) < logfile_stream_max_event_size:
+        return lines_end
+
+    # Back off to the first byte of the last character, and exclude the character if it's incomplete
+    char_start = len(data) - 1
+    while char_start > 0 and data[char_start] & 0xC0 == 0x80:
+        char_start -= 1
+    lead = data[char_start]
+    char_size = 4 if lead >= 0xF0 else 3 if lead >= 0xE0 else 2 if lead >= 0xC0 else 1
+    return len(data) if char_start + char_size <= len(data) else char_start
+
+
+class LogSource(ABC):
+    """The source of the data served by the logfile endpoint, addressed by absolute byte offsets."""
+
+    @abstractmethod
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[bytes, int, int]:
+        """Returns the log bytes between the given absolute offsets and the actual offsets of the returned bytes.
+
+        The range is clipped to the available data. A missing start or end stands for the beginning or end of the
+        available data, and a negative start is relative to the end of the data.
+        """
+
+    @abstractmethod
+    def get_size(self) -> int:
+        """Returns the absolute offset of the end of the data."""
+
+
+class LogMessageBuffer(logging.Handler, LogSource):
+    """A logging handler keeping the last `max_size` bytes of formatted log messages in a preallocated ring buffer.
+
+    The ring is mirrored - every byte is written both at its position and `max_size` bytes after it, so the data
+    currently held by the buffer is always available as a single contiguous slice that can be returned as a memoryview
+    without copying. Appending a message costs O(message length) regardless of the buffer's size.
+    """
+
+    lock: threading.RLock  # Created by logging.Handler's constructor
 
-class LogMessageBuffer(logging.Handler):
     def __init__(self, max_size: int, formatter: str) -> None:
         super().__init__()
         self.setFormatter(logging.Formatter(formatter))
         self._max_size = max_size
-        self._buffer: str = ""
-        self._offset: int = 0
+        self._buffer = bytearray(2 * max_size)
+        self._view = memoryview(self._buffer)
+        self._written: int = 0  # Total number of bytes written to the buffer since it was created
+
+        # An index of the buffered records, holding a (start offset, end offset, level, created, logger name) tuple
+        # per record, oldest first, used for searching records without scanning the buffer's text
+        self._index: collections.deque = collections.deque()
 
     def emit(self, record: logging.LogRecord) -> None:
-        msg = self.format(record) + "\n"
-        msg_len = len(msg)
-        if len(self._buffer) + msg_len > self._max_size:
-            self._buffer = self._buffer[-(self._max_size - msg_len):]
-            self._offset += msg_len
-        self._buffer += msg
+        self._append_record(record, (self.format(record) + "\n").encode("utf-8"))
+
+    def _append_record(self, record: logging.LogRecord, data: bytes) -> None:
+        self._append(data)
+        index = self._index
+        index.append((self._written - len(data), self._written, record.levelno, record.created, record.name))
+
+        # Forget records that were overwritten, even partially
+        offset = self.get_offset()
+        while index and index[0][0] < offset:
+            index.popleft()
+
+    def _append(self, data: bytes) -> None:
+        data_len = len(data)
+        if data_len > self._max_size:
+            # Only the tail of a message that is larger than the whole buffer can be kept
+            self._written += data_len - self._max_size
+            data = data[-self._max_size:]
+            data_len = self._max_size
+
+        max_size = self._max_size
+        pos = self._written % max_size
+        wrap = min(data_len, max_size - pos)  # Number of bytes written before reaching the mirror's boundary
+
+        self._view[pos:pos + data_len] = data
+        self._view[pos + max_size:pos + max_size + wrap] = data[:wrap]
+        self._view[:data_len - wrap] = data[wrap:]
+        self._written += data_len
+
+    def _available(self) -> int:
+        return min(self._written, self._max_size)
 
-    def get_range(self, start: Optional[int] = None, end: Optional[int] = None) -> str:
-        start = start - self._offset if start else 0
-        return self._buffer[start:end or len(self._buffer) - 1]
+    def get_range(self, start: Optional[int] = None, end: Optional[int] = None) -> memoryview:
+        """Returns a zero-copy view of the buffered bytes between the given offsets, relative to the buffer's start.
+
+        The view references the live buffer, so it is only valid until the buffer wraps around it.
+        """
+        available = self._available()
+        start = min(start or 0, available)
+        end = available if end is None else max(start, min(end, available))
+        pos = (self._written - available) % self._max_size
+        return self._view[pos + start:pos + end]
 
     def get_offset(self) -> int:
-        return self._offset
+        return self._written - self._available()
 
-    def get_offset_tuple(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
-        res_start = self._offset + (start or 0)
-        res_end = self._offset + (end or len(self._buffer))
-        return res_start, res_end
+    def get_size(self) -> int:
+        with self.lock:
+            self.flush()
+            return self._written
 
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[bytes, int, int]:
+        # The bytes are copied while holding the lock, so they are not affected by records logged while the response
+        # is being sent
+        with self.lock:
+            self.flush()
+            offset = self.get_offset()
+            start, end = _clip_range(start, end, offset, self._written)
+            return bytes(self.get_range(start - offset, end - offset)), start, end
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def search(
+            self,
+            min_level: int = logging.NOTSET,
+            logger: Optional[str] = None,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+            pattern: Optional[Pattern] = None,
+            limit: int = logfile_search_default_limit,
+            max_scanned: int = logfile_search_max_scanned_records,
+    ) -> List[LogRecordMatch]:
+        """Returns the most recent buffered records matching all the given filters, oldest first.
+
+        Records are first filtered by the level, logger and creation time kept in the index, so only the text of
+        records passing these filters is copied. The copied records are decoded and matched against the pattern after
+        releasing the handler's lock, so logging isn't blocked by the search. At most `max_scanned` of the most recent
+        records are scanned.
+        """
+        logger_prefix = logger + "." if logger else None
+        candidates: List[Tuple[int, bytes, int, float, str]] = []
+        with self.lock:
+            self.flush()
+            offset = self.get_offset()
+            for start, end, levelno, created, name in itertools.islice(reversed(self._index), max_scanned):
+                if levelno < min_level or \
+                        (since is not None and created < since) or \
+                        (until is not None and created > until) or \
+                        (logger and name != logger and not name.startswith(logger_prefix)):
+                    continue
+
+                candidates.append((start, bytes(self.get_range(start - offset, end - offset)), levelno, created, name))
+                if not pattern and len(candidates) >= limit:
+                    break
+
+        matches: List[LogRecordMatch] = []
+        for start, data, levelno, created, name in candidates:
+            message = str(data, "utf-8", "replace").rstrip("\n")
+            if pattern and not pattern.search(message):
+                continue
+
+            matches.append(LogRecordMatch(
+                start, datetime.fromtimestamp(created), logging.getLevelName(levelno), name, message))
+            if len(matches) >= limit:
+                break
+
+        matches.reverse()
+        return matches
+
+
+class LazyLogMessageBuffer(LogMessageBuffer):
+    """A log-messages buffer that postpones formatting records until the buffer is read.
+
+    When a record is emitted, only the record attributes needed by the formatter are copied into a bounded queue of
+    tuples. The pending records are formatted and appended to the buffer when it is flushed, which happens whenever
+    the logfile is read, so the formatted buffer also serves as a cache of previously formatted records. When a burst
+    of records fills the queue, its oldest record is formatted rather than dropped, so the buffer holds the same lines
+    at the same offsets as when formatting eagerly.
+    """
 
-class PyctuatorLogfile:
     def __init__(self, max_size: int, formatter: str) -> None:
-        self.log_messages = LogMessageBuffer(max_size=max_size, formatter=formatter)
+        super().__init__(max_size, formatter)
+        format_attributes = set(logfile_format_attribute_pattern.findall(formatter)) - {"asctime", "message"}
+        self._attributes = tuple(sorted(
+            format_attributes | {"name", "levelno", "created", "msecs", "msg", "args", "exc_text", "stack_info"}
+        ))
+        self._get_attributes = operator.attrgetter(*self._attributes)
+        self._max_pending = max(1, max_size // _estimated_record_size)
+        self._pending: collections.deque = collections.deque()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Tracebacks are formatted right away so the record doesn't keep the traceback's frames alive
+        if record.exc_info and not record.exc_text:
+            formatter = self.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+        if len(self._pending) >= self._max_pending:
+            self._format_pending(1)
+        self._pending.append(self._get_attributes(record))
+
+    def flush(self) -> None:
+        with self.lock:
+            self._format_pending(len(self._pending))
+
+    def _format_pending(self, count: int) -> None:
+        # Called while holding the lock
+        for _ in range(count):
+            record = logging.makeLogRecord(dict(zip(self._attributes, self._pending.popleft())))
+            self._append_record(record, (self.format(record) + "\n").encode("utf-8"))
+
+
+class _LogMessageListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for the background thread to make room in a full queue instead of failing to stop it
+        self.queue.put(self._sentinel)  # type: ignore
+
+
+class QueuedLogMessageHandler(QueueHandler):
+    """A logging handler that hands records to a bounded queue, from which a background thread formats them and appends
+    them to the log-messages buffer, so the logging thread doesn't pay for formatting.
+
+    When the queue is full the record is dropped and counted in `dropped_records` rather than blocking the caller.
+    """
+
+    def __init__(self, log_messages: LogMessageBuffer, queue_size: int) -> None:
+        super().__init__(queue.Queue(queue_size))
+        self.dropped_records: int = 0
+        self._listener = _LogMessageListener(self.queue, log_messages)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler's default, the record isn't formatted here, that is left for the background thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+    def start(self) -> None:
+        self._listener.start()
+
+    def stop(self) -> None:
+        # QueueListener fails if stopped twice, while applications may stop Pyctuator more than once
+        if self._listener._thread is not None:  # pylint: disable=protected-access
+            self._listener.stop()
+
+
+class LogFileReader(LogSource):
+    """Reads ranges of an existing log file, written by the application's own logging handlers.
+
+    Every read maps the file to memory and copies only the requested range, so large log files can be served without
+    loading them to the Python heap. Files rotated by renaming them (e.g. by RotatingFileHandler) are handled
+    gracefully, offsets beyond the end of a file that was rotated are clipped to its current size.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+
+    def get_size(self) -> int:
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[bytes, int, int]:
+        try:
+            with open(self.path, "rb") as log_file:
+                start, end = _clip_range(start, end, 0, os.fstat(log_file.fileno()).st_size)
+                if start == end:
+                    return b"", start, end
 
-    def get_logfile(self, range_substring: str) -> Tuple[str, int, int]:
+                with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    return mapped_file[start:end], start, end
+        except FileNotFoundError:
+            return b"", 0, 0
+
+
+@dataclass
+class LogfileResponse:
+    status: HTTPStatus
+    body: bytes
+    headers: Dict[str, str]
+    file_path: Optional[str] = None  # When set, the response should stream this file instead of sending the body
+
+
+class PyctuatorLogfile:
+    def __init__(
+            self,
+            max_size: int,
+            formatter: str,
+            queue_size: Optional[int] = None,
+            lazy_formatting: bool = False,
+            path: Optional[str] = None,
+    ) -> None:
+        # The handler to be registered with the logging module, if the logfile isn't read from an existing file
+        self.log_handler: Optional[logging.Handler] = None
+        self.log_messages: Optional[LogMessageBuffer] = None
+        self.log_source: LogSource
+
+        if path:
+            self.log_source = LogFileReader(path)
+            return
+
+        buffer_class = LazyLogMessageBuffer if lazy_formatting else LogMessageBuffer
+        self.log_messages = buffer_class(max_size=max_size, formatter=formatter)
+        self.log_source = self.log_handler = self.log_messages
+
+        # Queue log records if a queue size is provided
+        if queue_size:
+            self.log_handler = QueuedLogMessageHandler(self.log_messages, queue_size)
+            self.log_handler.start()
+
+    def stop(self) -> None:
+        if isinstance(self.log_handler, QueuedLogMessageHandler):
+            self.log_handler.stop()
+
+    def get_logfile(self, range_substring: str) -> Tuple[bytes, int, int]:
+        """Returns the UTF-8 encoded log bytes requested by the given range header and their absolute byte offsets.
+
+        A suffix range such as "bytes=-307200", which Spring Boot Admin uses for its first request, returns the last
+        bytes of the log, while "bytes=1000-" returns everything logged from offset 1000.
+        """
         logging.debug("Received logfile request with range header: %s", range_substring)
 
         start_str, end_str = logfile_request_range_pattern.match(range_substring).groups()
-        start = int(start_str) if start_str.strip() else None
-        end = int(end_str) if end_str.strip() else None
+        if start_str:
+            start: Optional[int] = int(start_str)
+            end = int(end_str) + 1 if end_str else None
+        else:
+            start = -int(end_str) if end_str else None
+            end = None
+
+        bytes_res, res_start, res_end = self.log_source.read(start, end)
+
+        logging.debug("Returning logfile response with range header: bytes=%d-%d/%d", res_start, res_end, res_end)
+
+        return bytes_res, res_start, res_end
+
+    def get_logfile_response(self, range_header: Optional[str]) -> LogfileResponse:
+        """Builds the response to a `/logfile` request, shared by all the web-framework integrations."""
+        if not range_header or not logfile_request_range_pattern.match(range_header):
+            if isinstance(self.log_source, LogFileReader):
+                return LogfileResponse(HTTPStatus.OK, b"", {}, self.log_source.path)
+            return LogfileResponse(HTTPStatus.OK, self.log_source.read()[0], {})
+
+        body, start, end = self.get_logfile(range_header)
+        return LogfileResponse(
+            HTTPStatus.PARTIAL_CONTENT,
+            body,
+            {
+                "Content-Type": "text/html; charset=UTF-8",
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {start}-{end}/{end}",
+            }
+        )
+
+    def get_logfile_events(self, last_event_id: Optional[str] = None) -> Iterator[bytes]:
+        """Yields Server-Sent Events carrying log messages as they are logged, shared by all the web-framework
+        integrations.
+
+        The ID of each event is the offset following its data, so a reconnecting client resumes from where it stopped
+        by sending the "Last-Event-ID" header. New clients start at the current end of the log. Events carry whole
+        lines, unless a line doesn't fit in `logfile_stream_max_event_size`, in which case it's split between events at
+        a character boundary.
+        An empty bytes object is yielded when there's nothing new, the caller should then wait for
+        `logfile_stream_poll_interval_sec` before continuing. The stream ends after `logfile_stream_max_duration_sec`.
+        """
+        try:
+            offset = int(last_event_id or "")
+        except ValueError:
+            offset = self.log_source.get_size()
+
+        yield f"retry: {int(logfile_stream_poll_interval_sec * 1000)}\n\n".encode("utf-8")
+
+        start_time = last_event_time = time.monotonic()
+        while time.monotonic() - start_time < logfile_stream_max_duration_sec:
+            data, start, _ = self.log_source.read(offset, offset + logfile_stream_max_event_size)
+            data = data[:_event_data_end(data)]
+            offset = start + len(data)  # The rest of the data is read again for the following event
+            if data:
+                last_event_time = time.monotonic()
+                lines = str(data, "utf-8", "replace").splitlines()
+                yield (f"id: {offset}\n" + "".join(f"data: {line}\n" for line in lines) + "\n").encode("utf-8")
+            elif time.monotonic() - last_event_time > logfile_stream_keep_alive_sec:
+                last_event_time = time.monotonic()
+                yield b": keep-alive\n\n"
+            else:
+                yield b""
+
+    def search_logfile(self, params: Mapping[str, str]) -> LogSearchResult:
+        """Searches the buffered log records using the query parameters of a `/logfile/search` request.
 
-        str_res = self.log_messages.get_range(start, end)
-        end = len(str_res) if (start is None) and end else end  # Handle 0-307200 initial range edge-case
+        Supported parameters are "level" (minimal level name), "logger" (logger name, including its descendants),
+        "since" and "until" (ISO-8601 timestamps), "text" (a substring), "regex" (a regular expression) and "limit"
+        (maximal number of records to return). Log files read from an existing file are not indexed and can't be
+        searched. Raises `LogfileSearchError` if any of the parameters is invalid.
+        """
+        if not self.log_messages:
+            return LogSearchResult([])
 
-        res_start, res_end = self.log_messages.get_offset_tuple(start, end)
+        min_level = logging.NOTSET
+        if params.get("level"):
+            min_level = logging.getLevelName(params["level"].upper())
+            if not isinstance(min_level, int):
+                raise LogfileSearchError(f"Unknown log level {params['level']}")
 
-        logging.debug(f"Returning logfile response with range header: bytes=%d-%d/%d", res_start, res_end, res_end)
+        pattern: Optional[Pattern] = None
+        expression = params.get("regex") or re.escape(params.get("text") or "")
+        if len(expression) > logfile_search_max_pattern_length:
+            raise LogfileSearchError(f"Search pattern is longer than {logfile_search_max_pattern_length} characters")
+        if expression:
+            try:
+                pattern = re.compile(expression)
+            except re.error as e:
+                raise LogfileSearchError(f"Invalid regex {params['regex']}: {e}") from e
 
-        return str_res, res_start, res_end
+        return LogSearchResult(self.log_messages.search(
+            min_level,
+            params.get("logger"),
+            _parse_search_time(params, "since"),
+            _parse_search_time(params, "until"),
+            pattern,
+            _parse_search_limit(params),
+        ))
 
     def get_log_buffer_offset(self) -> int:
-        return self.log_messages.get_offset()
+        return self.log_source.read(None, 0)[1]
@@ -0,0 +1,33 @@
+from typing import List
+
+from pyctuator.impl.response_compression import ResponseCompressor
+from pyctuator.metrics.metrics_provider import MetricsProvider, Metric, Measurement
+
+PREFIX = "compression."
+COMPRESSED_RESPONSES = PREFIX + "responses"
+ORIGINAL_BYTES = PREFIX + "original.bytes"
+COMPRESSED_BYTES = PREFIX + "compressed.bytes"
+SAVED_BYTES = PREFIX + "saved.bytes"
+
+
+class CompressionMetricsProvider(MetricsProvider):
+    def __init__(self, response_compressor: ResponseCompressor) -> None:
+        self.response_compressor = response_compressor
+
+    def get_prefix(self) -> str:
+        return PREFIX
+
+    def get_supported_metric_names(self) -> List[str]:
+        return [COMPRESSED_RESPONSES, ORIGINAL_BYTES, COMPRESSED_BYTES, SAVED_BYTES]
+
+    def get_metric(self, metric_name: str) -> Metric:
+        compressor = self.response_compressor
+        if metric_name == COMPRESSED_RESPONSES:
+            return Metric(metric_name, None, "Integer", [Measurement("COUNT", compressor.compressed_responses)], [])
+
+        value = {
+            ORIGINAL_BYTES: compressor.original_bytes,
+            COMPRESSED_BYTES: compressor.compressed_bytes,
+            SAVED_BYTES: compressor.original_bytes - compressor.compressed_bytes,
+        }[metric_name]
+        return Metric(metric_name, None, "bytes", [Measurement("TOTAL", value)], [])
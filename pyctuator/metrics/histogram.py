@@ -0,0 +1,127 @@
+"""Fixed-memory histograms of request durations, used to report percentiles over a recent time window."""
+import time
+from array import array
+from typing import Callable, List, Mapping, Optional
+
+# Values are bucketed log-linearly: each power of 2 is split into 2^SUB_BUCKET_BITS linear sub-buckets, so a value's
+# bucket is at most 1/8 of the value wide. Values below 2^SUB_BUCKET_BITS each have their own bucket
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Larger values are counted in the last bucket, in microseconds this is more than 19 hours
+MAX_VALUE_BITS = 36
+BUCKETS = (MAX_VALUE_BITS - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+
+def bucket_index(value: int) -> int:
+    """Returns the index of the bucket counting the given non-negative value."""
+    if value < SUB_BUCKETS:
+        return max(value, 0)
+    exponent = value.bit_length() - 1
+    if exponent >= MAX_VALUE_BITS:
+        return BUCKETS - 1
+    shift = exponent - SUB_BUCKET_BITS
+    return (shift + 1) * SUB_BUCKETS + ((value >> shift) & (SUB_BUCKETS - 1))
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Returns the highest value counted by the bucket at the given index."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    lower_bound = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+    return lower_bound + (1 << shift) - 1
+
+
+class LogLinearHistogram:
+    """Counts values in a fixed number of log-linear buckets, reporting percentiles with a relative error below 12.5%.
+
+    The counts are kept in a single array, so a histogram uses the same ~2KB of memory regardless of how many values
+    it counts.
+    """
+    __slots__ = ("counts", "count", "max")
+
+    def __init__(self) -> None:
+        self.counts = array("Q", bytes(8 * BUCKETS))
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def from_counts(cls, counts: Mapping[int, int], max_value: int) -> "LogLinearHistogram":
+        """Creates a histogram from the non-zero counts of its buckets, keyed by bucket index."""
+        histogram = cls()
+        for index, count in counts.items():
+            histogram.counts[index] = count
+            histogram.count += count
+        histogram.max = max_value
+        return histogram
+
+    def record(self, value: int) -> None:
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def add(self, other: "LogLinearHistogram") -> None:
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, phi: float) -> int:
+        """Returns the value below which the given fraction of the values fall, or 0 if no values were recorded."""
+        rank = max(int(phi * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max)
+        return self.max
+
+
+class TimeWindowHistogram:
+    """Histogram of the values recorded during the last `window_sec` seconds.
+
+    The window is split into `buffer_length` slots, each having its own histogram. Values are recorded in the current
+    slot's histogram and the histograms of slots that went out of the window are cleared, so the window moves forward
+    one slot at a time and old values are forgotten without keeping them.
+    """
+
+    def __init__(
+            self,
+            window_sec: float = 300,
+            buffer_length: int = 5,
+            clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.slot_sec = window_sec / buffer_length
+        self.clock = clock
+        # Histograms are only allocated for slots having values, so idle series use almost no memory
+        self.slots: List[Optional[LogLinearHistogram]] = [None] * buffer_length
+        self.current_slot = int(clock() // self.slot_sec)
+
+    def record(self, value: int) -> None:
+        self._rotate()
+        index = self.current_slot % len(self.slots)
+        histogram = self.slots[index]
+        if histogram is None:
+            histogram = self.slots[index] = LogLinearHistogram()
+        histogram.record(value)
+
+    def snapshot(self) -> LogLinearHistogram:
+        """Returns a histogram of all the values in the window."""
+        self._rotate()
+        merged = LogLinearHistogram()
+        for histogram in self.slots:
+            if histogram is not None:
+                merged.add(histogram)
+        return merged
+
+    def _rotate(self) -> None:
+        slot = int(self.clock() // self.slot_sec)
+        if slot == self.current_slot:
+            return
+        # Forget the slots that went out of the window, which are all of them if the window was idle long enough
+        for expired in range(self.current_slot + 1, min(slot, self.current_slot + len(self.slots)) + 1):
+            self.slots[expired % len(self.slots)] = None
+        self.current_slot = slot
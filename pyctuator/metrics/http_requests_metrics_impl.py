@@ -0,0 +1,188 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from pyctuator.metrics.histogram import LogLinearHistogram, TimeWindowHistogram
+from pyctuator.metrics.metrics_provider import MetricsProvider, Metric, Measurement, MetricTag
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError, MetricNotFoundError
+
+PREFIX = "http.server.requests"
+HTTP_SERVER_REQUESTS = PREFIX
+HTTP_SERVER_REQUESTS_PERCENTILE = PREFIX + ".percentile"
+
+TAGS = ["method", "outcome", "status", "uri"]
+PERCENTILES = ["0.5", "0.75", "0.95", "0.99"]
+DEFAULT_PERCENTILE = "0.99"
+
+# Requests whose route is unknown, usually since no route matched them, are tagged like Spring does
+NOT_FOUND_URI = "NOT_FOUND"
+REDIRECTION_URI = "REDIRECTION"
+UNKNOWN_URI = "UNKNOWN"
+
+SeriesKey = Tuple[str, str, str, str]  # The values of the method, outcome, status and uri tags
+
+
+class _RequestsSeries:
+    __slots__ = ("count", "total_us", "histogram")
+
+    def __init__(self, window_sec: float) -> None:
+        self.count = 0
+        self.total_us = 0
+        self.histogram = TimeWindowHistogram(window_sec)
+
+
+def outcome(status: int) -> str:
+    if 100 <= status < 200:
+        return "INFORMATIONAL"
+    if 200 <= status < 300:
+        return "SUCCESS"
+    if 300 <= status < 400:
+        return "REDIRECTION"
+    if 400 <= status < 500:
+        return "CLIENT_ERROR"
+    if 500 <= status < 600:
+        return "SERVER_ERROR"
+    return "UNKNOWN"
+
+
+def _is_percentile(phi: str) -> bool:
+    try:
+        return 0 <= float(phi) <= 1
+    except ValueError:
+        return False
+
+
+class HttpRequestsMetricsProvider(MetricsProvider):
+    """Reports the duration of the requests handled by the application as Spring's `http.server.requests` metric.
+
+    Requests are counted per method, route template (the `uri` tag), status and outcome. The count and total time are
+    cumulative, while the max and the percentiles reported by `http.server.requests.percentile` cover the requests
+    handled during the last `window_sec` seconds. Once there are `max_series` combinations of tags, requests of new
+    combinations are counted with an `UNKNOWN` uri, so that unexpected routes can't use an unbounded amount of memory.
+
+    When the application runs in several worker processes, `peer_snapshots` returns the snapshots exported by the
+    other workers, which are aggregated with this worker's series. The window histograms of snapshots older than the
+    window are ignored, as their requests are no longer in the window.
+    """
+
+    def __init__(
+            self,
+            window_sec: float = 300,
+            max_series: int = 1000,
+            peer_snapshots: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+    ) -> None:
+        self.window_sec = window_sec
+        self.max_series = max_series
+        self.peer_snapshots = peer_snapshots
+        self.series: Dict[SeriesKey, _RequestsSeries] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, uri: Optional[str], status: int, duration_us: int) -> None:
+        """Records a request given its route template, which is None if the request didn't match a route."""
+        if uri is None:
+            if status == 404:
+                uri = NOT_FOUND_URI
+            elif 300 <= status < 400:
+                uri = REDIRECTION_URI
+            else:
+                uri = UNKNOWN_URI
+
+        key = (method, outcome(status), str(status), uri)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                if len(self.series) >= self.max_series:
+                    key = (method, key[1], key[2], UNKNOWN_URI)
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = _RequestsSeries(self.window_sec)
+            series.count += 1
+            series.total_us += duration_us
+            series.histogram.record(duration_us)
+
+    def export(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable snapshot of the series, with the non-empty buckets of their window histograms."""
+        with self._lock:
+            series = []
+            for key, requests_series in self.series.items():
+                histogram = requests_series.histogram.snapshot()
+                buckets = {str(index): count for index, count in enumerate(histogram.counts) if count}
+                series.append([*key, requests_series.count, requests_series.total_us, histogram.max, buckets])
+        return {"time": time.time(), "series": series}
+
+    def get_prefix(self) -> str:
+        return PREFIX
+
+    def get_supported_metric_names(self) -> List[str]:
+        return [HTTP_SERVER_REQUESTS, HTTP_SERVER_REQUESTS_PERCENTILE]
+
+    def get_metric(self, metric_name: str) -> Metric:
+        return self.get_tagged_metric(metric_name, {})
+
+    def get_tagged_metric(self, metric_name: str, tags: Mapping[str, str]) -> Metric:
+        tags = dict(tags)
+        phi = DEFAULT_PERCENTILE
+        if metric_name == HTTP_SERVER_REQUESTS_PERCENTILE:
+            phi = tags.pop("phi", DEFAULT_PERCENTILE)
+            if not _is_percentile(phi):
+                raise InvalidMetricTagError(f"The phi tag must be a number between 0 and 1 but was {phi}")
+        elif metric_name != HTTP_SERVER_REQUESTS:
+            raise MetricNotFoundError(f"Unknown metric {metric_name}")
+
+        unknown_tags = set(tags) - set(TAGS)
+        if unknown_tags:
+            raise MetricNotFoundError(f"Unknown tags {', '.join(sorted(unknown_tags))} of metric {metric_name}")
+
+        matching = [
+            (key, count, total_us, histogram) for key, count, total_us, histogram in self._all_series()
+            if all(key[TAGS.index(tag)] == value for tag, value in tags.items())
+        ]
+        if not matching and tags:
+            raise MetricNotFoundError(f"No measurements of metric {metric_name} having the tags {tags}")
+
+        histogram = LogLinearHistogram()
+        for _, _, _, series_histogram in matching:
+            histogram.add(series_histogram)
+        count = sum(series_count for _, series_count, _, _ in matching)
+        total_us = sum(series_total_us for _, _, series_total_us, _ in matching)
+
+        # Tags that were drilled-down on are no longer available, like in Spring Boot
+        available_tags = [
+            MetricTag(tag, sorted({key[index] for key, _, _, _ in matching}))
+            for index, tag in enumerate(TAGS) if tag not in tags
+        ]
+
+        if metric_name == HTTP_SERVER_REQUESTS_PERCENTILE:
+            available_tags.append(MetricTag("phi", PERCENTILES))
+            measurements = [Measurement("VALUE", histogram.percentile(float(phi)) / 1_000_000)]
+            description = f"The {phi} percentile of the duration of requests handled in the last {self.window_sec}s"
+        else:
+            measurements = [
+                Measurement("COUNT", count),
+                Measurement("TOTAL_TIME", total_us / 1_000_000),
+                Measurement("MAX", histogram.max / 1_000_000),
+            ]
+            description = "Duration of the HTTP requests handled by the application"
+
+        return Metric(metric_name, description, "seconds", measurements, available_tags)
+
+    def _all_series(self) -> List[Tuple[SeriesKey, int, int, LogLinearHistogram]]:
+        """Returns the key, count, total time and window histogram of this worker's series and of its peers'."""
+        with self._lock:
+            all_series = [
+                (key, series.count, series.total_us, series.histogram.snapshot()) for key, series in self.series.items()
+            ]
+
+        if self.peer_snapshots:
+            now = time.time()
+            for snapshot in self.peer_snapshots():
+                in_window = now - snapshot["time"] < self.window_sec
+                for method, series_outcome, status, uri, count, total_us, max_us, buckets in snapshot["series"]:
+                    histogram = LogLinearHistogram()
+                    if in_window:
+                        histogram = LogLinearHistogram.from_counts(
+                            {int(index): bucket_count for index, bucket_count in buckets.items()}, max_us
+                        )
+                    all_series.append(((method, series_outcome, status, uri), count, total_us, histogram))
+
+        return all_series
@@ -0,0 +1,22 @@
+from typing import List
+
+from pyctuator.httptrace.trace_record_queue import TraceRecordQueue
+from pyctuator.metrics.metrics_provider import MetricsProvider, Metric, Measurement
+
+PREFIX = "httptrace."
+HTTPTRACE_DROPPED = PREFIX + "dropped"
+
+
+class HttpTraceMetricsProvider(MetricsProvider):
+    def __init__(self, record_queue: TraceRecordQueue) -> None:
+        self.record_queue = record_queue
+
+    def get_prefix(self) -> str:
+        return PREFIX
+
+    def get_supported_metric_names(self) -> List[str]:
+        return [HTTPTRACE_DROPPED]
+
+    def get_metric(self, metric_name: str) -> Metric:
+        measurements = [Measurement("COUNT", self.record_queue.dropped_records)]
+        return Metric(metric_name, "HTTP traces dropped since the trace queue was full", "Integer", measurements, [])
@@ -0,0 +1,22 @@
+from typing import List
+
+from pyctuator.logfile.logfile import QueuedLogMessageHandler  # type: ignore
+from pyctuator.metrics.metrics_provider import MetricsProvider, Metric, Measurement
+
+PREFIX = "logfile."
+LOGFILE_DROPPED = PREFIX + "dropped"
+
+
+class LogfileMetricsProvider(MetricsProvider):
+    def __init__(self, log_handler: QueuedLogMessageHandler) -> None:
+        self.log_handler = log_handler
+
+    def get_prefix(self) -> str:
+        return PREFIX
+
+    def get_supported_metric_names(self) -> List[str]:
+        return [LOGFILE_DROPPED]
+
+    def get_metric(self, metric_name: str) -> Metric:
+        measurements = [Measurement("COUNT", self.log_handler.dropped_records)]
+        return Metric(metric_name, "Log records dropped since the logfile queue was full", "Integer", measurements, [])
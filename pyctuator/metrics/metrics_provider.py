@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 
-from typing import List, Optional
+from typing import List, Mapping, Optional
 
 
 @dataclass
@@ -30,6 +30,14 @@ class Metric:
     availableTags: List[MetricTag]
 
 
+class MetricNotFoundError(KeyError):
+    """Raised when a metric, or measurements of a metric having the requested tags, don't exist."""
+
+
+class InvalidMetricTagError(ValueError):
+    """Raised when a tag used for drilling-down into a metric is malformed."""
+
+
 class MetricsProvider(ABC):
 
     @abstractmethod
@@ -43,3 +51,11 @@ class MetricsProvider(ABC):
     @abstractmethod
     def get_metric(self, metric_name: str) -> Metric:
         pass
+
+    def get_tagged_metric(self, metric_name: str, tags: Mapping[str, str]) -> Metric:  # pylint: disable=unused-argument
+        """Returns the measurements of a metric having the given tags, used to drill-down into tagged metrics.
+
+        Metrics are untagged by default, in which case the tags are ignored. Raises `MetricNotFoundError` if there are
+        no measurements having the tags, and `InvalidMetricTagError` if a tag's value is malformed.
+        """
+        return self.get_metric(metric_name)
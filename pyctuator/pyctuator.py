@@ -3,7 +3,7 @@ import atexit
 import importlib.util
 import logging
 from datetime import datetime, timezone
-from typing import Any, Optional, Dict, Callable
+from typing import Any, Optional, Dict, Callable, List
 
 # A note about imports: this module ensure that only relevant modules are imported.
 # For example, if the webapp is a Flask webapp, we do not want to import FastAPI, and vice versa.
@@ -13,7 +13,13 @@ from pyctuator.auth import Auth
 from pyctuator.environment.custom_environment_provider import CustomEnvironmentProvider
 from pyctuator.environment.os_env_variables_impl import OsEnvironmentVariableProvider
 from pyctuator.health.diskspace_health_impl import DiskSpaceHealthProvider
-from pyctuator.health.health_provider import HealthProvider
+from pyctuator.health.health_provider import AnyHealthProvider
+from pyctuator.httptrace.trace_sampler import TraceSampler
+from pyctuator.logfile.logfile import QueuedLogMessageHandler  # type: ignore
+from pyctuator.impl.response_compression import ResponseCompressor
+from pyctuator.metrics.compression_metrics_impl import CompressionMetricsProvider
+from pyctuator.metrics.httptrace_metrics_impl import HttpTraceMetricsProvider
+from pyctuator.metrics.logfile_metrics_impl import LogfileMetricsProvider
 from pyctuator.metrics.memory_metrics_impl import MemoryMetricsProvider
 from pyctuator.metrics.thread_metrics_impl import ThreadMetricsProvider
 from pyctuator.impl.pyctuator_impl import PyctuatorImpl, AppInfo, BuildInfo, GitInfo, GitCommitInfo, AppDetails
@@ -39,7 +45,24 @@ class Pyctuator:
             free_disk_space_down_threshold_bytes: int = 1024 * 1024 * 100,
             logfile_max_size: int = 10000,
             logfile_formatter: str = default_logfile_format,
-            auto_deregister: bool = True
+            auto_deregister: bool = True,
+            logfile_queue_size: Optional[int] = None,
+            logfile_lazy_formatting: bool = False,
+            logfile_path: Optional[str] = None,
+            response_compression_min_size: Optional[int] = None,
+            response_compression_level: int = 6,
+            flask_wsgi_tracing: bool = False,
+            httptrace_header_allowlist: Optional[List[str]] = None,
+            httptrace_sampler: Optional[TraceSampler] = None,
+            httptrace_capacity: int = 100,
+            httptrace_slowest_capacity: int = 10,
+            httptrace_slowest_window_sec: float = 3600,
+            httptrace_errors_capacity: int = 100,
+            httptrace_file: Optional[str] = None,
+            multiprocess_dir: Optional[str] = None,
+            httptrace_queue_size: Optional[int] = None,
+            health_timeout_sec: float = 5,
+            health_cache_ttl_sec: Optional[float] = None,
             
     ) -> None:
         """The entry point for integrating pyctuator with a web-frameworks such as FastAPI and Flask.
@@ -72,10 +95,48 @@ class Pyctuator:
         :param registration_interval_sec: how often pyctuator will renew its registration with spring-boot-admin
         :param free_disk_space_down_threshold_bytes: amount of free space in bytes in "./" (the application's current
          working directory) below which the built-in disk-space health-indicator will fail
+        :param logfile_queue_size: if set, log records are handed to a bounded queue of this size and formatted into the
+         logfile buffer by a background thread instead of by the thread that is logging, records that don't fit in the
+         queue are dropped and counted by the "logfile.dropped" metric
+        :param logfile_lazy_formatting: if True, only the attributes of log records are kept when they are logged, and
+         they are formatted into the logfile buffer when the logfile is requested
+        :param logfile_path: path of an existing log file, written by the application's own logging handlers, to be
+         served by the logfile endpoint instead of keeping log messages in memory
+        :param response_compression_min_size: if set, responses of at least this many bytes are compressed using gzip
+         (or brotli, if installed) when the client accepts it
+        :param response_compression_level: compression level, from 1 (fastest) to 9 (smallest responses)
+        :param flask_wsgi_tracing: if True, Flask requests are traced by a WSGI middleware wrapping the application,
+         which records every request including ones failing before reaching a view, such as 404s
+        :param httptrace_header_allowlist: if set, only the request and response headers named in this list
+         (case-insensitive) are kept in the HTTP traces
+        :param httptrace_sampler: if set, only requests sampled by it are recorded in the HTTP traces, see
+         `RateSampler`, `RateLimitingSampler` and `ErrorsAndSlowRequestsSampler`
+        :param httptrace_capacity: the number of most recent requests kept in the HTTP traces, each using less than 1KB
+         of memory
+        :param httptrace_slowest_capacity: the number of slowest requests of the last `httptrace_slowest_window_sec`
+         seconds kept in addition to the recent ones, shown by `/httptrace?view=slowest`, 0 to disable
+        :param httptrace_errors_capacity: the number of most recent requests failing with a server error (5xx) kept in
+         addition to the recent ones, shown by `/httptrace?view=errors`, 0 to disable
+        :param httptrace_file: if set, the HTTP traces are persisted to this memory-mapped file, which is created if
+         needed, and the traces it holds are loaded on startup, so traces recorded before a restart or a crash are kept
+        :param multiprocess_dir: if set, the application runs in several worker processes (e.g. gunicorn workers) which
+         share their HTTP traces and request metrics through files in this directory, so that whichever worker answers
+         `/httptrace` or `/metrics` reports those of all the workers. Pyctuator must then be created in each worker,
+         rather than before forking them. This overrides `httptrace_file`
+        :param httptrace_queue_size: if set, the requests to be traced are handed to a bounded queue of this size and
+         their trace records are built by a background thread, or by an event loop callback for asyncio frameworks,
+         instead of while handling the request, requests that
+         don't fit in the queue aren't traced and are counted by the "httptrace.dropped" metric
+        :param health_timeout_sec: health checks are run concurrently, and those that take longer than this are reported
+         as DOWN, unless another timeout is given when registering their provider
+        :param health_cache_ttl_sec: if set, each provider's health is cached for this long, unless another TTL is given
+         when registering the provider. Expired results are still reported while the provider is checked again in the
+         background, and the age of cached results is reported in their details
         """
         
         
         self.flask_auth_decorator = flask_auth_decorator
+        self.flask_wsgi_tracing = flask_wsgi_tracing
         self.auto_deregister = auto_deregister
         start_time = datetime.now(timezone.utc)
 
@@ -85,6 +146,20 @@ class Pyctuator:
             pyctuator_endpoint_url,
             logfile_max_size,
             logfile_formatter,
+            logfile_queue_size,
+            logfile_lazy_formatting,
+            logfile_path,
+            httptrace_header_allowlist,
+            httptrace_sampler,
+            httptrace_capacity,
+            httptrace_slowest_capacity,
+            httptrace_slowest_window_sec,
+            httptrace_errors_capacity,
+            httptrace_file,
+            multiprocess_dir,
+            httptrace_queue_size,
+            health_timeout_sec,
+            health_cache_ttl_sec,
         )
 
         # Register default health/metrics/environment providers
@@ -92,6 +167,18 @@ class Pyctuator:
         self.pyctuator_impl.register_health_providers(DiskSpaceHealthProvider(free_disk_space_down_threshold_bytes))
         self.pyctuator_impl.register_metrics_provider(MemoryMetricsProvider())
         self.pyctuator_impl.register_metrics_provider(ThreadMetricsProvider())
+        self.pyctuator_impl.register_metrics_provider(self.pyctuator_impl.http_requests_metrics)
+        log_handler = self.pyctuator_impl.logfile.log_handler
+        if isinstance(log_handler, QueuedLogMessageHandler):
+            self.pyctuator_impl.register_metrics_provider(LogfileMetricsProvider(log_handler))
+        record_queue = self.pyctuator_impl.http_tracer.record_queue
+        if record_queue:
+            self.pyctuator_impl.register_metrics_provider(HttpTraceMetricsProvider(record_queue))
+
+        if response_compression_min_size is not None:
+            response_compressor = ResponseCompressor(response_compression_min_size, response_compression_level)
+            self.pyctuator_impl.response_compressor = response_compressor
+            self.pyctuator_impl.register_metrics_provider(CompressionMetricsProvider(response_compressor))
 
         self.boot_admin_registration_handler: Optional[BootAdminRegistrationHandler] = None
 
@@ -101,7 +188,9 @@ class Pyctuator:
         if not root_logger.hasHandlers():
             logging.info("Logging not configured, using logging.basicConfig()")
 
-        root_logger.addHandler(self.pyctuator_impl.logfile.log_messages)
+        # Capture log messages in memory, unless the logfile is read from an existing file
+        if self.pyctuator_impl.logfile.log_handler:
+            root_logger.addHandler(self.pyctuator_impl.logfile.log_handler)
 
         # Find and initialize an integration layer between the web-framework adn pyctuator
         framework_integrations = {
@@ -143,11 +232,23 @@ class Pyctuator:
             self.boot_admin_registration_handler.stop()
         self.boot_admin_registration_handler = None
 
+        if self.pyctuator_impl.logfile.log_handler:
+            logging.getLogger().removeHandler(self.pyctuator_impl.logfile.log_handler)
+        self.pyctuator_impl.logfile.stop()
+        self.pyctuator_impl.http_tracer.close()
+        if self.pyctuator_impl.multiprocess_directory:
+            self.pyctuator_impl.multiprocess_directory.stop()
+
     def register_environment_provider(self, name: str, env_provider: Callable[[], Dict]) -> None:
         self.pyctuator_impl.register_environment_provider(CustomEnvironmentProvider(name, env_provider))
 
-    def register_health_provider(self, provider: HealthProvider) -> None:
-        self.pyctuator_impl.register_health_providers(provider)
+    def register_health_provider(
+            self,
+            provider: AnyHealthProvider,
+            timeout_sec: Optional[float] = None,
+            cache_ttl_sec: Optional[float] = None,
+    ) -> None:
+        self.pyctuator_impl.register_health_providers(provider, timeout_sec, cache_ttl_sec)
 
     def set_git_info(self, commit: str, time: datetime, branch: Optional[str] = None) -> None:
         self.pyctuator_impl.set_git_info(GitInfo(GitCommitInfo(time, commit), branch))
@@ -188,7 +289,7 @@ class Pyctuator:
         if isinstance(app, Flask):
           
             from pyctuator.impl.flask_pyctuator import FlaskPyctuator
-            FlaskPyctuator(app, pyctuator_impl, self.flask_auth_decorator)
+            FlaskPyctuator(app, pyctuator_impl, self.flask_auth_decorator, self.flask_wsgi_tracing)
             return True
         return False
 
@@ -3,7 +3,7 @@ import threading
 from threading import Thread
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 
 
 @dataclass
@@ -32,13 +32,15 @@ class ThreadDump:
 
 class ThreadDumpProvider:
 
-    # pylint: disable=protected-access
     def get_thread_dump(self) -> ThreadDump:
+        return ThreadDump(list(self.iter_thread_infos()))
+
+    # pylint: disable=protected-access
+    def iter_thread_infos(self) -> Iterator[ThreadInfo]:
+        """Yields the information of one thread at a time, so a dump can be streamed without building all of it."""
         frames: Dict[Any, Any] = sys._current_frames()
-        return ThreadDump([
-            self._extract_thread_info(frames, thread)
-            for thread in threading.enumerate()
-        ])
+        for thread in threading.enumerate():
+            yield self._extract_thread_info(frames, thread)
 
     def _extract_thread_info(self, frames: Dict[Any, Any], thread: Thread) -> ThreadInfo:
         return ThreadInfo(
@@ -3,6 +3,7 @@ import importlib.util
 import os
 
 import pytest
+from _pytest.monkeypatch import MonkeyPatch
 
 
 @pytest.fixture
@@ -11,12 +12,24 @@ def require_sql_alchemy() -> None:
         pytest.skip("sqlalchemy is missing, skipping")
 
 
+@pytest.fixture
+def require_sql_alchemy_asyncio() -> None:
+    if not importlib.util.find_spec("sqlalchemy") or not importlib.util.find_spec("sqlalchemy.ext.asyncio"):
+        pytest.skip("sqlalchemy.ext.asyncio is missing (requires SQLAlchemy 1.4 or later), skipping")
+
+
 @pytest.fixture
 def require_pymysql() -> None:
     if not importlib.util.find_spec("pymysql"):
         pytest.skip("PyMySQL is missing, skipping")
 
 
+@pytest.fixture
+def require_aiosqlite() -> None:
+    if not importlib.util.find_spec("aiosqlite"):
+        pytest.skip("aiosqlite is missing, skipping")
+
+
 @pytest.fixture
 def require_mysql_server() -> None:
     should_test_with_mysql = os.getenv("TEST_MYSQL_SERVER", None)
@@ -35,6 +48,31 @@ def test_sqlite_health() -> None:
     assert health_provider.get_health() == DbHealthStatus(Status.UP, DbHealthDetails("sqlite"))
 
 
+@pytest.mark.usefixtures("require_sql_alchemy", "require_sql_alchemy_asyncio", "require_aiosqlite")
+def test_async_sqlite_health() -> None:
+    import asyncio
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from pyctuator.health.async_db_health_provider import AsyncDbHealthProvider
+    from pyctuator.health.db_health_provider import DbHealthDetails, DbHealthStatus
+    from pyctuator.health.health_provider import Status
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    health_provider = AsyncDbHealthProvider(engine)
+    assert asyncio.run(health_provider.get_health()) == DbHealthStatus(Status.UP, DbHealthDetails("sqlite"))
+
+
+@pytest.mark.usefixtures("require_sql_alchemy")
+def test_async_db_health_unsupported_without_asyncio(monkeypatch: MonkeyPatch) -> None:
+    from pyctuator.health.async_db_health_provider import AsyncDbHealthProvider
+
+    # Such as with SQLAlchemy 1.3, which has no asyncio support
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(
+        importlib.util, "find_spec", lambda name: None if name == "sqlalchemy.ext.asyncio" else find_spec(name)
+    )
+    assert not AsyncDbHealthProvider(None).is_supported()  # type: ignore
+
+
 @pytest.mark.usefixtures("require_sql_alchemy", "require_pymysql", "require_mysql_server")
 def test_mysql_health() -> None:
     from sqlalchemy import create_engine
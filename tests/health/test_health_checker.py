@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from pyctuator.health.health_checker import HealthChecker, HealthTimeoutDetails, CachedHealthDetails
+from pyctuator.health.diskspace_health_impl import DiskSpaceHealthDetails
+from pyctuator.health.health_provider import HealthStatus, Status, HealthDetails, HealthProvider, AsyncHealthProvider, \
+    AnyHealthProvider
+from pyctuator.impl.json_serializer import dumps
+
+
+class SlowHealthProvider(HealthProvider):
+    def __init__(self, name: str, delay_sec: float) -> None:
+        self.name = name
+        self.delay_sec = delay_sec
+        self.checks = 0
+
+    def is_supported(self) -> bool:
+        return True
+
+    def get_health(self) -> HealthStatus:
+        self.checks += 1
+        time.sleep(self.delay_sec)
+        return HealthStatus(Status.UP, HealthDetails())
+
+    def get_name(self) -> str:
+        return self.name
+
+
+def test_checks_run_concurrently() -> None:
+    health_checker = HealthChecker()
+    start = time.monotonic()
+    health_statuses = health_checker.check([SlowHealthProvider(name, 0.2) for name in ["db", "redis", "disk"]])
+    assert time.monotonic() - start < 0.5
+    assert {name: health.status for name, health in health_statuses.items()} == {
+        "db": Status.UP, "redis": Status.UP, "disk": Status.UP,
+    }
+
+
+def test_timed_out_checks_are_down() -> None:
+    health_checker = HealthChecker(timeout_sec=0.1)
+    hung = threading.Event()
+
+    class HungHealthProvider(SlowHealthProvider):
+        def get_health(self) -> HealthStatus:
+            self.checks += 1
+            hung.wait()
+            return HealthStatus(Status.UP, HealthDetails())
+
+    hung_provider = HungHealthProvider("db", 0)
+    slow_provider = SlowHealthProvider("redis", 0.2)
+    health_checker.set_timeout(slow_provider, 1)
+
+    start = time.monotonic()
+    health_statuses = health_checker.check([hung_provider, slow_provider])
+    assert time.monotonic() - start < 0.5
+    assert health_statuses["db"] == HealthStatus(Status.DOWN, HealthTimeoutDetails(0.1))
+    assert health_statuses["redis"].status == Status.UP
+
+    # The hung check isn't started again until it completes
+    assert health_checker.check([hung_provider])["db"].status == Status.DOWN
+    assert hung_provider.checks == 1
+    hung.set()
+    time.sleep(0.05)
+    assert health_checker.check([hung_provider])["db"].status == Status.UP
+    assert hung_provider.checks == 2
+
+
+def test_cached_results_are_refreshed_in_background() -> None:
+    health_checker = HealthChecker(cache_ttl_sec=0.2)
+    provider = SlowHealthProvider("db", 0.05)
+    assert health_checker.check([provider])["db"] == HealthStatus(Status.UP, HealthDetails())
+
+    cached = health_checker.check([provider])["db"]
+    assert isinstance(cached.details, CachedHealthDetails) and cached.details.cacheAgeSec < 0.2
+    assert provider.checks == 1
+
+    # The expired result is reported without waiting for the provider, which is checked again in the background
+    time.sleep(0.2)
+    start = time.monotonic()
+    stale = health_checker.check([provider])["db"]
+    assert time.monotonic() - start < 0.05
+    assert isinstance(stale.details, CachedHealthDetails) and stale.details.cacheAgeSec >= 0.2
+    time.sleep(0.1)
+    assert provider.checks == 2
+    refreshed = health_checker.check([provider])["db"]
+    assert isinstance(refreshed.details, CachedHealthDetails) and refreshed.details.cacheAgeSec < 0.2
+
+
+def test_cached_results_kept_by_provider_name() -> None:
+    health_checker = HealthChecker(cache_ttl_sec=60)
+    assert health_checker.check([SlowHealthProvider("db", 0)])["db"] == HealthStatus(Status.UP, HealthDetails())
+
+    # The id of the garbage collected provider may be reused by another one, which isn't served the cached result
+    redis_provider = SlowHealthProvider("redis", 0)
+    assert health_checker.check([redis_provider])["redis"] == HealthStatus(Status.UP, HealthDetails())
+    assert redis_provider.checks == 1
+
+    # While a provider replacing one of the same name is
+    db_provider = SlowHealthProvider("db", 0)
+    assert isinstance(health_checker.check([db_provider])["db"].details, CachedHealthDetails)
+    assert db_provider.checks == 0
+
+
+def test_cached_details_serialization() -> None:
+    health_status = HealthStatus(Status.UP, CachedHealthDetails(DiskSpaceHealthDetails(100, 50, 10), 1.5))
+    assert json.loads(dumps(health_status)) == {
+        "status": "UP", "details": {"total": 100, "free": 50, "threshold": 10, "cacheAgeSec": 1.5},
+    }
+
+
+class AsyncSlowHealthProvider(AsyncHealthProvider):
+    def __init__(self, name: str, delay_sec: float) -> None:
+        self.name = name
+        self.delay_sec = delay_sec
+
+    def is_supported(self) -> bool:
+        return True
+
+    async def get_health(self) -> HealthStatus:
+        await asyncio.sleep(self.delay_sec)
+        return HealthStatus(Status.UP, HealthDetails())
+
+    def get_name(self) -> str:
+        return self.name
+
+
+def test_async_checks_do_not_block_event_loop() -> None:
+    health_checker = HealthChecker(timeout_sec=0.3)
+    providers: List[AnyHealthProvider] = [
+        AsyncSlowHealthProvider("redis", 0.2),
+        SlowHealthProvider("db", 0.2),
+        AsyncSlowHealthProvider("hung", 10),
+    ]
+
+    async def check() -> Tuple[Dict[str, HealthStatus], int]:
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        health_statuses = await health_checker.check_async(providers)
+        ticker.cancel()
+        return health_statuses, ticks
+
+    start = time.monotonic()
+    health_statuses, ticks = asyncio.run(check())
+    assert time.monotonic() - start < 0.5
+    assert ticks > 10
+    assert {name: health.status for name, health in health_statuses.items()} == {
+        "redis": Status.UP, "db": Status.UP, "hung": Status.DOWN,
+    }
+
+
+def test_async_provider_checked_without_event_loop() -> None:
+    health_checker = HealthChecker()
+    assert health_checker.check([AsyncSlowHealthProvider("redis", 0.01)])["redis"].status == Status.UP
@@ -12,6 +12,12 @@ def require_redis() -> None:
         pytest.skip("redis is missing, skipping")
 
 
+@pytest.fixture
+def require_redis_asyncio() -> None:
+    if not importlib.util.find_spec("redis") or not importlib.util.find_spec("redis.asyncio"):
+        pytest.skip("redis.asyncio is missing (requires redis 4.2 or later), skipping")
+
+
 @pytest.mark.usefixtures("require_redis")
 @pytest.fixture
 def require_redis_server() -> None:
@@ -42,3 +48,15 @@ def test_redis_bad_password(redis_host: str) -> None:
     health = RedisHealthProvider(redis.Redis(host=redis_host, password="blabla")).get_health()
     assert health.status == Status.DOWN
     assert "Client sent AUTH, but no password is set" in str(health.details.failure)
+
+
+@pytest.mark.usefixtures("require_redis", "require_redis_asyncio", "require_redis_server")
+def test_async_redis_health(redis_host: str) -> None:
+    import asyncio
+    from redis.asyncio import Redis
+    from pyctuator.health.async_redis_health_provider import AsyncRedisHealthProvider
+    from pyctuator.health.health_provider import Status
+    from pyctuator.health.redis_health_provider import RedisHealthStatus, RedisHealthDetails
+
+    health = asyncio.run(AsyncRedisHealthProvider(Redis(host=redis_host)).get_health())
+    assert health == RedisHealthStatus(Status.UP, RedisHealthDetails("5.0.3", "standalone"))
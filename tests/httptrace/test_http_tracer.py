@@ -0,0 +1,169 @@
+import json
+from datetime import datetime
+from typing import List
+from unittest.mock import patch
+
+import pytest
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
+from pyctuator.httptrace.http_tracer import HttpTracer, TraceQuery, TraceQueryError
+from pyctuator.httptrace.trace_sampler import RateSampler
+from pyctuator.impl.json_serializer import dumps
+
+
+def test_capture_headers() -> None:
+    http_tracer = HttpTracer()
+    headers = http_tracer.capture_headers([(b"accept", b"text/plain"), (b"cookie", b"a=1"), (b"cookie", b"b=2")])
+    assert dict(headers) == {"accept": ["text/plain"], "cookie": ["a=1", "b=2"]}
+    assert len(headers) == 2
+
+    headers = http_tracer.capture_headers(iter([("Content-Type", "application/json")]))
+    assert headers["Content-Type"] == ["application/json"]
+
+
+def test_capture_headers_allowlist() -> None:
+    http_tracer = HttpTracer(header_allowlist=["Content-Type", "user-agent"])
+    assert dict(http_tracer.capture_headers([
+        ("content-type", "text/plain"), ("Authorization", "Basic secret"), ("User-Agent", "pytest"),
+    ])) == {"content-type": ["text/plain"], "User-Agent": ["pytest"]}
+    assert dict(http_tracer.capture_headers([(b"authorization", b"secret"), (b"user-agent", b"pytest")])) == {
+        "user-agent": ["pytest"],
+    }
+
+
+def test_serialize_captured_headers() -> None:
+    http_tracer = HttpTracer()
+    http_tracer.add_record(TraceRecord(
+        datetime.now(),
+        None,
+        None,
+        TraceRequest("GET", "http://localhost/api", http_tracer.capture_headers([(b"accept", b"*/*")])),
+        TraceResponse(200, http_tracer.capture_headers([("Content-Length", "0")])),
+        1,
+    ))
+
+    trace = json.loads(dumps(http_tracer.get_httptrace()))["traces"][0]
+    assert trace["request"]["headers"] == {"accept": ["*/*"]}
+    assert trace["response"]["headers"] == {"Content-Length": ["0"]}
+
+
+def test_capacity() -> None:
+    http_tracer = HttpTracer(capacity=2)
+    for i in range(3):
+        http_tracer.add_record(TraceRecord(
+            datetime.now(),
+            None,
+            None,
+            TraceRequest("GET", f"http://localhost/api/{i}", http_tracer.capture_headers([])),
+            TraceResponse(200, http_tracer.capture_headers([])),
+            1,
+        ))
+    uris = [trace.request.uri for trace in http_tracer.iter_traces()]
+    assert uris == ["http://localhost/api/1", "http://localhost/api/2"]
+
+
+def test_trace_records_are_slotted() -> None:
+    http_tracer = HttpTracer()
+    record = TraceRecord(
+        datetime.now(),
+        None,
+        None,
+        TraceRequest("GET", "http://localhost/api", http_tracer.capture_headers([(b"host", b"localhost")])),
+        TraceResponse(200, http_tracer.capture_headers([("Content-Type", "text/plain; charset=utf-8")])),
+        1,
+    )
+    for obj in [record, record.request, record.response, record.request.headers]:
+        assert not hasattr(obj, "__dict__")
+    assert record.timeTakenMicros == 0
+    assert dict(record.response.headers) == {"Content-Type": ["text/plain; charset=utf-8"]}
+
+
+def create_record(http_tracer: HttpTracer, uri: str, status: int, duration_us: int) -> TraceRecord:
+    return TraceRecord(
+        datetime.now(),
+        None,
+        None,
+        TraceRequest("GET", uri, http_tracer.capture_headers([])),
+        TraceResponse(status, http_tracer.capture_headers([])),
+        duration_us // 1000,
+        duration_us,
+    )
+
+
+def test_slowest_view() -> None:
+    http_tracer = HttpTracer(sampler=RateSampler(0), capacity=2, slowest_capacity=2, slowest_window_sec=60)
+    with patch("pyctuator.httptrace.http_tracer.time.monotonic", return_value=1000):
+        for uri, duration_us in [("/a", 8_000_000), ("/b", 1000), ("/c", 2_000_000), ("/d", 3000), ("/e", 2000)]:
+            assert http_tracer.should_record(200, duration_us) == (uri in ["/a", "/b", "/c"])
+            http_tracer.add_record(create_record(http_tracer, uri, 200, duration_us))
+
+        assert [trace.request.uri for trace in http_tracer.iter_traces("slowest")] == ["/a", "/c"]
+        assert [trace.request.uri for trace in http_tracer.iter_traces()] == ["/d", "/e"]
+
+    # Once the slowest requests are out of the window, they are replaced by more recent ones
+    with patch("pyctuator.httptrace.http_tracer.time.monotonic", return_value=1061):
+        assert http_tracer.should_record(200, 1000)
+        http_tracer.add_record(create_record(http_tracer, "/f", 200, 1000))
+        assert [trace.request.uri for trace in http_tracer.iter_traces("slowest")] == ["/f"]
+
+
+def test_errors_view() -> None:
+    http_tracer = HttpTracer(sampler=RateSampler(0), capacity=2, slowest_capacity=0, errors_capacity=2)
+    assert not http_tracer.should_record(200, 1000)
+    for uri, status in [("/a", 500), ("/b", 404), ("/c", 502), ("/d", 200), ("/e", 503)]:
+        http_tracer.add_record(create_record(http_tracer, uri, status, 1000))
+    assert http_tracer.should_record(500, 1000)
+    assert [trace.request.uri for trace in http_tracer.iter_traces("errors")] == ["/c", "/e"]
+
+    with pytest.raises(TraceQueryError):
+        http_tracer.iter_traces("fastest")
+
+
+def test_query_traces() -> None:
+    http_tracer = HttpTracer(capacity=3)
+    for uri, status, duration_us in [
+        ("http://localhost/api/orders", 200, 5000), ("http://localhost/api/orders/1", 404, 1000),
+        ("http://localhost/health", 200, 100), ("http://localhost/api/items", 503, 20_000),
+    ]:
+        http_tracer.add_record(create_record(http_tracer, uri, status, duration_us))
+
+    def query(**kwargs: str) -> List[str]:
+        cursor, traces = http_tracer.query_traces(kwargs.pop("view", None), TraceQuery.from_params(kwargs))
+        assert cursor == 4
+        return [trace.request.uri.replace("http://localhost", "") for trace in traces]
+
+    assert query() == ["/api/orders/1", "/health", "/api/items"]
+    assert query(minStatus="400", maxStatus="499") == ["/api/orders/1"]
+    assert query(pathPrefix="/api", minDuration="2") == ["/api/items"]
+    assert query(method="post") == []
+    assert query(since="2") == ["/health", "/api/items"]
+    assert query(since="4") == []
+    assert query(since="0", view="slowest") == ["/api/items", "/api/orders", "/api/orders/1", "/health"]
+    assert query(since="1", view="slowest", minStatus="400") == ["/api/items", "/api/orders/1"]
+
+    for params in [{"since": "latest"}, {"minStatus": "abc"}, {"maxStatus": "4.5"}, {"minDuration": "nan"}]:
+        with pytest.raises(TraceQueryError):
+            TraceQuery.from_params(params)
+
+
+def test_query_traces_indexes() -> None:
+    http_tracer = HttpTracer(capacity=5)
+    for index in range(20):
+        record = create_record(http_tracer, f"http://localhost/{index}", [200, 404, 500][index % 3], 1000)
+        record.request.method = ["GET", "post"][index % 2]
+        http_tracer.add_record(record)
+
+    # Traces evicted from the ring are also removed from the indexes
+    assert sum(len(records) for records in http_tracer._status_index.values()) == 5  # pylint: disable=protected-access
+    assert sum(len(records) for records in http_tracer._method_index.values()) == 5  # pylint: disable=protected-access
+
+    def query(trace_query: TraceQuery) -> List[str]:
+        return [trace.request.uri.split("/")[-1] for trace in http_tracer.query_traces(None, trace_query)[1]]
+
+    assert query(TraceQuery()) == ["15", "16", "17", "18", "19"]
+    assert query(TraceQuery(method="POST")) == ["15", "17", "19"]
+    assert query(TraceQuery(min_status=400)) == ["16", "17", "19"]
+    assert query(TraceQuery(max_status=404, method="get")) == ["16", "18"]
+    assert query(TraceQuery(min_status=500, since=17)) == ["17"]
+    assert query(TraceQuery(min_status=500, since=18)) == []
+    assert query(TraceQuery(method="PUT")) == []
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from datetime import datetime
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
+from pyctuator.httptrace.http_tracer import HttpTracer
+
+
+def create_record(uri: str, building: threading.Event) -> TraceRecord:
+    building.wait()
+    return TraceRecord(datetime.now(), None, None, TraceRequest("GET", uri, {}), TraceResponse(200, {}), 1, 1000)
+
+
+def test_records_built_in_background() -> None:
+    http_tracer = HttpTracer(queue_size=10)
+    building = threading.Event()
+    http_tracer.submit(create_record, "http://localhost/1", building)
+    http_tracer.submit(create_record, "http://localhost/2", building)
+    assert not http_tracer.get_httptrace().traces
+
+    building.set()
+    http_tracer.close()
+    assert [trace.request.uri for trace in http_tracer.iter_traces()] == ["http://localhost/1", "http://localhost/2"]
+
+
+def test_full_queue_drops_records() -> None:
+    http_tracer = HttpTracer(queue_size=2)
+    assert http_tracer.record_queue is not None
+    building = threading.Event()
+    started = threading.Event()
+
+    def create_first_record() -> TraceRecord:
+        started.set()
+        return create_record("http://localhost/0", building)
+
+    http_tracer.submit(create_first_record)
+    started.wait()
+    # The background thread is blocked building the first record, while the next two fill the queue
+    for index in range(1, 5):
+        http_tracer.submit(create_record, f"http://localhost/{index}", building)
+    assert http_tracer.record_queue.dropped_records == 2
+    building.set()
+    http_tracer.close()
+    assert len(http_tracer.get_httptrace().traces) == 3
+
+
+def test_records_built_when_submitted_without_queue() -> None:
+    http_tracer = HttpTracer()
+    building = threading.Event()
+    building.set()
+    http_tracer.submit(create_record, "http://localhost/1", building)
+    assert [trace.request.uri for trace in http_tracer.iter_traces()] == ["http://localhost/1"]
+
+
+def test_records_built_by_event_loop_callback() -> None:
+    http_tracer = HttpTracer(queue_size=2)
+    assert http_tracer.record_queue is not None
+    building = threading.Event()
+    building.set()
+
+    async def submit_records() -> None:
+        for index in range(4):
+            http_tracer.submit_soon(create_record, f"http://localhost/{index}", building)
+        # The records are built once the loop runs its callbacks, the ones exceeding the queue's size are dropped
+        assert not http_tracer.get_httptrace().traces
+        await asyncio.sleep(0)
+
+    asyncio.run(submit_records())
+    assert [trace.request.uri for trace in http_tracer.iter_traces()] == ["http://localhost/0", "http://localhost/1"]
+    assert http_tracer.record_queue.dropped_records == 2
+    http_tracer.close()
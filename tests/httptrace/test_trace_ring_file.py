@@ -0,0 +1,65 @@
+import json
+from datetime import datetime
+from pathlib import Path
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
+from pyctuator.httptrace.http_tracer import HttpTracer
+from pyctuator.httptrace.trace_ring_file import TraceRingFile, FILE_HEADER
+from pyctuator.impl.json_serializer import dumps
+
+
+def add_records(http_tracer: HttpTracer, count: int, status: int = 200) -> None:
+    for _ in range(count):
+        http_tracer.add_record(TraceRecord(
+            datetime.now(),
+            None,
+            None,
+            TraceRequest(
+                "GET",
+                f"http://localhost/api/{http_tracer.sequence + 1}",
+                http_tracer.capture_headers([(b"accept", b"*/*"), (b"user-agent", "pytest-é".encode("latin-1"))]),
+            ),
+            TraceResponse(status, http_tracer.capture_headers([("Content-Type", "text/plain")])),
+            1,
+            1500,
+        ))
+
+
+def test_reload_traces(tmp_path: Path) -> None:
+    path = str(tmp_path / "traces")
+    http_tracer = HttpTracer(capacity=3, trace_file=TraceRingFile(path, 3))
+    add_records(http_tracer, 4)
+    add_records(http_tracer, 1, status=500)
+    expected = json.loads(dumps(http_tracer.get_httptrace()))
+    http_tracer.close()
+
+    http_tracer = HttpTracer(capacity=3, trace_file=TraceRingFile(path, 3))
+    assert json.loads(dumps(http_tracer.get_httptrace())) == expected
+    assert [trace.request.uri for trace in http_tracer.iter_traces("errors")] == ["http://localhost/api/5"]
+    assert [trace.timeTakenMicros for trace in http_tracer.iter_traces()] == [1500, 1500, 1500]
+
+    # Sequences continue from the reloaded traces
+    add_records(http_tracer, 1)
+    assert [trace.sequence for trace in http_tracer.iter_traces()] == [4, 5, 6]
+    http_tracer.close()
+
+
+def test_ignore_partially_written_slots(tmp_path: Path) -> None:
+    path = str(tmp_path / "traces")
+    http_tracer = HttpTracer(trace_file=TraceRingFile(path, 3, slot_size=256))
+    add_records(http_tracer, 2)
+    http_tracer.close()
+
+    # Corrupt the slot of the first record
+    with open(path, "r+b") as file:
+        file.seek(FILE_HEADER.size + 60)
+        file.write(b"garbage")
+
+    trace_file = TraceRingFile(path, 3, slot_size=256)
+    assert [record.sequence for record in trace_file.load()] == [2]
+    trace_file.close()
+
+    # Files written with a different layout are discarded
+    trace_file = TraceRingFile(path, 4, slot_size=256)
+    assert trace_file.load() == []
+    trace_file.close()
@@ -0,0 +1,32 @@
+from unittest.mock import patch
+
+from pyctuator.httptrace.http_tracer import HttpTracer
+from pyctuator.httptrace.trace_sampler import RateSampler, RateLimitingSampler, ErrorsAndSlowRequestsSampler
+
+
+def test_rate_sampler() -> None:
+    assert not RateSampler(0).should_sample(200, 1000)
+    assert RateSampler(1).should_sample(200, 1000)
+
+
+def test_rate_limiting_sampler() -> None:
+    sampler = RateLimitingSampler(2)
+    with patch("pyctuator.httptrace.trace_sampler.time.monotonic", return_value=10.5):
+        assert [sampler.should_sample(200, 1000) for _ in range(3)] == [True, True, False]
+    with patch("pyctuator.httptrace.trace_sampler.time.monotonic", return_value=11.1):
+        assert sampler.should_sample(200, 1000)
+
+
+def test_errors_and_slow_requests_sampler() -> None:
+    sampler = ErrorsAndSlowRequestsSampler(slow_threshold_ms=100)
+    assert sampler.should_sample(500, 1000)
+    assert sampler.should_sample(200, 100_000)
+    assert not sampler.should_sample(404, 99_999)
+
+    sampler = ErrorsAndSlowRequestsSampler(slow_threshold_ms=100, delegate=RateSampler(1))
+    assert sampler.should_sample(200, 1000)
+
+
+def test_http_tracer_should_record() -> None:
+    assert HttpTracer().should_record(200, 1000)
+    assert not HttpTracer(sampler=RateSampler(0), slowest_capacity=0).should_record(200, 1000)
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Optional
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from pyctuator.httptrace.http_tracer import TraceQuery
+from pyctuator.pyctuator import Pyctuator
+
+
+def test_failing_requests_recorded() -> None:
+    app = web.Application()
+
+    async def fail(request: web.Request) -> web.Response:
+        raise ValueError("Failing on purpose")
+
+    async def forbidden(request: web.Request) -> web.Response:
+        raise web.HTTPForbidden()
+
+    app.router.add_get("/fail", fail)
+    app.router.add_get("/forbidden", forbidden)
+
+    pyctuator = Pyctuator(
+        app,
+        "aiohttp Tracing",
+        "http://localhost:8080",
+        "http://localhost:8080/pyctuator",
+        None,
+    )
+
+    async def send_requests() -> None:
+        async with TestClient(TestServer(app)) as client:
+            assert (await client.get("/fail")).status == 500
+            assert (await client.get("/forbidden")).status == 403
+            assert (await client.get("/missing")).status == 404
+
+    asyncio.run(send_requests())
+
+    _, traces = pyctuator.pyctuator_impl.http_tracer.query_traces(None, TraceQuery())
+    assert [(trace.request.uri.split("/")[-1], trace.response.status) for trace in traces] == [
+        ("fail", 500), ("forbidden", 403), ("missing", 404),
+    ]
+    _, traces = pyctuator.pyctuator_impl.http_tracer.query_traces("errors", TraceQuery())
+    assert [trace.request.uri.split("/")[-1] for trace in traces] == ["fail"]
+
+    metric = pyctuator.pyctuator_impl.get_metric_measurement("http.server.requests", ["uri:/fail", "status:500"])
+    assert metric.measurements[0].value == 1
+    pyctuator.stop()
+
+
+@pytest.mark.parametrize("queue_size", [None, 10])
+def test_headers_recorded_before_sending_response(queue_size: Optional[int]) -> None:
+    app = web.Application()
+
+    async def get_with_header(request: web.Request) -> web.Response:
+        return web.Response(text="ok", headers={"X-A": "a"})
+
+    app.router.add_get("/header", get_with_header)
+
+    pyctuator = Pyctuator(
+        app,
+        "aiohttp Tracing",
+        "http://localhost:8080",
+        "http://localhost:8080/pyctuator",
+        None,
+        httptrace_queue_size=queue_size,
+    )
+
+    async def send_request() -> None:
+        async with TestClient(TestServer(app)) as client:
+            assert (await client.get("/header")).status == 200
+
+    asyncio.run(send_request())
+    pyctuator.stop()
+
+    # The headers added by aiohttp when sending the response are recorded neither with nor without a queue
+    traces = list(pyctuator.pyctuator_impl.http_tracer.iter_traces())
+    assert sorted(traces[0].response.headers) == ["Content-Type", "X-A"]
@@ -0,0 +1,32 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyctuator.httptrace.http_tracer import TraceQuery
+from pyctuator.pyctuator import Pyctuator
+
+
+def test_failing_requests_recorded_as_errors() -> None:
+    app = FastAPI()
+
+    @app.get("/fail")
+    # pylint: disable=unused-variable
+    def fail() -> str:
+        raise ValueError("Failing on purpose")
+
+    pyctuator = Pyctuator(
+        app,
+        "FastAPI Tracing",
+        "http://localhost:8000",
+        "http://localhost:8000/pyctuator",
+        None,
+    )
+
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/fail").status_code == 500
+
+    _, traces = pyctuator.pyctuator_impl.http_tracer.query_traces("errors", TraceQuery())
+    assert [(trace.request.uri, trace.response.status) for trace in traces] == [("http://testserver/fail", 500)]
+
+    metric = pyctuator.pyctuator_impl.get_metric_measurement("http.server.requests", ["uri:/fail", "status:500"])
+    assert metric.measurements[0].value == 1
+    pyctuator.stop()
@@ -0,0 +1,46 @@
+from flask import Flask
+
+from pyctuator.impl import SBA_V2_CONTENT_TYPE
+from pyctuator.pyctuator import Pyctuator
+
+
+def test_wsgi_tracing_records_every_request() -> None:
+    app = Flask("Flask WSGI Tracing")
+    app.testing = True  # Unhandled exceptions are propagated through the middleware
+
+    @app.route("/hello")
+    # pylint: disable=unused-variable
+    def hello() -> str:
+        return "hello"
+
+    @app.route("/fail")
+    # pylint: disable=unused-variable
+    def fail() -> str:
+        raise ValueError("Failing on purpose")
+
+    pyctuator = Pyctuator(
+        app,
+        "Flask WSGI Tracing",
+        "http://localhost:5000",
+        "http://localhost:5000/pyctuator",
+        None,
+        flask_wsgi_tracing=True,
+    )
+
+    client = app.test_client()
+    assert client.get("/hello").status_code == 200
+    assert client.get("/missing").status_code == 404
+    try:
+        client.get("/fail")
+    except ValueError:
+        pass
+    assert client.get("/pyctuator/env").headers["Content-Type"] == SBA_V2_CONTENT_TYPE
+
+    traces = pyctuator.pyctuator_impl.http_tracer.get_httptrace().traces
+    assert [(trace.request.uri, trace.response.status) for trace in traces] == [
+        ("http://localhost/hello", 200),
+        ("http://localhost/missing", 404),
+        ("http://localhost/fail", 500),
+        ("http://localhost/pyctuator/env", 200),
+    ]
+    pyctuator.stop()
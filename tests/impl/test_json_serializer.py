@@ -0,0 +1,85 @@
+import dataclasses
+import json
+from datetime import datetime
+from typing import Any, Callable
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+
+from pyctuator.health.health_provider import HealthDetails, HealthStatus, HealthSummary, Status
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse, Traces
+from pyctuator.impl import json_serializer
+from pyctuator.impl.pyctuator_router import EndpointsData, EndpointsLinks, LinkHref
+from pyctuator.threads.thread_dump_provider import ThreadDump, ThreadDumpProvider
+
+
+@dataclasses.dataclass
+class CustomHealthDetails(HealthDetails):
+    connections: int
+    checked_at: datetime
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "json"])
+def dumps(request: Any, monkeypatch: MonkeyPatch) -> Callable[[Any], bytes]:
+    if request.param and not json_serializer.orjson:
+        pytest.skip("orjson is not installed")
+    if not request.param:
+        monkeypatch.setattr(json_serializer, "orjson", None)
+    return json_serializer.dumps
+
+
+def test_dumps_traces(dumps: Callable[[Any], bytes]) -> None:
+    timestamp = datetime(2020, 5, 1, 12, 30, 15, 123456)
+    traces = Traces([TraceRecord(
+        timestamp,
+        None,
+        None,
+        TraceRequest("GET", "http://localhost/api", {"accept": ["*/*"]}),
+        TraceResponse(200, {"content-type": ["application/json"]}),
+        12,
+    )])
+
+    assert json.loads(dumps(traces)) == {"traces": [{
+        "timestamp": "2020-05-01T12:30:15.123456",
+        "principal": None,
+        "session": None,
+        "request": {"method": "GET", "uri": "http://localhost/api", "headers": {"accept": ["*/*"]}},
+        "response": {"status": 200, "headers": {"content-type": ["application/json"]}},
+        "timeTaken": 12,
+    }]}
+
+
+def test_dumps_health_details_subclass(dumps: Callable[[Any], bytes]) -> None:
+    health = HealthSummary(Status.UP, {
+        "db": HealthStatus(Status.UP, CustomHealthDetails(3, datetime(2020, 5, 1))),
+        "redis": HealthStatus(Status.DOWN, HealthDetails()),
+    })
+
+    assert json.loads(dumps(health)) == {"status": "UP", "details": {
+        "db": {"status": "UP", "details": {"connections": 3, "checked_at": "2020-05-01T00:00:00"}},
+        "redis": {"status": "DOWN", "details": {}},
+    }}
+
+
+def test_dumps_matches_asdict(dumps: Callable[[Any], bytes]) -> None:
+    thread_dump = ThreadDumpProvider().get_thread_dump()
+    assert json.loads(dumps(thread_dump)) == dataclasses.asdict(thread_dump)
+
+
+def test_dumps_stream(dumps: Callable[[Any], bytes], monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(json_serializer, "stream_chunk_size", 1024)
+    thread_infos = ThreadDumpProvider().get_thread_dump().threads * 20
+
+    chunks = list(json_serializer.dumps_stream("threads", iter(thread_infos)))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 1024 + len(dumps(thread_infos[0])) for chunk in chunks)
+    assert json.loads(b"".join(chunks)) == json.loads(dumps(ThreadDump(thread_infos)))
+
+
+def test_dumps_stream_empty(dumps: Callable[[Any], bytes]) -> None:
+    assert json.loads(b"".join(json_serializer.dumps_stream("traces", []))) == {"traces": []}
+
+
+def test_dumps_underscore_fields(dumps: Callable[[Any], bytes]) -> None:
+    endpoints = EndpointsData(EndpointsLinks(*[LinkHref(f"http://localhost/pyctuator/{i}", False) for i in range(9)]))
+    assert json.loads(dumps(endpoints))["_links"]["env"] == {"href": "http://localhost/pyctuator/0", "templated": False}
@@ -0,0 +1,96 @@
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from pyctuator.httptrace import TraceRecord, TraceRequest, TraceResponse
+from pyctuator.httptrace.http_tracer import HttpTracer
+from pyctuator.httptrace.trace_ring_file import TraceRingFile
+from pyctuator.impl.multiprocess import MultiprocessDirectory, DEAD_WORKER_FILES_RETENTION_SEC
+from pyctuator.metrics.http_requests_metrics_impl import HttpRequestsMetricsProvider
+
+# Not a running process, pids are below 2^22 on Linux
+DEAD_PID = 999_999_999
+
+
+def worker_tracer(directory: MultiprocessDirectory) -> HttpTracer:
+    return HttpTracer(
+        capacity=3,
+        trace_file=TraceRingFile(directory.trace_file_path, 3),
+        peer_records=directory.peer_trace_records,
+    )
+
+
+def add_record(http_tracer: HttpTracer, path: str, status: int = 200, duration_us: int = 1000) -> None:
+    http_tracer.add_record(TraceRecord(
+        datetime.now(),
+        None,
+        None,
+        TraceRequest("GET", f"http://localhost{path}", {}),
+        TraceResponse(status, {}),
+        duration_us // 1000,
+        duration_us,
+    ))
+
+
+def get_measurements(metrics: HttpRequestsMetricsProvider, name: str) -> dict:
+    return {measurement.statistic: measurement.value for measurement in metrics.get_metric(name).measurements}
+
+
+def test_traces_of_all_workers(tmp_path: Path) -> None:
+    peer_directory = MultiprocessDirectory(str(tmp_path))
+    peer_directory.pid = DEAD_PID
+    peer_tracer = worker_tracer(peer_directory)
+    directory = MultiprocessDirectory(str(tmp_path))
+    http_tracer = worker_tracer(directory)
+
+    add_record(peer_tracer, "/peer/1", duration_us=9000)
+    add_record(http_tracer, "/worker/1", status=500)
+    add_record(peer_tracer, "/peer/2", status=503)
+    add_record(http_tracer, "/worker/2")
+    peer_tracer.close()
+
+    assert [trace.request.uri for trace in http_tracer.iter_traces()] == [
+        "http://localhost/worker/1", "http://localhost/peer/2", "http://localhost/worker/2",
+    ]
+    assert [trace.request.uri for trace in http_tracer.iter_traces("errors")] == [
+        "http://localhost/worker/1", "http://localhost/peer/2",
+    ]
+    assert next(http_tracer.iter_traces("slowest")).request.uri == "http://localhost/peer/1"
+    http_tracer.close()
+
+
+def test_metrics_of_all_workers(tmp_path: Path) -> None:
+    peer_directory = MultiprocessDirectory(str(tmp_path))
+    peer_directory.pid = DEAD_PID
+    peer_metrics = HttpRequestsMetricsProvider()
+    directory = MultiprocessDirectory(str(tmp_path))
+    metrics = HttpRequestsMetricsProvider(peer_snapshots=directory.peer_metrics)
+
+    peer_metrics.record("GET", "/api", 200, 8000)
+    peer_metrics.record("GET", "/api", 200, 8000)
+    metrics.record("GET", "/api", 200, 1000)
+    peer_directory.publish_metrics(peer_metrics.export())
+
+    assert get_measurements(metrics, "http.server.requests") == {"COUNT": 3, "TOTAL_TIME": 0.017, "MAX": 0.008}
+    assert get_measurements(metrics, "http.server.requests.percentile")["VALUE"] == 0.008
+
+    # The requests of a snapshot published before the window are still counted, but not in the window's statistics
+    snapshot = peer_metrics.export()
+    snapshot["time"] -= metrics.window_sec
+    peer_directory.publish_metrics(snapshot)
+    assert get_measurements(metrics, "http.server.requests") == {"COUNT": 3, "TOTAL_TIME": 0.017, "MAX": 0.001}
+
+
+def test_remove_dead_worker_files(tmp_path: Path) -> None:
+    dead_worker_file = tmp_path / f"metrics-{DEAD_PID}.json"
+    recently_dead_worker_file = tmp_path / f"httptrace-{DEAD_PID - 1}.ring"
+    running_worker_file = tmp_path / f"metrics-{os.getpid()}.json"
+    for path in [dead_worker_file, recently_dead_worker_file, running_worker_file]:
+        path.write_text("{}")
+    expired = time.time() - DEAD_WORKER_FILES_RETENTION_SEC - 1
+    os.utime(dead_worker_file, (expired, expired))
+    os.utime(running_worker_file, (expired, expired))
+
+    MultiprocessDirectory(str(tmp_path))
+    assert sorted(tmp_path.iterdir()) == sorted([recently_dead_worker_file, running_worker_file])
@@ -0,0 +1,92 @@
+import gzip
+import logging
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from flask import Flask
+
+from pyctuator.impl.response_compression import ResponseCompressor
+from pyctuator.pyctuator import Pyctuator
+
+
+def test_small_body_not_compressed() -> None:
+    compressor = ResponseCompressor(min_size=100, level=6)
+    assert compressor.compress(b"a" * 99, "gzip") is None
+    assert compressor.compressed_responses == 0
+
+
+def test_gzip_compression() -> None:
+    compressor = ResponseCompressor(min_size=100, level=6)
+    body = b"a" * 1000
+
+    compressed = compressor.compress(body, "deflate, gzip;q=0.8")
+    assert compressed is not None
+    encoding, compressed_body = compressed
+    assert encoding == "gzip"
+    assert gzip.decompress(compressed_body) == body
+
+    assert compressor.compressed_responses == 1
+    assert compressor.original_bytes == 1000
+    assert compressor.compressed_bytes == len(compressed_body)
+
+
+def test_unaccepted_encodings_not_used() -> None:
+    compressor = ResponseCompressor(min_size=0, level=6)
+    compressor.brotli = None
+    assert compressor.compress(b"a" * 1000, None) is None
+    assert compressor.compress(b"a" * 1000, "identity") is None
+    assert compressor.compress(b"a" * 1000, "gzip;q=0") is None
+    assert compressor.compress(b"a" * 1000, "br") is None
+
+    compressed = compressor.compress(b"a" * 1000, "*")
+    assert compressed is not None
+    assert compressed[0] == "gzip"
+
+
+def test_chunks_compression() -> None:
+    compressor = ResponseCompressor(min_size=100, level=6)
+    compressor.brotli = None
+    chunks = [b"a" * 10, b"b" * 1000, b"c" * 10]
+
+    compressed = compressor.compress_chunks(iter(chunks), "gzip")
+    assert compressed is not None
+    encoding, compressed_chunks = compressed
+    assert encoding == "gzip"
+    compressed_body = b"".join(compressed_chunks)
+    assert gzip.decompress(compressed_body) == b"".join(chunks)
+
+    assert compressor.compressed_responses == 1
+    assert compressor.original_bytes == 1020
+    assert compressor.compressed_bytes == len(compressed_body)
+
+    assert compressor.compress_chunks(iter(chunks), "identity") is None
+
+
+@pytest.mark.parametrize("framework", ["FastAPI", "Flask"])
+def test_partial_responses_not_compressed(framework: str) -> None:
+    if framework == "FastAPI":
+        app: Any = FastAPI()
+        client: Any = TestClient(app)
+    else:
+        app = Flask("Partial Responses")
+        client = app.test_client()
+    Pyctuator(
+        app,
+        "Partial Responses",
+        "http://localhost:8000",
+        "http://localhost:8000/pyctuator",
+        None,
+        response_compression_min_size=0,
+    )
+    logging.getLogger("test_partial_responses").error("These pretzels are making me thirsty " * 10)
+
+    response = client.get("/pyctuator/logfile", headers={"Range": "bytes=0-99", "Accept-Encoding": "gzip"})
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert "Content-Range" in response.headers
+    assert "Content-Encoding" not in response.headers
+
+    response = client.get("/pyctuator/env", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
@@ -0,0 +1,57 @@
+import asyncio
+
+from _pytest.monkeypatch import MonkeyPatch
+from tornado.httputil import HTTPServerRequest
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application, RequestHandler
+
+from pyctuator.pyctuator import Pyctuator
+
+
+class SleepHandler(RequestHandler):
+    async def get(self) -> None:
+        await asyncio.sleep(0.05)
+        self.write("slept")
+
+
+class ItemHandler(RequestHandler):
+    def get(self, item_id: str) -> None:
+        self.write(item_id)
+
+
+class TestTornadoTracing(AsyncHTTPTestCase):
+    def get_app(self) -> Application:
+        app = Application([(r"/sleep", SleepHandler), (r"/items/(?P<item_id>[0-9]+)", ItemHandler)])
+        self.pyctuator = Pyctuator(
+            app,
+            "Tornado Tracing",
+            "http://localhost:8000",
+            "http://localhost:8000/pyctuator",
+            None,
+        )
+        return app
+
+    def tearDown(self) -> None:
+        self.pyctuator.stop()
+        super().tearDown()
+
+    def test_durations_use_monotonic_clock(self) -> None:
+        # Durations aren't affected by changes of the wall-clock time, which Tornado uses for timing requests
+        with MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(HTTPServerRequest, "request_time", lambda request: 3600.0)
+            assert self.fetch("/sleep").code == 200
+
+        traces = self.pyctuator.pyctuator_impl.http_tracer.get_httptrace().traces
+        assert [trace.request.uri.split("/")[-1] for trace in traces] == ["sleep"]
+        assert 50_000 <= traces[0].timeTakenMicros < 3_600_000_000
+
+    def test_metrics_tagged_with_route_template(self) -> None:
+        assert self.fetch("/items/1").code == 200
+        assert self.fetch("/items/2").code == 200
+
+        metric = self.pyctuator.pyctuator_impl.get_metric_measurement("http.server.requests", ["uri:/items/{item_id}"])
+        assert metric.measurements[0].value == 2
+
+        assert self.fetch("/pyctuator/metrics/http.server.requests?tag=uri:/items/{item_id}").code == 200
+        assert self.fetch("/pyctuator/metrics/no.such.metric").code == 404
+        assert self.fetch("/pyctuator/metrics/http.server.requests?tag=method").code == 400
@@ -1,19 +1,33 @@
 # pylint: disable=protected-access
 import logging
+import re
+import sys
+from datetime import datetime
+from http import HTTPStatus
+from pathlib import Path
 
 import pytest
+from _pytest.monkeypatch import MonkeyPatch
 
-from pyctuator.logfile.logfile import PyctuatorLogfile  # type: ignore
+from pyctuator.logfile import logfile as logfile_module
+from pyctuator.logfile.logfile import LogMessageBuffer, PyctuatorLogfile, QueuedLogMessageHandler  # type: ignore
+from pyctuator.logfile.logfile import LogfileSearchError, logfile_search_max_pattern_length  # type: ignore
 from pyctuator.pyctuator import default_logfile_format
 
 test_buffer_size = 1000
 
 
+def log_messages(logfile: PyctuatorLogfile) -> LogMessageBuffer:
+    buffer = logfile.log_messages
+    assert buffer, "Only logfiles serving their own buffer have log messages"
+    return buffer
+
+
 @pytest.mark.mark_logfile_test_empty_response
 def test_empty_response() -> None:
     logfile = PyctuatorLogfile(test_buffer_size, default_logfile_format)
     log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
-    assert log == ""
+    assert log == b""
     assert start == 0
     assert end == 0
 
@@ -24,7 +38,7 @@ def test_buffer_not_full() -> None:
 
     msg_num = "0123456789" * 50
     record = logging.LogRecord("test record", logging.WARNING, "", 0, msg_num, (), None)
-    logfile.log_messages.emit(record)
+    log_messages(logfile).emit(record)
 
     log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
     assert start == 0
@@ -37,14 +51,14 @@ def test_buffer_overflow() -> None:
 
     msg_num = "0123456789" * 10
     record = logging.LogRecord("test record", logging.WARNING, "", 0, msg_num, (), None)
-    logfile.log_messages.emit(record)
+    log_messages(logfile).emit(record)
 
     msg_chr = "ABCDEFGHIJ" * 95
     record = logging.LogRecord("test record", logging.WARNING, "", 0, msg_chr, (), None)
-    logfile.log_messages.emit(record)
+    log_messages(logfile).emit(record)
 
     log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
-    assert log.count("0123456789") == 4  # Implicitly Added newlines "break" a single string appearance
+    assert log.count(b"0123456789") == 4  # Implicitly Added newlines "break" a single string appearance
     assert start == logfile.get_log_buffer_offset()
     assert end == start + len(log)
 
@@ -55,13 +69,307 @@ def test_forgotten_records() -> None:
 
     msg_chr = "ABCDEFGHIJ"
     record = logging.LogRecord("test record", logging.WARNING, "", 0, msg_chr, (), None)
-    logfile.log_messages.emit(record)
+    log_messages(logfile).emit(record)
 
     msg_num = "0123456789" * 100  # test_buffer_size
     record = logging.LogRecord("test record", logging.WARNING, "", 0, msg_num, (), None)
-    logfile.log_messages.emit(record)
+    log_messages(logfile).emit(record)
 
     log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
-    assert log.count("ABCDEFGHIJ") == 0
+    assert log.count(b"ABCDEFGHIJ") == 0
     assert start == logfile.get_log_buffer_offset()
     assert end == start + len(log)
+
+
+@pytest.mark.mark_logfile_ring_buffer_wrap_around
+def test_ring_buffer_wrap_around() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+
+    messages = [f"message number {i:04d}" for i in range(500)]
+    for message in messages:
+        record = logging.LogRecord("test record", logging.WARNING, "", 0, message, (), None)
+        log_messages(logfile).emit(record)
+
+    expected = "".join(message + "\n" for message in messages).encode()[-test_buffer_size:]
+    log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
+    assert log == expected
+    assert start == len(messages) * len(messages[0] + "\n") - test_buffer_size
+    assert end == start + test_buffer_size
+
+    # Asking for the data following the last returned offset, SBA style, returns only new messages
+    record = logging.LogRecord("test record", logging.WARNING, "", 0, "new message", (), None)
+    log_messages(logfile).emit(record)
+    log, start, end = logfile.get_logfile(f"bytes={end}-")
+    assert log == b"new message\n"
+    assert end == start + len(log)
+
+
+@pytest.mark.mark_logfile_non_ascii_byte_offsets
+def test_non_ascii_byte_offsets() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+
+    first_message = "Grüße aus Zürich ☕"
+    record = logging.LogRecord("test record", logging.WARNING, "", 0, first_message, (), None)
+    log_messages(logfile).emit(record)
+
+    log, start, end = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
+    assert log.decode("utf-8") == first_message + "\n"
+    assert start == 0
+    assert end == len((first_message + "\n").encode("utf-8"))
+
+    # Following requests start at the byte offset reported by the previous response
+    record = logging.LogRecord("test record", logging.WARNING, "", 0, "ÆØÅ", (), None)
+    log_messages(logfile).emit(record)
+    log, start, end = logfile.get_logfile(f"bytes={end}-")
+    assert log == "ÆØÅ\n".encode("utf-8")
+    assert end == start + len(log)
+
+
+@pytest.mark.mark_logfile_response
+def test_logfile_response() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    record = logging.LogRecord("test record", logging.WARNING, "", 0, "Ωmega", (), None)
+    log_messages(logfile).emit(record)
+
+    response = logfile.get_logfile_response(None)
+    assert response.status == HTTPStatus.OK
+    assert response.body == "Ωmega\n".encode("utf-8")
+
+    response = logfile.get_logfile_response("bytes=-307200")
+    assert response.status == HTTPStatus.PARTIAL_CONTENT
+    assert response.body == "Ωmega\n".encode("utf-8")
+    assert response.headers["Content-Range"] == "bytes 0-7/7"
+
+
+@pytest.mark.mark_logfile_queued
+def test_queued_log_messages() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s", queue_size=100)
+    assert isinstance(logfile.log_handler, QueuedLogMessageHandler)
+
+    for i in range(10):
+        logfile.log_handler.handle(logging.LogRecord("test record", logging.WARNING, "", 0, "message %d", (i,), None))
+
+    # Stopping the background thread processes all queued records, and stopping it again does nothing
+    logfile.stop()
+    logfile.stop()
+
+    log, _, _ = logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
+    assert log == b"".join(f"message {i}\n".encode() for i in range(10))
+
+
+@pytest.mark.mark_logfile_queued
+def test_queued_log_messages_dropped_when_full() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    log_handler = QueuedLogMessageHandler(log_messages(logfile), 2)  # Not started, so nothing is taken off the queue
+
+    for i in range(5):
+        log_handler.handle(logging.LogRecord("test record", logging.WARNING, "", 0, "message %d", (i,), None))
+
+    assert log_handler.dropped_records == 3
+
+
+@pytest.mark.mark_logfile_lazy_formatting
+def test_lazy_formatting() -> None:
+    eager_logfile = PyctuatorLogfile(test_buffer_size, default_logfile_format)
+    lazy_logfile = PyctuatorLogfile(test_buffer_size, default_logfile_format, lazy_formatting=True)
+
+    try:
+        raise ValueError("Bad value")
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    records = [
+        logging.LogRecord("test record", logging.WARNING, "", 0, "message %d of %s", (i, "test"), None)
+        for i in range(20)
+    ]
+    records.append(logging.LogRecord("test record", logging.ERROR, "", 0, "failed", (), exc_info))
+
+    for record in records:
+        log_messages(eager_logfile).handle(record)
+        log_messages(lazy_logfile).handle(record)
+
+    lazy_log, lazy_start, lazy_end = lazy_logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
+    eager_log, eager_start, eager_end = eager_logfile.get_logfile(f"bytes=-{2 * test_buffer_size}")
+    assert b"Bad value" in lazy_log
+    assert lazy_log == eager_log
+    assert (lazy_start, lazy_end) == (eager_start, eager_end)
+
+
+@pytest.mark.mark_logfile_lazy_formatting
+def test_lazy_formatting_burst() -> None:
+    eager_logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    lazy_logfile = PyctuatorLogfile(test_buffer_size, "%(message)s", lazy_formatting=True)
+
+    # A burst of more records than are kept pending, the oldest of which are formatted instead of being dropped
+    for i in range(100):
+        record = logging.LogRecord("test record", logging.WARNING, "", 0, "message %d", (i,), None)
+        log_messages(eager_logfile).handle(record)
+        log_messages(lazy_logfile).handle(record)
+
+    assert lazy_logfile.get_logfile("bytes=-100000") == eager_logfile.get_logfile("bytes=-100000")
+    assert lazy_logfile.get_logfile("bytes=0-") == eager_logfile.get_logfile("bytes=0-")
+
+
+@pytest.mark.mark_logfile_from_file
+def test_logfile_from_file(tmp_path: Path) -> None:
+    log_path = tmp_path / "app.log"
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s", path=str(log_path))
+    assert logfile.log_handler is None
+
+    # The log file doesn't exist yet
+    log, start, end = logfile.get_logfile("bytes=-307200")
+    assert (log, start, end) == (b"", 0, 0)
+
+    content = "".join(f"line {i} ✓\n" for i in range(1000)).encode("utf-8")
+    log_path.write_bytes(content)
+
+    # Logfile isn't limited by the in-memory buffer's size, and suffix ranges return the file's tail
+    log, start, end = logfile.get_logfile("bytes=-307200")
+    assert log == content
+    assert (start, end) == (0, len(content))
+
+    log, start, end = logfile.get_logfile("bytes=-100")
+    assert log == content[-100:]
+    assert (start, end) == (len(content) - 100, len(content))
+
+    with log_path.open("ab") as log_file:
+        log_file.write(b"appended\n")
+    log, start, end = logfile.get_logfile(f"bytes={end}-")
+    assert log == b"appended\n"
+    assert end == start + len(log)
+
+    # Without a range, the whole file is sent by the web-framework
+    response = logfile.get_logfile_response(None)
+    assert response.status == HTTPStatus.OK
+    assert response.file_path == str(log_path)
+
+    # Offsets beyond a rotated file's end are clipped to its size
+    log_path.write_bytes(b"rotated\n")
+    log, start, end = logfile.get_logfile(f"bytes={end}-")
+    assert (log, start, end) == (b"", 8, 8)
+
+
+@pytest.mark.mark_logfile_suffix_range
+def test_suffix_range() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    for i in range(10):
+        log_messages(logfile).emit(logging.LogRecord("test record", logging.WARNING, "", 0, f"line {i}", (), None))
+
+    log, start, end = logfile.get_logfile("bytes=-14")
+    assert log == b"line 8\nline 9\n"
+    assert (start, end) == (56, 70)
+
+
+@pytest.mark.mark_logfile_events
+def test_logfile_events() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    log_messages(logfile).emit(logging.LogRecord("test record", logging.WARNING, "", 0, "before connecting", (), None))
+
+    # New clients start at the current end of the log
+    events = logfile.get_logfile_events()
+    assert next(events).startswith(b"retry: ")
+    assert next(events) == b""
+
+    log_messages(logfile).emit(logging.LogRecord("test record", logging.WARNING, "", 0, "first\nsecond", (), None))
+    offset = logfile.get_log_buffer_offset() + len(b"before connecting\nfirst\nsecond\n")
+    assert next(events) == f"id: {offset}\ndata: first\ndata: second\n\n".encode()
+    assert next(events) == b""
+
+    # Reconnecting clients resume from the last event's ID
+    log_messages(logfile).emit(logging.LogRecord("test record", logging.WARNING, "", 0, "third", (), None))
+    events = logfile.get_logfile_events(str(offset))
+    next(events)
+    assert next(events) == f"id: {offset + len(b'third') + 1}\ndata: third\n\n".encode()
+
+
+@pytest.mark.mark_logfile_events
+def test_logfile_events_split_at_lines(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(logfile_module, "logfile_stream_max_event_size", 8)
+    log_path = tmp_path / "app.log"
+    log_path.write_bytes(b"")
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s", path=str(log_path))
+    events = logfile.get_logfile_events()
+    next(events)
+
+    # A line that is still being written is sent once it's complete
+    log_path.write_bytes(b"one\ntw")
+    assert next(events) == b"id: 4\ndata: one\n\n"
+    assert next(events) == b""
+    with log_path.open("ab") as log_file:
+        log_file.write(b"o\n")
+    assert next(events) == b"id: 8\ndata: two\n\n"
+
+    # A line longer than an event is split between characters
+    with log_path.open("ab") as log_file:
+        log_file.write("☕☕☕☕\n".encode("utf-8"))
+    assert next(events) == "id: 14\ndata: ☕☕\n\n".encode("utf-8")
+    assert next(events) == "id: 21\ndata: ☕☕\n\n".encode("utf-8")
+
+
+@pytest.mark.mark_logfile_search
+def test_logfile_search() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(levelname)s %(name)s %(message)s")
+
+    def log(logger: str, level: int, message: str, created: float) -> None:
+        record = logging.LogRecord(logger, level, "", 0, message, (), None)
+        record.created = created
+        log_messages(logfile).handle(record)
+
+    for i in range(50):
+        log("app.db", logging.INFO, f"query {i} done", 1000 + i)
+    log("app.web", logging.ERROR, "request failed with status 500", 1050)
+    log("app.db", logging.WARNING, "slow query 51", 1051)
+    log("app.dbx", logging.WARNING, "unrelated", 1052)
+
+    records = logfile.search_logfile({"level": "WARN"}).records
+    assert [record.message for record in records] == [
+        "ERROR app.web request failed with status 500",
+        "WARNING app.db slow query 51",
+        "WARNING app.dbx unrelated",
+    ]
+
+    records = logfile.search_logfile({"logger": "app.db", "level": "WARNING"}).records
+    assert [record.logger for record in records] == ["app.db"]
+
+    records = logfile.search_logfile({"regex": "status [45]\\d\\d"}).records
+    assert [record.level for record in records] == ["ERROR"]
+    text, start, _ = logfile.get_logfile("bytes=-100000")
+    assert records[0].offset == start + text.index(b"ERROR")
+
+    since = datetime.fromtimestamp(1045).isoformat()
+    until = datetime.fromtimestamp(1047).isoformat()
+    records = logfile.search_logfile({"since": since, "until": until, "text": "query"}).records
+    assert [record.message for record in records] == [f"INFO app.db query {i} done" for i in [45, 46, 47]]
+
+    # Older records that were pushed out of the buffer are not found, and the most recent matches are returned
+    records = logfile.search_logfile({"text": "done", "limit": "3"}).records
+    assert [record.message for record in records] == [f"INFO app.db query {i} done" for i in [47, 48, 49]]
+    assert not logfile.search_logfile({"text": "query 0 "}).records
+
+
+@pytest.mark.mark_logfile_search_errors
+def test_logfile_search_errors() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    for params in [
+            {"level": "LOUD"},
+            {"regex": "status ["},
+            {"regex": "a" * (logfile_search_max_pattern_length + 1)},
+            {"since": "yesterday"},
+            {"until": "x"},
+            {"limit": "-"},
+            {"limit": "0"},
+    ]:
+        with pytest.raises(LogfileSearchError):
+            logfile.search_logfile(params)
+
+
+@pytest.mark.mark_logfile_search_max_scanned
+def test_logfile_search_max_scanned() -> None:
+    logfile = PyctuatorLogfile(test_buffer_size, "%(message)s")
+    for i in range(10):
+        log_messages(logfile).handle(logging.LogRecord("test record", logging.INFO, "", 0, f"message {i}", (), None))
+
+    # Only the most recent records are scanned, so older matches aren't found
+    records = log_messages(logfile).search(pattern=re.compile("message [0-9]"), max_scanned=3)
+    assert [record.message for record in records] == ["message 7", "message 8", "message 9"]
+    assert not log_messages(logfile).search(pattern=re.compile("message 0"), max_scanned=3)
@@ -0,0 +1,39 @@
+from pyctuator.metrics.histogram import BUCKETS, LogLinearHistogram, TimeWindowHistogram, bucket_index, \
+    bucket_upper_bound
+
+
+def test_buckets() -> None:
+    previous_index = 0
+    for value in range(1, 100_000):
+        index = bucket_index(value)
+        assert index in (previous_index, previous_index + 1)
+        assert value <= bucket_upper_bound(index) <= value * 1.125
+        previous_index = index
+    assert bucket_index(2 ** 40) == BUCKETS - 1
+
+
+def test_percentiles() -> None:
+    histogram = LogLinearHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+    assert histogram.count == 1000
+    assert histogram.max == 1_000_000
+    for phi, expected in [(0.5, 500_000), (0.99, 990_000), (1, 1_000_000)]:
+        assert expected <= histogram.percentile(phi) <= expected * 1.125
+    assert LogLinearHistogram().percentile(0.99) == 0
+
+
+def test_time_window() -> None:
+    now = 1000.0
+    histogram = TimeWindowHistogram(window_sec=300, buffer_length=5, clock=lambda: now)
+    histogram.record(10)
+    now += 60
+    histogram.record(20)
+    assert histogram.snapshot().count == 2
+
+    now += 240
+    snapshot = histogram.snapshot()
+    assert (snapshot.count, snapshot.max) == (1, 20)
+
+    now += 3600
+    assert histogram.snapshot().count == 0
@@ -0,0 +1,57 @@
+import pytest
+
+from pyctuator.metrics.http_requests_metrics_impl import HttpRequestsMetricsProvider
+from pyctuator.metrics.metrics_provider import InvalidMetricTagError
+
+
+def test_http_server_requests() -> None:
+    provider = HttpRequestsMetricsProvider()
+    provider.record("GET", "/items/{item_id}", 200, 1000)
+    provider.record("GET", "/items/{item_id}", 200, 3000)
+    provider.record("POST", "/items", 500, 2000)
+    provider.record("GET", None, 404, 100)
+
+    metric = provider.get_metric("http.server.requests")
+    assert metric.baseUnit == "seconds"
+    assert {m.statistic: m.value for m in metric.measurements} == {"COUNT": 4, "TOTAL_TIME": 0.0061, "MAX": 0.003}
+    assert {tag.tag: tag.values for tag in metric.availableTags} == {
+        "method": ["GET", "POST"],
+        "outcome": ["CLIENT_ERROR", "SERVER_ERROR", "SUCCESS"],
+        "status": ["200", "404", "500"],
+        "uri": ["/items", "/items/{item_id}", "NOT_FOUND"],
+    }
+
+    metric = provider.get_tagged_metric("http.server.requests", {"method": "GET", "outcome": "SUCCESS"})
+    assert {m.statistic: m.value for m in metric.measurements} == {"COUNT": 2, "TOTAL_TIME": 0.004, "MAX": 0.003}
+    assert {tag.tag: tag.values for tag in metric.availableTags} == {"status": ["200"], "uri": ["/items/{item_id}"]}
+
+    with pytest.raises(KeyError):
+        provider.get_tagged_metric("http.server.requests", {"uri": "/orders"})
+    with pytest.raises(KeyError):
+        provider.get_tagged_metric("http.server.requests", {"exception": "None"})
+
+
+def test_http_server_requests_percentile() -> None:
+    provider = HttpRequestsMetricsProvider()
+    for duration_ms in range(1, 101):
+        provider.record("GET", "/orders", 200, duration_ms * 1000)
+
+    metric = provider.get_tagged_metric("http.server.requests.percentile", {"uri": "/orders", "phi": "0.5"})
+    assert 0.05 <= metric.measurements[0].value <= 0.05 * 1.125
+    metric = provider.get_metric("http.server.requests.percentile")
+    assert 0.099 <= metric.measurements[0].value <= 0.1
+    assert "phi" in [tag.tag for tag in metric.availableTags]
+
+    with pytest.raises(InvalidMetricTagError):
+        provider.get_tagged_metric("http.server.requests.percentile", {"phi": "abc"})
+    with pytest.raises(InvalidMetricTagError):
+        provider.get_tagged_metric("http.server.requests.percentile", {"phi": "1.5"})
+
+
+def test_max_series() -> None:
+    provider = HttpRequestsMetricsProvider(max_series=2)
+    for item_id in range(5):
+        provider.record("GET", f"/items/{item_id}", 200, 1000)
+    assert len(provider.series) == 3
+    metric = provider.get_tagged_metric("http.server.requests", {"uri": "UNKNOWN"})
+    assert metric.measurements[0].value == 3
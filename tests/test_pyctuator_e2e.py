@@ -177,6 +177,24 @@ def test_metrics_endpoint(endpoints: Endpoints) -> None:
     assert metric_json["measurements"][0]["value"] > 5
 
 
+@pytest.mark.usefixtures("boot_admin_server", "pyctuator_server")
+@pytest.mark.mark_metrics_endpoint_errors
+def test_metrics_endpoint_errors(endpoints: Endpoints) -> None:
+    requests.get(endpoints.root + "httptrace_test_url")
+
+    response = requests.get(f"{endpoints.metrics}/no.such.metric")
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    response = requests.get(f"{endpoints.metrics}/http.server.requests", params={"tag": "exception:None"})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+    response = requests.get(f"{endpoints.metrics}/http.server.requests", params={"tag": "method"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = requests.get(f"{endpoints.metrics}/http.server.requests.percentile", params={"tag": "phi:abc"})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
 @pytest.mark.usefixtures("boot_admin_server", "pyctuator_server")
 @pytest.mark.mark_recurring_registration
 def test_recurring_registration_and_deregistration(
@@ -296,7 +314,8 @@ def test_traces_endpoint(endpoints: Endpoints) -> None:
 
     # Assert header appears on httptrace url
     assert user_header == trace["response"]["headers"]["resp-data"][0]
-    assert int(response.headers.get("Content-Length", -1)) > 0
+    # The traces are streamed, so the response may be sent using chunked encoding rather than with a Content-Length
+    assert len(response.content) > 0
 
     # Assert timestamp is formatted in ISO format
     datetime.fromisoformat(trace["timestamp"])